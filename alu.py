@@ -0,0 +1,194 @@
+# alu.py
+#
+# Precomputed ALU tables for the SimpleCPUEmulator.
+# All operands are 8-bit, so every binary ALU operation fits into a table of 256 x 256
+# entries indexed by (op1 << 8) | op2. Each entry packs the 8-bit result together with
+# the resulting status byte:  entry = result | (flags << 8)
+# An ALU opcode thus becomes a single indexed lookup (see opcodes.py).
+
+from itertools import repeat
+from operator import add, and_, or_, xor
+
+# Bits of the status byte
+FLAG_S = 0x80   # sign
+FLAG_Z = 0x40   # zero
+FLAG_V = 0x04   # overflow
+FLAG_C = 0x01   # carry
+
+
+def pack(total, result, op1, op2):
+    """Pack result and status byte, following the rules of SimpleCPUEmulator.update_flags."""
+    flags = 0
+    if result == 0:
+        flags |= FLAG_Z
+    if result & 0x80:
+        flags |= FLAG_S
+    if total > 0xFF:
+        flags |= FLAG_C
+    # Overflow: both operands have the same sign, the result has a different one
+    if not (op1 ^ op2) & 0x80 and (result ^ op1) & 0x80:
+        flags |= FLAG_V
+    return result | (flags << 8)
+
+
+# How each operation computes (total, effective second operand) from its operands.
+# These are the formulas of the original opcode handlers; SUB/SUC/CMP/DCR add the
+# two's complement of the second operand.
+OPERATIONS = {
+    "ADD": lambda a, b: (a + b, b),
+    "ADC": lambda a, b: (a + b + 1, b),
+    "SUB": lambda a, b: (a + ((~b) & 0xFF) + 1, (~b) & 0xFF),
+    "SUC": lambda a, b: (a + ((~b) & 0xFF), (~b) & 0xFF),
+    "AND": lambda a, b: (a & b, b),
+    "OR":  lambda a, b: (a | b, b),
+    "XOR": lambda a, b: (a ^ b, b),
+}
+
+
+# Sign and zero bits for every 8-bit result
+_ZERO_SIGN = [(FLAG_Z if r == 0 else 0) | (FLAG_S if r & 0x80 else 0) for r in range(256)]
+# One shared int object per possible entry, so equal entries of all tables share memory
+_ENTRIES = list(range(0x10000))
+
+
+def _build_binary(combine, seconds, carry_in=0):
+    """
+    Build a 256 x 256 table with total = combine(op1 + carry_in, seconds[op2]).
+    This is pack() inlined into a comprehension to keep the import fast: C is bit 8 of the
+    total, V is bit 7 of ~(op1 ^ op2) & (result ^ op1) shifted down to bit 2.
+    """
+    table = []
+    for op1 in range(256):
+        table += [
+            _ENTRIES[(total & 0xFF)
+                     | (_ZERO_SIGN[total & 0xFF]
+                        | ((total >> 8) & FLAG_C)
+                        | ((~(op1 ^ effective) & (total ^ op1) & 0x80) >> 5)) << 8]
+            for total, effective in zip(map(combine, repeat(op1 + carry_in, 256), seconds), seconds)
+        ]
+    return table
+
+
+def _build_cma():
+    # CMA complements A; the original handler passes op2 = 0 and a negative total
+    return [pack(~op1, (~op1) & 0xFF, op1, 0x00) for op1 in range(256)]
+
+
+_PLAIN = list(range(256))
+_COMPLEMENTED = [(~op2) & 0xFF for op2 in range(256)]
+
+# The tables, built once at import
+ALU_ADD = _build_binary(add, _PLAIN)
+ALU_ADC = _build_binary(add, _PLAIN, carry_in=1)
+ALU_SUB = _build_binary(add, _COMPLEMENTED, carry_in=1)   # also CMP; DCR is SUB with op2 = 1
+ALU_SUC = _build_binary(add, _COMPLEMENTED)
+ALU_AND = _build_binary(and_, _PLAIN)                      # also TST
+ALU_OR = _build_binary(or_, _PLAIN)
+ALU_XOR = _build_binary(xor, _PLAIN)
+ALU_CMA = _build_cma()
+
+TABLES = {
+    "ADD": ALU_ADD,
+    "ADC": ALU_ADC,
+    "SUB": ALU_SUB,
+    "SUC": ALU_SUC,
+    "AND": ALU_AND,
+    "OR":  ALU_OR,
+    "XOR": ALU_XOR,
+}
+
+
+# The ALU opcodes as (opcode, destination register, operation, first operand, second operand).
+# Operands are a register name, "imm" for the immediate byte, or a constant.
+# A destination of None means the result is discarded (CMP, TST).
+ALU_OPCODES = [
+    (0x02, "A", "ADD", "A", "B"),
+    (0x03, "A", "ADD", "A", "C"),
+    (0x04, "A", "ADC", "A", "B"),
+    (0x05, "A", "SUB", "A", "B"),
+    (0x06, "A", "SUB", "A", "C"),
+    (0x07, "A", "SUC", "A", "B"),
+    (0x08, None, "SUB", "A", "B"),
+    (0x09, "A", "ADD", "A", 1),
+    (0x0A, "B", "ADD", "B", 1),
+    (0x0B, "C", "ADD", "C", 1),
+    (0x0C, "A", "SUB", "A", 1),
+    (0x0D, "B", "SUB", "B", 1),
+    (0x0E, "C", "SUB", "C", 1),
+    (0x0F, "A", "AND", "A", "B"),
+    (0x10, "A", "AND", "A", "C"),
+    (0x11, None, "AND", "A", "B"),
+    (0x12, "A", "OR", "A", "B"),
+    (0x13, "A", "OR", "A", "C"),
+    (0x14, "A", "XOR", "A", "B"),
+    (0x15, "A", "XOR", "A", "C"),
+    (0x17, "A", "AND", "A", "imm"),
+    (0x18, "A", "OR", "A", "imm"),
+    (0x19, "A", "XOR", "A", "imm"),
+]
+
+
+def _reference_handler(dest, operation_name, first, second):
+    operation = OPERATIONS[operation_name]
+    def handler(self, operand):
+        op1 = getattr(self, "register_" + first)
+        if second == "imm":
+            op2 = operand
+        elif isinstance(second, str):
+            op2 = getattr(self, "register_" + second)
+        else:
+            op2 = second
+        total, effective = operation(op1, op2)
+        result = total & 0xFF
+        if dest is not None:
+            setattr(self, "register_" + dest, result)
+        self.update_flags(total, result, op1, effective)
+    return handler
+
+
+def _reference_CMA(self, operand):
+    op1 = self.register_A
+    total = ~op1
+    result = total & 0xFF
+    self.register_A = result
+    self.update_flags(total, result, op1, 0x00)
+
+
+def reference_handlers():
+    """
+    ALU opcode handlers computing their flags with SimpleCPUEmulator.update_flags, as the
+    handlers did before the tables existed. Maps opcode -> handler.
+    """
+    handlers = {code: _reference_handler(dest, operation, first, second)
+                for code, dest, operation, first, second in ALU_OPCODES}
+    handlers[0x16] = _reference_CMA
+    return handlers
+
+
+def verify_tables():
+    """
+    Run every ALU opcode handler over the full operand space and compare registers and
+    flags with the reference handlers based on SimpleCPUEmulator.update_flags.
+    Returns a list of mismatches (empty if everything agrees).
+    """
+    from simple_cpu_emulator import SimpleCPUEmulator
+
+    reference = SimpleCPUEmulator(silent=True)
+    emulator = SimpleCPUEmulator(silent=True)
+    mismatches = []
+
+    def run(target, handler, registers, immediate):
+        target.register_A, target.register_B, target.register_C = registers
+        target.flags = 0
+        handler(target, immediate)
+        return (target.register_A, target.register_B, target.register_C, target.flags)
+
+    for code, handler in reference_handlers().items():
+        table_handler = SimpleCPUEmulator.dispatch_table[code]
+        for op1 in range(256):
+            for op2 in range(256):
+                # (A, B), (A, C) and (A, immediate) each run through all 256 x 256 pairs
+                registers = (op1, op2, op2 ^ 0xFF)
+                if run(emulator, table_handler, registers, op2) != run(reference, handler, registers, op2):
+                    mismatches.append((code, registers))
+    return mismatches
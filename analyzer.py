@@ -0,0 +1,373 @@
+# analyzer.py
+#
+# Static analysis of assembled programs for the SimpleCPUEmulator.
+# analyze() follows the control flow of a memory image from its entry points (recursive
+# descent: only code that can be reached is decoded), splits it into basic blocks and
+# builds the control-flow graph. The analysis reports
+#   - loops (natural loops of the back edges of a depth-first search),
+#   - unreachable bytes (never decoded as an instruction; this includes data),
+#   - nested CALLs: CALL stores its return address at 0xFF, so a CALL inside a routine
+#     overwrites the return address of the outer call,
+#   - stores with a fixed target into reachable code or into the return address cell 0xFF,
+#   - invalid opcodes and control flow running off the end of memory.
+# The graph can be exported as DOT or JSON, and its block leaders can be handed to the
+# block compiler (run_compiled(leaders=...)) so its blocks start where the graph's do.
+#
+# "Usage: python analyzer.py <asm_file.asm> [--dot graph.dot] [--json graph.json]"
+
+import argparse
+import json
+from collections import namedtuple
+
+from simple_cpu_emulator import SimpleCPUEmulator
+
+JMP, JS, JZ, JC, JV, CALL, RET, HLT = 0x2B, 0x2C, 0x2D, 0x2E, 0x2F, 0x30, 0x31, 0x3F
+CONDITIONAL_BRANCHES = frozenset({JS, JZ, JC, JV})
+# Opcodes ending a basic block of the graph. Conditional branches end one here, while the
+# block compiler's blocks only end at JMP, CALL, RET and HLT and leave at taken branches.
+BLOCK_END_OPCODES = frozenset({JMP, CALL, RET, HLT}) | CONDITIONAL_BRANCHES
+
+# The memory cell CALL stores the return address in
+RETURN_ADDRESS_CELL = 0xFF
+
+# One decoded instruction; operand is None for one-byte instructions
+Instruction = namedtuple("Instruction", ["address", "opcode", "operand", "length"])
+
+# A basic block: instructions from start up to (excluding) end
+BasicBlock = namedtuple("BasicBlock", ["start", "end", "instructions"])
+
+# An edge of the graph. kind: "fallthrough", "jump", "branch" (taken conditional branch),
+# "call" (to the routine) or "return" (from a CALL to the instruction after it)
+Edge = namedtuple("Edge", ["source", "target", "kind"])
+
+# A natural loop: header block, the block with the back edge and all blocks of the loop
+Loop = namedtuple("Loop", ["header", "latch", "blocks"])
+
+# A problem found in the program. kind: "nested_call", "store_into_code",
+# "store_into_return_address", "call_overwrites_code", "invalid_opcode", "falls_off_memory"
+Finding = namedtuple("Finding", ["kind", "address", "message"])
+
+
+def disassemble(instruction):
+    """An instruction as text, e.g. "LDA 0x14"."""
+    name = SimpleCPUEmulator.opcode_names.get(instruction.opcode, f"DB 0x{instruction.opcode:02X}")
+    if instruction.operand is None:
+        return name
+    return name.replace("Address", f"0x{instruction.operand:02X}").replace("Byte", f"0x{instruction.operand:02X}")
+
+
+class Analysis:
+    """
+    The control-flow graph of a program and the findings about it (see analyze()).
+    blocks:  start address -> BasicBlock, edges: [Edge], loops: [Loop], findings: [Finding],
+    unreachable: [(start, end)] byte ranges no reachable instruction covers,
+    routines: entry addresses of called routines.
+    """
+
+    def __init__(self, blocks, edges, entry_points, routines, memory_size):
+        self.blocks = blocks
+        self.edges = edges
+        self.entry_points = entry_points
+        self.routines = routines
+        self.memory_size = memory_size
+        self.loops = []
+        self.findings = []
+        self.unreachable = []
+        self.successors = {start: [] for start in blocks}
+        self.predecessors = {start: [] for start in blocks}
+        for edge in edges:
+            self.successors[edge.source].append(edge)
+            self.predecessors[edge.target].append(edge)
+
+    def leaders(self):
+        """The set of block start addresses, e.g. for BlockCompiler(emulator, leaders=...)."""
+        return set(self.blocks)
+
+    def block_of(self, address):
+        """The block containing the instruction at address (None if it is not reachable code)."""
+        for block in self.blocks.values():
+            if block.start <= address < block.end:
+                return block
+        return None
+
+    def to_dict(self, symbols=None):
+        """The graph and the findings as a JSON-serializable dict."""
+        names = _names_by_address(symbols)
+        return {
+            "entry_points": [f"{address:02X}" for address in self.entry_points],
+            "routines": [f"{address:02X}" for address in self.routines],
+            "blocks": [{
+                "start": f"{block.start:02X}",
+                "end": f"{block.end:02X}",
+                "labels": names.get(block.start, []),
+                "instructions": [f"{instruction.address:02X}: {disassemble(instruction)}"
+                                 for instruction in block.instructions],
+            } for block in self.blocks.values()],
+            "edges": [{"source": f"{edge.source:02X}", "target": f"{edge.target:02X}", "kind": edge.kind}
+                      for edge in self.edges],
+            "loops": [{"header": f"{loop.header:02X}", "latch": f"{loop.latch:02X}",
+                       "blocks": [f"{start:02X}" for start in loop.blocks]} for loop in self.loops],
+            "unreachable": [[f"{start:02X}", f"{end:02X}"] for start, end in self.unreachable],
+            "findings": [finding._asdict() for finding in self.findings],
+        }
+
+    def dump(self, path, symbols=None):
+        """Write the graph as JSON to path."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(symbols), f, indent=2)
+
+    def to_dot(self, symbols=None):
+        """The graph in Graphviz DOT format; calls and returns are drawn dashed."""
+        names = _names_by_address(symbols)
+        styles = {"fallthrough": "", "jump": "", "branch": ' [label="taken"]',
+                  "call": ' [style=dashed, label="call"]', "return": ' [style=dotted, label="return"]'}
+        lines = ["digraph cfg {", '  node [shape=box, fontname="monospace"];']
+        for block in self.blocks.values():
+            text = [name + ":" for name in names.get(block.start, [])]
+            text += [f"{instruction.address:02X}: {disassemble(instruction)}" for instruction in block.instructions]
+            label = "\\l".join(line.replace('"', '\\"') for line in text) + "\\l"
+            lines.append(f'  b{block.start:02X} [label="{label}"];')
+        for edge in self.edges:
+            lines.append(f"  b{edge.source:02X} -> b{edge.target:02X}{styles[edge.kind]};")
+        lines.append("}")
+        return "\n".join(lines)
+
+    def report(self, symbols=None):
+        """A textual summary: blocks, loops, unreachable ranges and findings."""
+        names = _names_by_address(symbols)
+
+        def where(address):
+            label = names.get(address)
+            return f"{address:02X} ({', '.join(label)})" if label else f"{address:02X}"
+
+        lines = [f"Basic blocks: {len(self.blocks)}   edges: {len(self.edges)}   "
+                 f"routines: {', '.join(where(address) for address in self.routines) or '-'}"]
+        for loop in self.loops:
+            lines.append(f"Loop at {where(loop.header)}: {len(loop.blocks)} blocks, back edge from {loop.latch:02X}")
+        for start, end in self.unreachable:
+            lines.append(f"Unreachable: {start:02X}-{end - 1:02X}")
+        for finding in self.findings:
+            lines.append(f"{finding.kind} at {where(finding.address)}: {finding.message}")
+        return "\n".join(lines)
+
+
+def _names_by_address(symbols):
+    names = {}
+    for name, address in (symbols or {}).items():
+        names.setdefault(address, []).append(name)
+    return names
+
+
+def _decode(memory, address):
+    """The Instruction at address, or None if its opcode is invalid or it runs off memory."""
+    opcode = memory[address]
+    if opcode not in SimpleCPUEmulator.opcode_names:
+        return None
+    length = SimpleCPUEmulator.opcode_lengths[opcode]
+    if address + length > len(memory):
+        return None
+    operand = memory[address + 1] if length == 2 else None
+    return Instruction(address, opcode, operand, length)
+
+
+def analyze(image, entry_points=(0,), source_map=None, memory_size=256):
+    """
+    Analyze a memory image (bytes or list of byte values, loaded at address 0).
+    entry_points: addresses where execution may start
+    source_map:   optional SimpleAssembler.source_map; unreachable ranges are then only
+                  reported for bytes the assembler emitted (otherwise for all non-zero bytes)
+    """
+    memory = bytes(image) + bytes(max(memory_size - len(image), 0))
+    instructions = {}       # address -> Instruction of all reachable instructions
+    leaders = set(entry_points)
+    routines = set()
+    findings = []
+
+    # Recursive descent: decode everything reachable from the entry points
+    pending = list(entry_points)
+    while pending:
+        address = pending.pop()
+        while address not in instructions:
+            if not 0 <= address < len(memory):
+                break
+            instruction = _decode(memory, address)
+            if instruction is None:
+                kind = "invalid_opcode" if memory[address] not in SimpleCPUEmulator.opcode_names else "falls_off_memory"
+                findings.append(Finding(kind, address, f"cannot decode byte {memory[address]:02X}"))
+                break
+            instructions[address] = instruction
+            opcode = instruction.opcode
+            following = address + instruction.length
+            if opcode in BLOCK_END_OPCODES and following < len(memory):
+                leaders.add(following)
+            if opcode == JMP or opcode in CONDITIONAL_BRANCHES or opcode == CALL:
+                leaders.add(instruction.operand)
+                pending.append(instruction.operand)
+                if opcode == CALL:
+                    routines.add(instruction.operand)
+            if opcode in (JMP, RET, HLT):
+                break
+            if following >= len(memory):
+                findings.append(Finding("falls_off_memory", address, "execution continues past the end of memory"))
+                break
+            address = following     # fall through (CALL: the routine returns here)
+    leaders &= set(instructions)
+
+    # Basic blocks and edges
+    blocks = {}
+    edges = []
+    for start in sorted(leaders):
+        block = []
+        address = start
+        while address in instructions and (address == start or address not in leaders):
+            instruction = instructions[address]
+            block.append(instruction)
+            address += instruction.length
+            if instruction.opcode in BLOCK_END_OPCODES:
+                break
+        blocks[start] = BasicBlock(start, address, block)
+        last = block[-1]
+        if last.opcode in (JMP, CALL) or last.opcode in CONDITIONAL_BRANCHES:
+            if last.operand in instructions:        # else the target could not be decoded
+                kind = "jump" if last.opcode == JMP else "call" if last.opcode == CALL else "branch"
+                edges.append(Edge(start, last.operand, kind))
+        if last.opcode in CONDITIONAL_BRANCHES or last.opcode not in BLOCK_END_OPCODES:
+            if address in instructions:
+                edges.append(Edge(start, address, "fallthrough"))
+        elif last.opcode == CALL and address in instructions:
+            edges.append(Edge(start, address, "return"))
+
+    routines &= set(instructions)
+    analysis = Analysis(blocks, edges, tuple(entry_points), sorted(routines), len(memory))
+    analysis.loops = _find_loops(analysis)
+    analysis.unreachable = _unreachable_ranges(memory, instructions, source_map, len(image))
+    findings += _nested_calls(analysis)
+    findings += _dangerous_stores(memory, instructions)
+    analysis.findings = sorted(set(findings), key=lambda finding: (finding.address, finding.kind))
+    return analysis
+
+
+def _find_loops(analysis):
+    """Natural loops of the back edges found by a depth-first search from the entry points."""
+    successors = analysis.successors
+    back_edges = []
+    state = {}      # block -> 1 while on the DFS stack, 2 when finished
+    for entry in analysis.entry_points:
+        if entry not in analysis.blocks or entry in state:
+            continue
+        state[entry] = 1
+        stack = [(entry, iter(successors[entry]))]
+        while stack:
+            block, edges = stack[-1]
+            for edge in edges:
+                target = edge.target
+                if state.get(target) == 1:
+                    back_edges.append((block, target))
+                elif target not in state:
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+            else:
+                state[block] = 2
+                stack.pop()
+
+    loops = []
+    for latch, header in back_edges:
+        body = {header, latch}
+        pending = [latch]
+        while pending:
+            block = pending.pop()
+            if block == header:
+                continue
+            for edge in analysis.predecessors[block]:
+                if edge.source not in body:
+                    body.add(edge.source)
+                    pending.append(edge.source)
+        loops.append(Loop(header, latch, sorted(body)))
+    return loops
+
+
+def _unreachable_ranges(memory, instructions, source_map, image_size):
+    covered = bytearray(len(memory))
+    for address, instruction in instructions.items():
+        covered[address:address + instruction.length] = b"\x01" * instruction.length
+    ranges = []
+    start = None
+    for address in range(image_size):
+        emitted = source_map[address] if source_map is not None and address < len(source_map) else memory[address]
+        if emitted and not covered[address]:
+            if start is None:
+                start = address
+        elif start is not None:
+            ranges.append((start, address))
+            start = None
+    if start is not None:
+        ranges.append((start, image_size))
+    return ranges
+
+
+def _nested_calls(analysis):
+    """CALLs that can execute inside a called routine (before its RET) overwrite 0xFF."""
+    findings = []
+    for routine in analysis.routines:
+        seen = {routine}
+        pending = [routine]
+        while pending:
+            block = analysis.blocks[pending.pop()]
+            last = block.instructions[-1]
+            if last.opcode == CALL:
+                findings.append(Finding("nested_call", last.address,
+                                        f"CALL inside the routine at {routine:02X} overwrites its return address at 0xFF"))
+            if last.opcode == RET:
+                continue
+            for edge in analysis.successors[block.start]:
+                if edge.kind != "call" and edge.target not in seen:
+                    seen.add(edge.target)
+                    pending.append(edge.target)
+    return findings
+
+
+def _dangerous_stores(memory, instructions):
+    """Stores with a fixed target into reachable code or into the return address cell."""
+    findings = []
+    writes = SimpleCPUEmulator.opcode_writes
+    code = set()
+    for address, instruction in instructions.items():
+        code.update(range(address, address + instruction.length))
+    for address, instruction in instructions.items():
+        target = writes.get(instruction.opcode)
+        if target == "operand":
+            target = instruction.operand
+        elif not isinstance(target, int):
+            continue        # no store, or a target only known at run time (STA C)
+        if target in code:
+            kind = "call_overwrites_code" if instruction.opcode == CALL else "store_into_code"
+            findings.append(Finding(kind, address, f"stores into the code at {target:02X}"))
+        elif target == RETURN_ADDRESS_CELL and instruction.opcode != CALL:
+            findings.append(Finding("store_into_return_address", address,
+                                    "stores into 0xFF, where CALL keeps the return address"))
+    return findings
+
+
+def main():
+    from main import read_asm_file
+    from simple_assembler import SimpleAssembler
+
+    parser = argparse.ArgumentParser(description="Build the control-flow graph of an .asm program and check it.")
+    parser.add_argument("asm_file")
+    parser.add_argument("--dot", help="write the graph in DOT format to this file")
+    parser.add_argument("--json", help="write the graph and findings as JSON to this file")
+    args = parser.parse_args()
+
+    assembler = SimpleAssembler()
+    image = assembler.assemble_bytes(read_asm_file(args.asm_file))
+    analysis = analyze(image, source_map=assembler.source_map)
+    print(analysis.report(assembler.labels))
+    if args.dot:
+        with open(args.dot, "w") as f:
+            f.write(analysis.to_dot(assembler.labels) + "\n")
+    if args.json:
+        analysis.dump(args.json, assembler.labels)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# asm_cache.py
+#
+# Content-addressed on-disk cache for assembled programs.
+# The key is a SHA-256 hash of the normalized source (code and comments of every non-empty
+# line), of the OPCODES table of the assembler class and of its optimize setting, so editing
+# whitespace hits the cache while a changed instruction set does not. Each entry is a JSON
+# file holding the memory image, the source map, the emitted bytes, the listing and the
+# symbol table. Entries are written to a temporary file and renamed into place, so
+# concurrent workers never see partial files; an entry that cannot be read or lacks a field
+# counts as a miss and is rewritten. When the cache grows beyond max_bytes the least
+# recently used entries (by modification time, which a hit refreshes) are removed.
+
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+
+from peephole import PeepholeReport
+from simple_assembler import SimpleAssembler
+
+# Bump when the layout of the cache entries changes
+CACHE_FORMAT = 3
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def default_cache_dir():
+    """$SIMPLE_ASSEMBLER_CACHE or ~/.cache/simple_assembler."""
+    return (os.environ.get("SIMPLE_ASSEMBLER_CACHE")
+            or os.path.join(os.path.expanduser("~"), ".cache", "simple_assembler"))
+
+
+_OPCODES_VERSIONS = {}
+
+def opcodes_version(assembler_class):
+    """A hash identifying the OPCODES table of an assembler class."""
+    table = assembler_class.OPCODES
+    cached = _OPCODES_VERSIONS.get(assembler_class)
+    if cached is None or cached[0] is not table:
+        text = json.dumps(sorted(table.items()), separators=(",", ":"))
+        cached = (table, hashlib.sha256(text.encode()).hexdigest())
+        _OPCODES_VERSIONS[assembler_class] = cached
+    return cached[1]
+
+
+class AssemblyCache:
+    """
+    Assembles through an on-disk cache.
+    directory: where entries are stored (default: default_cache_dir())
+    max_bytes: size bound of the cache directory
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._estimated_bytes = None    # size of the cache as of the last check plus our writes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, source, assembler):
+        """The cache key of source assembled by assembler."""
+        optimize = int(getattr(assembler, "optimize", False))
+        digest = hashlib.sha256(f"{CACHE_FORMAT}:{opcodes_version(type(assembler))}:{optimize}\n".encode())
+        for _number, _raw, code, comment in assembler._normalize_source(source):
+            digest.update(f"{code};{comment}\n".encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def assemble_with_listing(self, source, assembler=None):
+        """
+        Like SimpleAssembler.assemble_with_listing, through the cache. On a hit the
+        assembler is left as if it had assembled source itself: its labels, source map,
+        listing(), write_object() and write_intel_hex() come from the cache entry.
+        """
+        assembler = assembler or SimpleAssembler()
+        key = self.key(source, assembler)
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            labels, emitted, listing = entry["labels"], entry["emitted"], entry["listing"]
+            source_map = array("I", entry["source_map"])
+            image = bytes.fromhex(entry["image"])
+            report = entry.get("peephole")
+            report = PeepholeReport(*report) if report is not None else None
+            os.utime(path)                  # mark as recently used
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            entry = None                    # missing, unreadable or incomplete: reassemble
+
+        if entry is not None:
+            self.hits += 1
+            assembler.labels = labels
+            assembler.source_map = source_map
+            assembler._emitted = emitted                    # [address, value, comment] lists
+            assembler._image = image
+            assembler.peephole_report = report
+            return assembler._as_machine_list(image), listing
+
+        self.misses += 1
+        machine, listing = assembler.assemble_with_listing(source)
+        self._store(path, {
+            "image": assembler._image.hex(),
+            "source_map": assembler.source_map.tolist(),
+            "emitted": assembler._emitted,
+            "listing": listing,
+            "labels": assembler.labels,
+            "peephole": getattr(assembler, "peephole_report", None),
+        })
+        return machine, listing
+
+    def assemble(self, source, assembler=None):
+        """Like SimpleAssembler.assemble, through the cache."""
+        machine, _listing = self.assemble_with_listing(source, assembler)
+        return machine
+
+    def _store(self, path, entry):
+        # Write to a temporary file in the same directory, then rename atomically
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f, separators=(",", ":"))
+                size = f.tell()
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+        # Listing the directory is only needed once our estimate exceeds the bound
+        if self._estimated_bytes is None or self._estimated_bytes + size > self.max_bytes:
+            self._evict()
+        else:
+            self._estimated_bytes += size
+
+    def _entries(self):
+        """[(mtime, size, path)] of all cache entries."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:     # removed by another worker
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits into max_bytes."""
+        entries = self._entries()
+        total = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._estimated_bytes = total
+
+    def clear(self):
+        """Remove all cache entries."""
+        for _mtime, _size, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Hit/miss statistics of this cache object and the current size of the cache."""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(entries),
+            "bytes": sum(size for _mtime, size, _path in entries),
+        }
@@ -0,0 +1,242 @@
+# batch_engine.py
+#
+# Runs thousands of instances of the simple CPU in lockstep with NumPy.
+# Memory is an (N, 256) uint8 array, registers, flags and IP are vectors of length N.
+# Each step fetches the opcode of every running instance and executes each opcode once as
+# a vector operation on the instances currently at that opcode, so instances whose
+# branches diverge keep running correctly.
+#
+# Requires NumPy (pip install numpy).
+
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:     # optional dependency, checked when a BatchEmulator is created
+    np = None
+
+from alu import ALU_CMA, ALU_OPCODES, FLAG_C, FLAG_S, FLAG_V, FLAG_Z, TABLES
+from simple_cpu_emulator import SimpleCPUEmulator
+
+MEMORY_SIZE = 256
+
+# Final state of one instance. error is None or the message SimpleCPUEmulator would raise.
+BatchResult = namedtuple("BatchResult", [
+    "ip", "register_A", "register_B", "register_C", "flags", "halted", "steps", "memory", "error",
+])
+
+# Error codes of the instances
+_OK, _INVALID_OPCODE, _MISSING_OPERAND = 0, 1, 2
+
+_REGISTERS = {"A": 0, "B": 1, "C": 2}
+_BRANCH_FLAGS = {0x2C: FLAG_S, 0x2D: FLAG_Z, 0x2E: FLAG_C, 0x2F: FLAG_V}
+
+
+_TABLE_CACHE = []
+
+def _numpy_tables():
+    """
+    Opcode lengths (0 = invalid opcode), the ALU tables and the flag mask of every
+    conditional branch (0 for other opcodes) as NumPy arrays, built once.
+    """
+    if not _TABLE_CACHE:
+        lengths = np.zeros(256, dtype=np.int64)
+        for code, length in SimpleCPUEmulator.opcode_lengths.items():
+            lengths[code] = length
+        tables = {name: np.array(table, dtype=np.uint16) for name, table in TABLES.items()}
+        branch_masks = np.zeros(256, dtype=np.uint8)
+        for code, mask in _BRANCH_FLAGS.items():
+            branch_masks[code] = mask
+        _TABLE_CACHE.extend([lengths, tables, np.array(ALU_CMA, dtype=np.uint16), branch_masks])
+    return _TABLE_CACHE
+
+
+class BatchEmulator:
+    """
+    N instances of the SimpleCPUEmulator executing the same instruction set in lockstep.
+    images: a list of memory images (sequences of at most 256 byte values), one per instance;
+    each image is loaded at address 0, the rest of memory is zero.
+    """
+
+    def __init__(self, images):
+        if np is None:
+            raise ImportError("BatchEmulator requires NumPy (pip install numpy)")
+        n = len(images)
+        self.memory = np.zeros((n, MEMORY_SIZE), dtype=np.uint8)
+        for row, image in enumerate(images):
+            if len(image) > MEMORY_SIZE:
+                raise ValueError(f"Image {row} (size {len(image)}) exceeds memory bounds.")
+            self.memory[row, :len(image)] = image
+        self.ip = np.zeros(n, dtype=np.int64)
+        self.registers = np.zeros((3, n), dtype=np.uint8)     # rows: A, B, C
+        self.flags = np.zeros(n, dtype=np.uint8)
+        self.halted = np.zeros(n, dtype=bool)
+        self.errors = np.zeros(n, dtype=np.int8)
+        self.steps = np.zeros(n, dtype=np.int64)
+
+        self._lengths, self._tables, self._cma, self._branch_masks = _numpy_tables()
+        self._handlers = self._build_handlers()
+
+    # Building the vector handlers. Each is called as handler(rows, operands, next_ip) for
+    # the rows (instance indices) executing that opcode; the IP is already set to next_ip.
+    def _build_handlers(self):
+        registers = self.registers
+        memory = self.memory
+        handlers = {}
+
+        def alu(dest, table, first, second):
+            def handler(rows, operands, next_ip):
+                if second == "imm":
+                    op2 = operands
+                elif isinstance(second, str):
+                    op2 = registers[_REGISTERS[second], rows]
+                else:
+                    op2 = second
+                packed = table[(registers[_REGISTERS[first], rows].astype(np.intp) << 8) | op2]
+                if dest is not None:
+                    registers[_REGISTERS[dest], rows] = packed & 0xFF
+                self.flags[rows] = packed >> 8
+            return handler
+
+        for code, dest, operation, first, second in ALU_OPCODES:
+            handlers[code] = alu(dest, self._tables[operation], first, second)
+
+        def cma(rows, operands, next_ip):
+            packed = self._cma[registers[0, rows]]
+            registers[0, rows] = packed & 0xFF
+            self.flags[rows] = packed >> 8
+        handlers[0x16] = cma
+
+        def mov(dest, source):
+            def handler(rows, operands, next_ip):
+                registers[dest, rows] = registers[source, rows]
+            return handler
+
+        def mvi(dest):
+            def handler(rows, operands, next_ip):
+                registers[dest, rows] = operands
+            return handler
+
+        def load(dest):
+            def handler(rows, operands, next_ip):
+                registers[dest, rows] = memory[rows, operands]
+            return handler
+
+        for code, (dest, source) in zip(range(0x1A, 0x20), ["AB", "AC", "BA", "BC", "CA", "CB"]):
+            handlers[code] = mov(_REGISTERS[dest], _REGISTERS[source])
+        for code, dest in zip(range(0x20, 0x23), (0, 1, 2)):
+            handlers[code] = mvi(dest)
+        for code, dest in zip(range(0x23, 0x26), (0, 1, 2)):
+            handlers[code] = load(dest)
+
+        def sta(rows, operands, next_ip):
+            memory[rows, operands] = registers[0, rows]
+        handlers[0x26] = sta
+
+        def lda_c(rows, operands, next_ip):
+            registers[0, rows] = memory[rows, registers[2, rows]]
+        handlers[0x29] = lda_c
+
+        def sta_c(rows, operands, next_ip):
+            memory[rows, registers[2, rows]] = registers[0, rows]
+        handlers[0x2A] = sta_c
+
+        def jmp(rows, operands, next_ip):
+            self.ip[rows] = operands
+        handlers[0x2B] = jmp
+
+        def branch(mask):
+            def handler(rows, operands, next_ip):
+                taken = (self.flags[rows] & mask) != 0
+                self.ip[rows[taken]] = operands[taken]
+            return handler
+
+        for code, mask in _BRANCH_FLAGS.items():
+            handlers[code] = branch(mask)
+
+        def call(rows, operands, next_ip):
+            memory[rows, 0xFF] = next_ip & 0xFF    # the return address
+            self.ip[rows] = operands
+        handlers[0x30] = call
+
+        def ret(rows, operands, next_ip):
+            self.ip[rows] = memory[rows, 0xFF]
+        handlers[0x31] = ret
+
+        def nop(rows, operands, next_ip):
+            pass
+        handlers[0x3E] = nop
+
+        def hlt(rows, operands, next_ip):
+            self.halted[rows] = True
+        handlers[0x3F] = hlt
+        return handlers
+
+    def running(self):
+        """Boolean vector of the instances that have not stopped."""
+        return (~self.halted) & (self.errors == _OK) & (self.ip >= 0) & (self.ip < MEMORY_SIZE)
+
+    def step(self, rows):
+        """Execute one instruction on each of the given instances."""
+        ip = self.ip[rows]
+        opcodes = self.memory[rows, ip]
+        lengths = self._lengths[opcodes]
+        operands = self.memory[rows, np.minimum(ip + 1, MEMORY_SIZE - 1)].astype(np.intp)
+
+        # Invalid opcodes and two-byte instructions at the last address stop their instance,
+        # except untaken conditional branches, which do not need their operand. As in the
+        # interpreter, only a failing conditional branch leaves the IP advanced by 2.
+        invalid = lengths == 0
+        missing = ip + lengths > MEMORY_SIZE
+        short = invalid
+        if missing.any():
+            masks = self._branch_masks[opcodes]
+            short = invalid | (missing & (masks == 0))
+            missing &= (masks == 0) | (self.flags[rows] & masks != 0)
+        next_ip = ip + np.where(short, 1, lengths)
+        self.ip[rows] = next_ip
+        if invalid.any() or missing.any():
+            self.errors[rows[invalid]] = _INVALID_OPCODE
+            self.errors[rows[missing]] = _MISSING_OPERAND
+            valid = ~(invalid | missing)
+            rows, opcodes, operands, next_ip = rows[valid], opcodes[valid], operands[valid], next_ip[valid]
+
+        self.steps[rows] += 1
+        for opcode in np.unique(opcodes):
+            selected = opcodes == opcode
+            self._handlers[int(opcode)](rows[selected], operands[selected], next_ip[selected])
+
+    def run(self, max_steps=None):
+        """Run all instances until they halt, fail, leave memory or used max_steps steps."""
+        while True:
+            running = self.running()
+            if max_steps is not None:
+                running &= self.steps < max_steps
+            rows = np.flatnonzero(running)
+            if rows.size == 0:
+                break
+            self.step(rows)
+        return self.results()
+
+    def results(self):
+        """The final state of every instance as a list of BatchResult."""
+        results = []
+        for row in range(len(self.ip)):
+            error = None
+            if self.errors[row] == _INVALID_OPCODE:
+                address = int(self.ip[row]) - 1
+                error = f"Invalid opcode @ {address:02X}: {int(self.memory[row, address]):02X}"
+            elif self.errors[row] == _MISSING_OPERAND:
+                error = f"Operand of instruction @ {MEMORY_SIZE - 1:02X} lies outside memory"
+            results.append(BatchResult(
+                int(self.ip[row]),
+                int(self.registers[0, row]), int(self.registers[1, row]), int(self.registers[2, row]),
+                int(self.flags[row]), bool(self.halted[row]), int(self.steps[row]),
+                self.memory[row].tobytes(), error,
+            ))
+        return results
+
+
+def run_batch(images, max_steps=None):
+    """Run one instance per memory image in lockstep and return their final states."""
+    return BatchEmulator(images).run(max_steps)
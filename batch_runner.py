@@ -0,0 +1,127 @@
+# Assemble and execute many programs without any interaction
+# "Usage: python batch_runner.py <asm_file.asm | directory> ... [--out results.jsonl]
+#         [--max-steps N] [--timeout SECONDS] [--detect-loops] [--no-cache] [--jobs N]"
+#
+# Every program is assembled with the SimpleAssembler and run on a silent SimpleCPUEmulator
+# in a pool of worker processes. One JSON record per program is written (JSON Lines), in
+# the order the programs were given.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from asm_cache import AssemblyCache, default_cache_dir
+from main import read_asm_file
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+DEFAULT_MAX_STEPS = 1_000_000
+DEFAULT_TIMEOUT = 10.0
+
+
+def collect_asm_files(paths):
+    """Expand directories into the .asm files they contain (recursively, sorted)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _subdirs, names in sorted(os.walk(path)):
+                files.extend(os.path.join(directory, name) for name in sorted(names) if name.endswith(".asm"))
+        else:
+            files.append(path)
+    return files
+
+
+# One AssemblyCache per cache directory and worker process
+_CACHES = {}
+
+
+def run_program_file(asm_file, max_steps=DEFAULT_MAX_STEPS, timeout=DEFAULT_TIMEOUT, detect_loops=False,
+                     cache_dir=None):
+    """
+    Assemble and run one program; return its result record (a JSON-serializable dict).
+    status is "assembly_error", "error" (the program raised) or a RunOutcome status.
+    cache_dir: assembly cache directory (see asm_cache.py), None to always assemble.
+    """
+    record = {"file": asm_file, "status": None, "steps": 0, "error": None, "cycle_length": None}
+    start = time.perf_counter()
+    try:
+        source = read_asm_file(asm_file)
+        if cache_dir is None:
+            program = SimpleAssembler().assemble(source)
+        else:
+            if cache_dir not in _CACHES:
+                _CACHES[cache_dir] = AssemblyCache(cache_dir)
+            program = _CACHES[cache_dir].assemble(source)
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(program)
+    except Exception as error:      # unreadable file, assembler or loader error (ValueError, IndexError)
+        record.update(status="assembly_error", error=str(error))
+        return record
+
+    try:
+        outcome = emulator.run_full(max_steps=max_steps, time_limit=timeout, detect_loops=detect_loops)
+        record.update(status=outcome.status, cycle_length=outcome.cycle_length)
+    except Exception as error:
+        record.update(status="error", error=str(error))
+
+    record.update(
+        steps=emulator.steps,
+        cycles=emulator.cycles,
+        ip=emulator.ip,
+        registers={"A": emulator.register_A, "B": emulator.register_B, "C": emulator.register_C},
+        flags={"Z": emulator.flag_Z, "S": emulator.flag_S, "V": emulator.flag_V, "C": emulator.flag_C},
+        memory_sha256=hashlib.sha256(bytes(emulator.memory)).hexdigest(),
+        seconds=round(time.perf_counter() - start, 6),
+    )
+    return record
+
+
+def _run_one(arguments):
+    return run_program_file(*arguments)
+
+
+def run_batch(asm_files, max_steps=DEFAULT_MAX_STEPS, timeout=DEFAULT_TIMEOUT, detect_loops=False, jobs=None,
+              cache_dir=None):
+    """Run all programs in a process pool and yield their records in input order."""
+    jobs = jobs or os.cpu_count() or 1
+    work = [(asm_file, max_steps, timeout, detect_loops, cache_dir) for asm_file in asm_files]
+    if jobs == 1:
+        yield from map(_run_one, work)
+        return
+    # Hand out several programs per task so that short programs do not drown in IPC
+    chunksize = max(1, len(work) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(_run_one, work, chunksize=chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assemble and run many .asm programs headless.")
+    parser.add_argument("paths", nargs="+", help=".asm files or directories containing them")
+    parser.add_argument("--out", default="-", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS, help="step budget per program")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="seconds per program")
+    parser.add_argument("--detect-loops", action="store_true", help="stop programs whose state repeats")
+    parser.add_argument("--no-cache", action="store_true", help="always assemble, bypassing the assembly cache")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    asm_files = collect_asm_files(args.paths)
+    if not asm_files:
+        print("No .asm files found.", file=sys.stderr)
+        sys.exit(1)
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        for record in run_batch(asm_files, args.max_steps, args.timeout, args.detect_loops, args.jobs,
+                                cache_dir=None if args.no_cache else default_cache_dir()):
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1051 @@
+# Benchmarks for the emulator and the assembler
+# "Usage: python benchmark.py [benchmark ...]"   (no argument: run all benchmarks)
+
+import io
+import sys
+import time
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+def best_of(func, repeat=3):
+    """Run func repeat times and return (best wall-clock time in seconds, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+# A nested counting loop: 256 x 256 iterations of a four instruction inner loop
+NESTED_LOOP = """
+    MVI C 0x00      ; outer counter, 256 iterations
+outer:
+    MVI B 0x00      ; inner counter, 256 iterations
+inner:
+    ADD B           ; some ALU work
+    DCR B
+    JZ next
+    JMP inner
+next:
+    DCR C
+    JZ done
+    JMP outer
+done:
+    HLT
+"""
+
+# A loop doing a run of ALU operations between the branches that read the flags
+ALU_LOOP = """
+    MVI C 0x00      ; outer counter, 256 iterations
+outer:
+    MVI B 0x00      ; inner counter, 256 iterations
+inner:
+    ADD B
+    XRA C
+    INR A
+    ORA B
+    SUB C
+    ANI 0x7F
+    DCR B
+    JZ next
+    JMP inner
+next:
+    DCR C
+    JZ done
+    JMP outer
+done:
+    HLT
+"""
+
+# Multiplication by repeated addition, r = x * y (mod 256). Inputs are patched per run.
+MULTIPLY = """
+    LDA y
+    ORI 0x00        ; Z if y == 0
+    JZ done
+    MOV C,A         ; C counts down from y
+    LDB x
+    MVI A 0x00
+loop:
+    ADD B
+    DCR C
+    JZ store
+    JMP loop
+store:
+    STA r
+done:
+    HLT
+x:
+    0x00
+y:
+    0x00
+r:
+    0x00
+"""
+
+# A long setup prefix (64 x 256 loop iterations) followed by MULTIPLY: the checkpoint for
+# snapshots and forks is the first instruction after the prefix
+SETUP_PREFIX = """
+    MVI B 0x40
+outer:
+    MVI C 0x00
+inner:
+    DCR C
+    JZ next
+    JMP inner
+next:
+    DCR B
+    JZ setup_done
+    JMP outer
+setup_done:
+"""
+
+# Programs from test_programs.md
+PROGRAM_ARITHMETIC = [
+    0x20, 0x0A,   # MVI A,0x0A
+    0x21, 0x05,   # MVI B,0x05
+    0x02,         # ADD B
+    0x05,         # SUB B
+    0x09,         # INR A
+    0x0C,         # DCR A
+    0x3F          # HLT
+]
+
+PROGRAM_LOGIC = [
+    0x20, 0xF0,   # MVI A,0xF0
+    0x21, 0x0F,   # MVI B,0x0F
+    0x0F,         # ANA B
+    0x16,         # CMA
+    0x17, 0xAA,   # ANI 0xAA
+    0x18, 0x55,   # ORI 0x55
+    0x19, 0x0F,   # XRI 0x0F
+    0x11,         # TST
+    0x3F          # HLT
+]
+
+PROGRAM_REGMOVE = [
+    0x20, 0x11,   # MVI A,0x11
+    0x1A,         # MOV A,B
+    0x21, 0x22,   # MVI B,0x22
+    0x1A,         # MOV A,B
+    0x1C,         # MOV B,A
+    0x22, 0x33,   # MVI C,0x33
+    0x1D,         # MOV B,C
+    0x1E,         # MOV C,A
+    0x1F,         # MOV C,B
+    0x3F          # HLT
+]
+
+PROGRAM_MEMORY = [
+    0x20, 0xAA,   # MVI A,0xAA
+    0x26, 0x10,   # STA 0x10
+    0x21, 0x05,   # MVI B,0x05
+    0x24, 0x10,   # LDB 0x10
+    0x22, 0x05,   # MVI C,0x05
+    0x29,         # LDA C
+    0x2A,         # STA C
+    0x23, 0x10,   # LDA 0x10
+    0x3F          # HLT
+]
+
+PROGRAM_BRANCHES = [
+    0x20, 0x00,   # MVI A,0x00
+    0x09,         # INR A
+    0x2C, 0x07,   # JS 0x07
+    0x2D, 0x07,   # JZ 0x07
+    0x2E, 0x07,   # JC 0x07
+    0x2F, 0x07,   # JV 0x07
+    0x2B, 0x0E,   # JMP 0x0E
+    0x3F,         # HLT
+    0x20, 0xFF,   # MVI A,0xFF
+    0x3F          # HLT
+]
+
+PROGRAM_CALL = [
+    0x20, 0x02,   # MVI A,0x02
+    0x30, 0x07,   # CALL 0x07
+    0x3F,         # HLT
+    0x3E, 0x3E,   # (padding up to the subroutine)
+    0x21, 0x03,   # MVI B,0x03
+    0x02,         # ADD B
+    0x31          # RET
+]
+
+PROGRAM_MISC = [
+    0x3E,         # NOP
+    0x3E,         # NOP
+    0x3F          # HLT
+]
+
+PROGRAM_LOOP = [
+    0x21, 0x05,   # MVI B,5
+    0x0D,         # DCR B
+    0x2D, 0x07,   # JZ -> 0x07 (HLT) when B reaches 0
+    0x2B, 0x02,   # JMP -> 0x02 to repeat
+    0x3F          # HLT
+]
+
+TEST_PROGRAMS = {
+    "arithmetic": PROGRAM_ARITHMETIC,
+    "logic": PROGRAM_LOGIC,
+    "regmove": PROGRAM_REGMOVE,
+    "memory": PROGRAM_MEMORY,
+    "branches": PROGRAM_BRANCHES,
+    "call": PROGRAM_CALL,
+    "misc": PROGRAM_MISC,
+    "loop": PROGRAM_LOOP,
+}
+
+def count_instructions(program):
+    """Number of instructions a program executes until it halts."""
+    counter = [0]
+    def sink(event):
+        counter[0] += 1
+    emulator = SimpleCPUEmulator(trace=sink)
+    emulator.read_into_memory(program)
+    emulator.run_full()
+    return counter[0]
+
+def run_program(program, **options):
+    emulator = SimpleCPUEmulator(**options)
+    emulator.read_into_memory(program)
+    emulator.run_full()
+    return emulator
+
+
+@benchmark("silent")
+def bench_silent_vs_traced():
+    """Instructions per second of run_full in silent mode and with different trace sinks."""
+    program = SimpleAssembler().assemble(NESTED_LOOP)
+    n = count_instructions(program)
+    print(f"nested loop: {n} instructions")
+
+    modes = [
+        ("silent", lambda: run_program(program, silent=True)),
+        ("trace: callable", lambda: run_program(program, trace=lambda event: None)),
+        ("trace: writer", lambda: run_program(program, trace=io.StringIO())),
+    ]
+    for label, func in modes:
+        elapsed, _ = best_of(func)
+        print(f"  {label:<20} {elapsed:8.3f} s  {n / elapsed:12,.0f} instr/s")
+
+
+def run_repeated(program, runs, dispatch_table=None):
+    """Run a short program runs times on one silent emulator, restarting it at address 0."""
+    # Without fast-forwarding, so counter loops like PROGRAM_LOOP are executed step by step
+    emulator = SimpleCPUEmulator(silent=True, fast_forward=False)
+    if dispatch_table is not None:
+        emulator._dispatch = dispatch_table
+    for _ in range(runs):
+        emulator.read_into_memory(program)
+        emulator.ip = 0
+        emulator.halted = False
+        emulator.run_full()
+    return emulator
+
+
+@benchmark("alu")
+def bench_alu_tables():
+    """ALU opcodes as table lookups versus the reference handlers using update_flags."""
+    import alu
+
+    mismatches = alu.verify_tables()
+    print(f"full operand space check: {len(mismatches)} mismatches")
+
+    reference = {**SimpleCPUEmulator.dispatch_table, **alu.reference_handlers()}
+    programs = [
+        ("arithmetic", PROGRAM_ARITHMETIC, 20000),
+        ("logic", PROGRAM_LOGIC, 20000),
+        ("loop", PROGRAM_LOOP, 20000),
+        ("nested loop", SimpleAssembler().assemble(NESTED_LOOP), 1),
+    ]
+    for label, program, runs in programs:
+        n = count_instructions(program) * runs
+        tables, _ = best_of(lambda: run_repeated(program, runs))
+        update_flags, _ = best_of(lambda: run_repeated(program, runs, reference))
+        print(f"  {label:<12} update_flags {n / update_flags:12,.0f} instr/s   "
+              f"tables {n / tables:12,.0f} instr/s   speedup {update_flags / tables:5.2f}x")
+
+
+def run_without_predecode(emulator):
+    """The fetch/decode loop without the predecoded array: opcode, dispatch and operand per step."""
+    memory = emulator.memory
+    dispatch_table = emulator._dispatch
+    lengths = emulator.opcode_lengths
+    while not emulator.halted and 0 <= emulator.ip < len(memory):
+        ip = emulator.ip
+        opcode = memory[ip]
+        operation = dispatch_table.get(opcode)
+        if operation is None:
+            raise Exception(f"Invalid opcode @ {ip:02X}: {opcode:02X}")
+        if lengths[opcode] == 2:
+            operand = memory[ip + 1]
+            emulator.ip = ip + 2
+        else:
+            operand = None
+            emulator.ip = ip + 1
+        operation(emulator, operand)
+
+
+@benchmark("predecode")
+def bench_predecode():
+    """
+    run_full on the predecoded array versus fetching and decoding every step: on a fresh
+    emulator per run (every instruction is decoded on its first execution) and on one
+    emulator the program is loaded into again (the decoded entries are kept).
+    """
+    programs = [(label, program, 20000) for label, program in TEST_PROGRAMS.items()]
+    programs.append(("nested loop", SimpleAssembler().assemble(NESTED_LOOP), 1))
+
+    def fresh(program, runs, run):
+        for _ in range(runs):
+            emulator = SimpleCPUEmulator(silent=True, fast_forward=False)
+            emulator.read_into_memory(program)
+            run(emulator)
+
+    def reloaded(program, runs, run):
+        emulator = SimpleCPUEmulator(silent=True, fast_forward=False)
+        for _ in range(runs):
+            emulator.read_into_memory(program)
+            emulator.ip = 0
+            emulator.halted = False
+            run(emulator)
+
+    for label, program, runs in programs:
+        n = count_instructions(program) * runs
+        plain, _ = best_of(lambda: fresh(program, runs, run_without_predecode))
+        first, _ = best_of(lambda: fresh(program, runs, SimpleCPUEmulator.run_full))
+        again, _ = best_of(lambda: reloaded(program, runs, SimpleCPUEmulator.run_full))
+        print(f"  {label:<12} decode per step {n / plain:12,.0f} instr/s   "
+              f"fresh {n / first:12,.0f} instr/s ({plain / first:4.2f}x)   "
+              f"reloaded {n / again:12,.0f} instr/s ({plain / again:4.2f}x)")
+
+
+def machine_state(emulator):
+    """The complete observable state of an emulator."""
+    return (emulator.ip, emulator.register_A, emulator.register_B, emulator.register_C,
+            emulator.flags, emulator.halted, list(emulator.memory))
+
+
+@benchmark("blocks")
+def bench_block_compiler():
+    """Compiled basic blocks versus the interpreter loop of run_full."""
+    assembler = SimpleAssembler()
+    programs = [
+        ("nested loop", assembler.assemble(NESTED_LOOP)),
+        ("alu loop", assembler.assemble(ALU_LOOP)),
+    ]
+    for label, program in programs:
+        n = count_instructions(program)
+        interpreted, reference = best_of(lambda: run_program(program, silent=True))
+
+        def compiled_run():
+            emulator = SimpleCPUEmulator(silent=True)
+            emulator.read_into_memory(program)
+            emulator.run_compiled()
+            return emulator
+        compiled, emulator = best_of(compiled_run)
+        same = machine_state(emulator) == machine_state(reference)
+        print(f"  {label:<12} run_full {n / interpreted:12,.0f} instr/s   "
+              f"compiled {n / compiled:12,.0f} instr/s   speedup {interpreted / compiled:5.2f}x   "
+              f"identical final state: {same}")
+
+
+@benchmark("batch")
+def bench_batch_engine():
+    """NumPy lockstep engine versus running the emulator once per memory image."""
+    import random
+    from batch_engine import run_batch
+
+    assembler = SimpleAssembler()
+    program = assembler.assemble(MULTIPLY)
+    x_address = len(program) - 3
+    rng = random.Random(1)
+    for n in (100, 1000, 5000):
+        images = []
+        for _ in range(n):
+            image = list(program)
+            image[x_address] = rng.randrange(256)
+            image[x_address + 1] = rng.randrange(256)
+            images.append(image)
+
+        def sequential():
+            return [run_program(image, silent=True) for image in images]
+        sequential_time, emulators = best_of(sequential, repeat=1)
+        batch_time, results = best_of(lambda: run_batch(images), repeat=1)
+
+        same = all(machine_state(emulator) == (result.ip, result.register_A, result.register_B,
+                                               result.register_C, result.flags, result.halted,
+                                               list(result.memory))
+                   for emulator, result in zip(emulators, results))
+        instructions = sum(result.steps for result in results)
+        print(f"  N={n:<5} sequential {sequential_time:7.3f} s ({instructions / sequential_time:12,.0f} instr/s)   "
+              f"batch {batch_time:7.3f} s ({instructions / batch_time:12,.0f} instr/s)   "
+              f"speedup {sequential_time / batch_time:5.2f}x   identical: {same}")
+
+
+@benchmark("runner")
+def bench_batch_runner():
+    """Headless batch runner over a directory of .asm files with an increasing number of workers."""
+    import os
+    import random
+    import tempfile
+    from batch_runner import collect_asm_files, run_batch
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        for index in range(400):
+            source = MULTIPLY.replace("x:\n    0x00", f"x:\n    0x{rng.randrange(256):02X}")
+            source = source.replace("y:\n    0x00", f"y:\n    0x{rng.randrange(256):02X}")
+            with open(os.path.join(directory, f"multiply_{index:03}.asm"), "w") as asm_file:
+                asm_file.write(source)
+        asm_files = collect_asm_files([directory])
+
+        cores = os.cpu_count() or 1
+        single = None
+        for jobs in sorted({1, 2, 4, cores} & set(range(1, cores + 1))):
+            elapsed, records = best_of(lambda: list(run_batch(asm_files, jobs=jobs)), repeat=1)
+            single = single or elapsed
+            halted = sum(record["status"] == "halted" for record in records)
+            print(f"  jobs={jobs:<3} {elapsed:7.3f} s  {len(records) / elapsed:10,.0f} programs/s   "
+                  f"scaling {single / elapsed:5.2f}x   halted {halted}/{len(records)}")
+
+
+@benchmark("state")
+def bench_instance_state():
+    """Memory per instance and creation time of 100k silent emulators, and state serialization."""
+    import tracemalloc
+
+    n = 100_000
+    program = SimpleAssembler().assemble(MULTIPLY)
+
+    created, fleet = best_of(lambda: [SimpleCPUEmulator(silent=True) for _ in range(n)], repeat=1)
+    del fleet
+    tracemalloc.start()
+    fleet = [SimpleCPUEmulator(silent=True) for _ in range(n)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  create {n:,} instances   {created:7.3f} s  {created / n * 1e6:6.2f} us/instance   "
+          f"{size / n:8,.0f} bytes/instance")
+    emulator = fleet[0]
+    print(f"    of which: object {sys.getsizeof(emulator)}, memory {sys.getsizeof(emulator.memory)} "
+          f"(as a list of ints: {sys.getsizeof([0] * 256)}), predecode array {sys.getsizeof([None] * 256)} bytes, allocated on the first run")
+
+    states = []
+    elapsed, _ = best_of(lambda: [emulator.read_into_memory(program) for emulator in fleet], repeat=1)
+    print(f"  load program            {elapsed:7.3f} s  {elapsed / n * 1e6:6.2f} us/instance")
+    elapsed, states = best_of(lambda: [emulator.to_bytes() for emulator in fleet], repeat=1)
+    print(f"  to_bytes                {elapsed:7.3f} s  {elapsed / n * 1e6:6.2f} us/instance   "
+          f"{len(states[0]):8,} bytes/state")
+    elapsed, restored = best_of(lambda: [SimpleCPUEmulator.from_bytes(state, silent=True) for state in states],
+                                repeat=1)
+    same = all(a.to_bytes() == b.to_bytes() for a, b in zip(fleet, restored))
+    print(f"  from_bytes              {elapsed:7.3f} s  {elapsed / n * 1e6:6.2f} us/instance   identical: {same}")
+
+
+def repeat_call(func, n):
+    """Call func n times, discarding the results."""
+    for _ in range(n):
+        func()
+
+
+@benchmark("snapshot")
+def bench_snapshot_fork():
+    """Running many tails from a checkpoint (snapshot/restore, fork) versus re-running the prefix."""
+    import random
+
+    assembler = SimpleAssembler()
+    program = assembler.assemble(SETUP_PREFIX + MULTIPLY)
+    checkpoint = len(assembler.assemble(SETUP_PREFIX))
+    x_address = len(program) - 3
+    rng = random.Random(1)
+    inputs = [(rng.randrange(256), rng.randrange(256)) for _ in range(100)]
+
+    def rerun():
+        emulators = []
+        for x, y in inputs:
+            # Fast-forwarding would skip the prefix's counter loop
+            emulator = SimpleCPUEmulator(silent=True, fast_forward=False)
+            emulator.read_into_memory(program)
+            emulator.write_memory(x_address, x)
+            emulator.write_memory(x_address + 1, y)
+            emulator.run_full()
+            emulators.append(machine_state(emulator))
+        return emulators
+
+    base = SimpleCPUEmulator(silent=True)
+    base.read_into_memory(program)
+    while base.ip != checkpoint:
+        base.step()
+
+    def from_snapshot():
+        emulator = base.fork()
+        snapshot = emulator.snapshot()
+        states = []
+        for x, y in inputs:
+            emulator.restore(snapshot)
+            emulator.write_memory(x_address, x)
+            emulator.write_memory(x_address + 1, y)
+            emulator.run_full()
+            states.append(machine_state(emulator))
+        return states
+
+    def from_fork():
+        states = []
+        for x, y in inputs:
+            emulator = base.fork()
+            emulator.write_memory(x_address, x)
+            emulator.write_memory(x_address + 1, y)
+            emulator.run_full()
+            states.append(machine_state(emulator))
+        return states
+
+    reference_time, reference = best_of(rerun, repeat=1)
+    snapshot_time, snapshot_states = best_of(from_snapshot)
+    fork_time, fork_states = best_of(from_fork)
+    print(f"  {len(inputs)} tails after a {count_instructions(assembler.assemble(SETUP_PREFIX + 'HLT'))}-instruction prefix")
+    print(f"  re-run from 0x00    {reference_time:8.3f} s")
+    print(f"  snapshot/restore    {snapshot_time:8.3f} s   speedup {reference_time / snapshot_time:7.1f}x   "
+          f"identical: {snapshot_states == reference}")
+    print(f"  fork                {fork_time:8.3f} s   speedup {reference_time / fork_time:7.1f}x   "
+          f"identical: {fork_states == reference}")
+
+    n = 100_000
+    snapshot = base.snapshot()
+    elapsed, _ = best_of(lambda: repeat_call(lambda: base.snapshot(), n))
+    print(f"  snapshot()          {elapsed / n * 1e6:8.2f} us")
+    elapsed, _ = best_of(lambda: repeat_call(lambda: base.restore(snapshot), n))
+    print(f"  restore()           {elapsed / n * 1e6:8.2f} us")
+    elapsed, _ = best_of(lambda: repeat_call(lambda: base.fork(), n))
+    print(f"  fork()              {elapsed / n * 1e6:8.2f} us")
+
+
+@benchmark("budget")
+def bench_budgets():
+    """Cost of step budgets and loop detection in run_full, and time to prove a loop."""
+    assembler = SimpleAssembler()
+    program = assembler.assemble(NESTED_LOOP)
+    n = count_instructions(program)
+    for label, options in [("unlimited", {}), ("max_steps", {"max_steps": 10 * n}),
+                           ("time_limit", {"time_limit": 60.0}), ("detect_loops", {"detect_loops": True})]:
+        def run():
+            emulator = SimpleCPUEmulator(silent=True)
+            emulator.read_into_memory(program)
+            return emulator.run_full(**options)
+        elapsed, outcome = best_of(run)
+        print(f"  {label:<13} {elapsed:8.3f} s  {n / elapsed:12,.0f} instr/s   {outcome.status}")
+
+    # A loop that never terminates, with a 16-bit counter in B:A
+    endless = assembler.assemble("""
+loop:
+    INR A
+    JZ carry
+    JMP loop
+carry:
+    INR B
+    JMP loop
+""")
+    def prove():
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(endless)
+        return emulator.run_full(detect_loops=True)
+    elapsed, outcome = best_of(prove, repeat=1)
+    import tracemalloc
+    tracemalloc.start()
+    prove()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  endless 16-bit counter: {outcome.status} after {outcome.steps:,} steps "
+          f"(cycle length {outcome.cycle_length:,}) in {elapsed:.3f} s, peak {peak / outcome.steps:.0f} bytes/step")
+
+
+@benchmark("profile")
+def bench_profiler():
+    """run_full with and without a profiler attached."""
+    from profiler import Profiler
+
+    assembler = SimpleAssembler()
+    program = assembler.assemble(NESTED_LOOP)
+    n = count_instructions(program)
+
+    def run(profiled):
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(program)
+        if profiled:
+            Profiler(assembler.labels).attach(emulator)
+        emulator.run_full()
+        return emulator
+    plain, _ = best_of(lambda: run(False))
+    profiled, emulator = best_of(lambda: run(True))
+    print(f"  off {n / plain:12,.0f} instr/s   on {n / profiled:12,.0f} instr/s   "
+          f"overhead {profiled / plain:5.2f}x   counted {emulator.profiler.total:,} of {n:,}")
+
+
+@benchmark("record")
+def bench_trace_recorder():
+    """Overhead of recording a binary trace in run_full (in-memory ring and streamed to a file)."""
+    import os
+    import tempfile
+    from trace_recorder import TraceReader, TraceRecorder
+
+    program = SimpleAssembler().assemble(NESTED_LOOP)
+    n = count_instructions(program)
+
+    def run(recorder=None):
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(program)
+        if recorder is not None:
+            recorder.attach(emulator)
+        emulator.run_full()
+        return recorder
+
+    plain, _ = best_of(run)
+    ring, _ = best_of(lambda: run(TraceRecorder()))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "nested.trace")
+        def streamed():
+            with TraceRecorder(path=path) as recorder:
+                run(recorder)
+        streaming, _ = best_of(streamed)
+        reading, records = best_of(lambda: sum(1 for _ in TraceReader(path)), repeat=1)
+        file_size = os.path.getsize(path)
+    print(f"  no recorder     {n / plain:12,.0f} instr/s")
+    print(f"  ring buffer     {n / ring:12,.0f} instr/s   overhead {ring / plain:5.2f}x")
+    print(f"  streamed        {n / streaming:12,.0f} instr/s   overhead {streaming / plain:5.2f}x   "
+          f"{file_size:,} bytes for {n:,} steps")
+    print(f"  read back       {records / reading:12,.0f} records/s  ({records:,} records)")
+
+
+@benchmark("timetravel")
+def bench_time_travel():
+    """Recording an undo log while stepping, and jumping to arbitrary steps."""
+    import random
+    from time_travel import History
+
+    program = SimpleAssembler().assemble(NESTED_LOOP)
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(program)
+    history = History(emulator)
+
+    def record():
+        while not emulator.halted:
+            history.step()
+    elapsed, _ = best_of(record, repeat=1)
+    n = history.position
+    kept = len(history.log) + sum(len(snapshot.memory) + 8 * len(snapshot.decoded or ()) for snapshot in history.keyframes)
+    print(f"  recorded {n:,} steps   {n / elapsed:12,.0f} steps/s   "
+          f"{kept / n:5.1f} bytes/step (full states: {len(emulator.to_bytes())} bytes/step)")
+
+    rng = random.Random(1)
+    targets = [rng.randrange(n) for _ in range(100)]
+    elapsed, _ = best_of(lambda: [history.goto(target) for target in targets], repeat=1)
+    print(f"  goto random step     {elapsed / len(targets) * 1000:8.2f} ms")
+    elapsed, _ = best_of(lambda: history.back(1000), repeat=1)
+    print(f"  back 1000 steps      {elapsed * 1000:8.2f} ms")
+
+    reference = SimpleCPUEmulator(silent=True)
+    reference.read_into_memory(program)
+    reference.run_full(max_steps=history.position)
+    print(f"  state after moving matches a fresh run: {reference.to_bytes() == emulator.to_bytes()}")
+
+
+@benchmark("breakpoints")
+def bench_breakpoints():
+    """run_full with 0, 1 and many breakpoints (never hit) and with a watchpoint."""
+    program = SimpleAssembler().assemble(NESTED_LOOP)
+    n = count_instructions(program)
+    unused = range(0x80, 0xFF)      # NESTED_LOOP never executes these addresses
+
+    def run(breakpoints=(), watchpoints=()):
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(program)
+        for address in breakpoints:
+            emulator.add_breakpoint(address)
+        for address in watchpoints:
+            emulator.add_watchpoint(address, "rw")
+        return emulator.run_full()
+
+    for _ in range(5):              # warm up
+        run()
+    baseline = None
+    for label, options in [("none", {}), ("1 breakpoint", {"breakpoints": unused[:1]}),
+                           (f"{len(unused)} breakpoints", {"breakpoints": unused}),
+                           ("1 watchpoint", {"watchpoints": unused[:1]})]:
+        elapsed, outcome = best_of(lambda: run(**options))
+        baseline = baseline or elapsed
+        print(f"  {label:<16} {n / elapsed:12,.0f} instr/s   overhead {elapsed / baseline:5.2f}x   {outcome.status}")
+
+
+def generated_source(lines, seed=1):
+    """
+    A syntactically valid assembler source of about the given number of lines. Operands only
+    refer to labels of the first 100 lines, whose addresses fit into one byte.
+    """
+    import random
+
+    rng = random.Random(seed)
+    mnemonics = [name for name, (code, length, mode) in SimpleAssembler.OPCODES.items() if code is not None]
+    out = []
+    label = referable = 0
+    while len(out) < lines:
+        if len(out) < 100:
+            referable = label
+        if rng.random() < 0.05:
+            label += 1
+            out.append(f"L{label}:              ; block {label}")
+            continue
+        mnemonic = rng.choice(mnemonics)
+        code, length, mode = SimpleAssembler.OPCODES[mnemonic]
+        if mode == "imm":
+            line = f"    {mnemonic} 0x{rng.randrange(256):02X}"
+        elif mode == "addr":
+            line = f"    {mnemonic} L{rng.randint(1, referable)}" if referable else f"    {mnemonic} 0x10"
+        else:
+            line = f"    {mnemonic}"
+        if rng.random() < 0.3:
+            line += "      ; a comment"
+        out.append(line)
+    out.append("    0x00")
+    return "\n".join(out)
+
+
+@benchmark("assemble")
+def bench_assembler():
+    """Assembling generated sources of growing size: time per line should stay constant."""
+    for lines in (1_000, 10_000, 100_000):
+        source = generated_source(lines)
+        assembler = SimpleAssembler()
+        repeat = 3 if lines < 100_000 else 1
+        raw, _ = best_of(lambda: assembler.assemble_bytes(source), repeat)
+        elapsed, _ = best_of(lambda: assembler.assemble(source), repeat)
+        listing, _ = best_of(lambda: assembler.assemble_with_listing(source), repeat)
+        print(f"  {lines:>7,} lines   assemble_bytes {raw / lines * 1e6:5.2f} us/line   "
+              f"assemble {elapsed / lines * 1e6:5.2f} us/line   with listing {listing / lines * 1e6:5.2f} us/line")
+
+
+@benchmark("cache")
+def bench_assembly_cache():
+    """Assembling through the on-disk cache: a miss assembles and stores, a hit only hashes and loads."""
+    import tempfile
+    from asm_cache import AssemblyCache
+
+    with tempfile.TemporaryDirectory() as directory:
+        for lines in (1_000, 10_000):
+            sources = [generated_source(lines, seed) for seed in range(3)]
+            cache = AssemblyCache(directory)
+            plain, _ = best_of(lambda: SimpleAssembler().assemble_with_listing(sources[0]))
+            misses = [best_of(lambda: cache.assemble_with_listing(source), 1)[0] for source in sources]
+            hit, _ = best_of(lambda: cache.assemble_with_listing(sources[0]))
+            stats = cache.stats()
+            print(f"  {lines:>6,} lines   no cache {plain * 1000:7.2f} ms   miss {min(misses) * 1000:7.2f} ms   "
+                  f"hit {hit * 1000:7.2f} ms   ({plain / hit:4.1f}x)   hit rate {stats['hit_rate']:.2f}")
+
+
+@benchmark("objload")
+def bench_object_load():
+    """Loading programs from object files (memory-mapped) and Intel HEX files vs assembling them."""
+    import os
+    import random
+    import tempfile
+
+    rng = random.Random(1)
+    sources = []
+    for _ in range(1000):
+        source = MULTIPLY.replace("x:\n    0x00", f"x:\n    0x{rng.randrange(256):02X}")
+        sources.append(source.replace("y:\n    0x00", f"y:\n    0x{rng.randrange(256):02X}"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        objects, hex_files = [], []
+        for index, source in enumerate(sources):
+            assembler = SimpleAssembler()
+            assembler.assemble(source)
+            objects.append(os.path.join(directory, f"{index:04}.obj"))
+            hex_files.append(os.path.join(directory, f"{index:04}.hex"))
+            assembler.write_object(objects[-1])
+            assembler.write_intel_hex(hex_files[-1])
+
+        def load_all(programs, assemble=False):
+            for program in programs:
+                emulator = SimpleCPUEmulator(silent=True)
+                emulator.read_into_memory(SimpleAssembler().assemble(program) if assemble else program)
+
+        baseline, _ = best_of(lambda: load_all(sources, assemble=True))
+        for label, func in (("assemble + load", lambda: load_all(sources, assemble=True)),
+                            ("object file", lambda: load_all(objects)),
+                            ("Intel HEX", lambda: load_all(hex_files))):
+            elapsed, _ = best_of(func)
+            print(f"  {label:<16} {elapsed * 1000:8.2f} ms   {len(sources) / elapsed:10,.0f} programs/s   "
+                  f"{baseline / elapsed:5.1f}x")
+
+
+@benchmark("watch")
+def bench_watch():
+    """Edit-to-run turnaround of the watch mode: incremental vs full reassembly after a one-line edit."""
+    import os
+    import tempfile
+    from watch import IncrementalAssembler, Watcher
+
+    for lines in (10_000, 100_000):
+        source = generated_source(lines).splitlines()
+        # Replace one instruction, or insert one so that all later labels move
+        edits = {"changed line": source[:lines // 2] + ["NOP"] + source[lines // 2 + 1:],
+                 "inserted line": source[:lines // 2] + ["NOP"] + source[lines // 2:]}
+        for label, edited in edits.items():
+            edited = "\n".join(edited)
+            full, _ = best_of(lambda: SimpleAssembler().assemble_bytes(edited), 1)
+            assembler = IncrementalAssembler()
+            assembler.assemble_bytes("\n".join(source))
+            incremental, _ = best_of(lambda: assembler.assemble_bytes(edited), 1)
+            print(f"  {lines:>7,} lines, {label:<14} full {full * 1000:7.1f} ms   "
+                  f"incremental {incremental * 1000:7.1f} ms   ({full / incremental:4.1f}x)")
+
+    # Edit -> reassemble -> patch -> run for a program that fits into memory
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "multiply.asm")
+        with open(path, "w") as asm_file:
+            asm_file.write(MULTIPLY)
+        watcher = Watcher(path)
+        watcher.reload()
+        timings = []
+        for value in range(1, 51):
+            with open(path, "w") as asm_file:
+                asm_file.write(MULTIPLY.replace("x:\n    0x00", f"x:\n    0x{value:02X}")
+                                       .replace("y:\n    0x00", "y:\n    0x09"))
+            start = time.perf_counter()
+            watcher.reload()
+            watcher.emulator.fork().run_full()
+            timings.append(time.perf_counter() - start)
+        print(f"  multiply: edit -> patch -> run  {min(timings) * 1e6:7.1f} us")
+
+
+@benchmark("analyze")
+def bench_analyzer():
+    """Static analysis (CFG, loops, findings) of the test programs, and compiled runs seeded with its block leaders."""
+    from analyzer import analyze
+
+    programs = dict(TEST_PROGRAMS)
+    programs["nested loop"] = SimpleAssembler().assemble(NESTED_LOOP)
+    for label, program in programs.items():
+        elapsed, analysis = best_of(lambda: analyze(program))
+        leaders = analysis.leaders()
+
+        def compiled(leaders):
+            emulator = SimpleCPUEmulator(silent=True)
+            emulator.read_into_memory(program)
+            emulator.run_compiled(leaders=leaders)
+            return emulator._compiler.compiled
+
+        plain, blocks = best_of(lambda: compiled(None))
+        seeded, seeded_blocks = best_of(lambda: compiled(leaders))
+        print(f"  {label:<12} analyze {elapsed * 1000:6.2f} ms  {len(analysis.blocks):>3} blocks {len(analysis.loops):>2} loops   "
+              f"run_compiled {plain * 1000:7.2f} ms ({blocks} compiled)   with leaders {seeded * 1000:7.2f} ms ({seeded_blocks} compiled)")
+
+
+# A loop full of the redundant moves generated code tends to have
+REDUNDANT_LOOP = """
+    MVI C 0xFF
+loop:
+    MVI A 0x00      ; overwritten by LDA
+    LDA x
+    MOV B,A
+    MOV A,B         ; A already equals B
+    NOP
+    ADD B
+    MOV B,A         ; overwritten by LDB
+    STA x
+    LDB y
+    MOV A,B
+    INR A
+    STA y
+    DCR C
+    JZ done
+    JMP loop
+done:
+    HLT
+x:
+    0x01
+y:
+    0x00
+"""
+
+
+@benchmark("peephole")
+def bench_peephole():
+    """The peephole optimizer on a loop with redundant moves: saved bytes, executed instructions and time."""
+    results = []
+    for optimize in (False, True):
+        assembler = SimpleAssembler(optimize=optimize)
+        program = assembler.assemble(REDUNDANT_LOOP)
+        elapsed, emulator = best_of(lambda: run_program(program, silent=True), 5)
+        # Code moves, so compare registers, flags and the data cells (not IP and memory)
+        state = machine_state(emulator)[1:5] + tuple(emulator.memory[assembler.labels[name]] for name in ("X", "Y"))
+        results.append((state, emulator.steps, elapsed, len(program)))
+        if optimize:
+            report = assembler.peephole_report
+            print(f"  optimizer: removed {report.instructions} instructions, {report.bytes} bytes, "
+                  f"~{report.cycles} cycles per pass through them")
+    (before, steps, plain, size), (after, optimized_steps, optimized, optimized_size) = results
+    print(f"  {size} -> {optimized_size} bytes   {steps:,} -> {optimized_steps:,} instructions   "
+          f"{plain * 1000:.2f} -> {optimized * 1000:.2f} ms ({plain / optimized:4.2f}x)   "
+          f"registers, flags and data {'match' if before == after else 'DIFFER'}")
+
+
+@benchmark("cycles")
+def bench_cycles():
+    """Cost of counting cycles in the silent run_full loop, and the report of run_full(report=True)."""
+    program = SimpleAssembler().assemble(NESTED_LOOP)
+    n = count_instructions(program)
+
+    def run(report):
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(program)
+        return emulator.run_full(report=report), emulator
+    plain, (_, emulator) = best_of(lambda: run(False))
+    reported, (outcome, _) = best_of(lambda: run(True))
+    print(f"  silent {n / plain:12,.0f} instr/s   {emulator.cycles:,} cycles counted "
+          f"({emulator.cycles / emulator.steps:4.2f} per instruction)")
+    print(f"  report {n / reported:12,.0f} instr/s   overhead {reported / plain:5.2f}x")
+    for line in str(outcome.report).splitlines():
+        print(f"  {line}")
+
+
+@benchmark("fuzz")
+def bench_fuzz():
+    """Differential fuzzing throughput in one process: reference and each engine on the same programs."""
+    import fuzz
+
+    images = [fuzz.generate(0, index) for index in range(512)]
+    elapsed, expected = best_of(lambda: fuzz.reference(images, fuzz.DEFAULT_BUDGET), 1)
+    finished = [image for image, outcome in zip(images, expected) if outcome.finished]
+    print(f"  reference {len(images) / elapsed:10,.0f} programs/s   "
+          f"({len(finished)} of {len(images)} finish within {fuzz.DEFAULT_BUDGET} steps)")
+    for name in fuzz.available_engines():
+        engine = fuzz.ENGINES[name]
+        selected = images if engine.bounded else finished
+        elapsed, _ = best_of(lambda: engine.run(selected, fuzz.DEFAULT_BUDGET), 1)
+        print(f"  {name:9} {len(selected) / elapsed:10,.0f} programs/s")
+    elapsed, (compared, divergences) = best_of(
+        lambda: fuzz.check(images, fuzz.DEFAULT_BUDGET, fuzz.available_engines()), 1)
+    print(f"  all engines {len(images) / elapsed:8,.0f} programs/s per core, {len(divergences)} divergences")
+
+
+# A loop calling a multiplication routine 250 times with the same two pairs of operands
+MUL_CALLS = """
+start:
+    LDA n
+    DCR A
+    STA n
+    JZ done
+    ANI 0x01        ; odd or even pass: 7 * 200 or 9 * 150
+    JZ even
+    MVI B 0x07
+    MVI C 0xC8
+    JMP multiply
+even:
+    MVI B 0x09
+    MVI C 0x96
+multiply:
+    CALL mul
+    STA res
+    JMP start
+done:
+    HLT
+mul:
+    MVI A 0x00
+mulloop:
+    ADD B
+    DCR C
+    JZ mulend
+    JMP mulloop
+mulend:
+    RET
+n:
+    0xFB
+res:
+    0x00
+"""
+
+
+@benchmark("memo")
+def bench_memo():
+    """run_full with and without a CallMemo on a program calling a routine with repeated inputs."""
+    from memo import CallMemo
+
+    program = SimpleAssembler().assemble(MUL_CALLS)
+
+    def run(memoized):
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory(program)
+        memo = CallMemo().attach(emulator) if memoized else None
+        emulator.run_full()
+        return emulator, memo
+    plain, (expected, _) = best_of(lambda: run(False))
+    memoized, (emulator, memo) = best_of(lambda: run(True))
+    stats = memo.stats()
+    same = machine_state(emulator) == machine_state(expected) and (emulator.steps, emulator.cycles) == \
+        (expected.steps, expected.cycles)
+    print(f"  plain {plain * 1000:8.2f} ms   memoized {memoized * 1000:8.2f} ms   ({plain / memoized:5.1f}x)   "
+          f"{expected.steps:,} steps, {stats['replayed_steps']:,} replayed")
+    print(f"  hits {stats['hits']}   misses {stats['misses']}   entries {stats['entries']}   "
+          f"state, steps and cycles {'match' if same else 'DIFFER'}")
+
+
+# SETUP_PREFIX, then an idle loop waiting forever (as for an interrupt)
+IDLE_AFTER_SETUP = SETUP_PREFIX + """
+wait:
+    JMP wait
+"""
+
+
+@benchmark("fastforward")
+def bench_fast_forward():
+    """run_full with and without fast-forwarding of counter and idle loops."""
+    assembler = SimpleAssembler()
+    programs = [
+        ("countdown", assembler.assemble(SETUP_PREFIX + "HLT"), None),
+        ("nested loop", assembler.assemble(NESTED_LOOP), None),
+        ("idle", assembler.assemble(IDLE_AFTER_SETUP), 1_000_000),
+    ]
+    for label, program, max_steps in programs:
+        def run(fast_forward):
+            emulator = SimpleCPUEmulator(silent=True, fast_forward=fast_forward)
+            emulator.read_into_memory(program)
+            outcome = emulator.run_full(max_steps=max_steps)
+            return outcome.status, emulator.steps, emulator.cycles, machine_state(emulator)
+
+        plain, expected = best_of(lambda: run(False))
+        skipped, result = best_of(lambda: run(True))
+        print(f"  {label:<12} {expected[1]:>9,} steps   executed {plain * 1000:8.2f} ms   "
+              f"fast-forwarded {skipped * 1000:8.2f} ms   speedup {plain / skipped:8.1f}x   "
+              f"identical: {result == expected}")
+    # Without a step budget an idle loop ends the run at once
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(programs[2][1])
+    elapsed, outcome = best_of(emulator.run_full, repeat=1)
+    print(f"  idle, no budget: {outcome.status} after {outcome.steps:,} steps in {elapsed * 1000:.2f} ms")
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}'. Available: {', '.join(BENCHMARKS)}")
+            sys.exit(1)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# block_compiler.py
+#
+# An optional execution engine for the SimpleCPUEmulator.
+# The loaded program is split into blocks: straight-line code ending at a JMP, CALL, RET or
+# HLT. A conditional branch only leaves the block when it is taken. For every block Python
+# source is generated that keeps the registers and the status byte in local variables; it
+# is compiled once and cached by its entry address. A branch back to the entry of the block
+# loops inside the generated function, so a loop costs one call instead of one per round.
+# A store into the byte range of a cached block drops that block, so self-modifying code
+# keeps working.
+
+from alu import ALU_ADC, ALU_ADD, ALU_AND, ALU_CMA, ALU_OR, ALU_SUB, ALU_SUC, ALU_XOR
+from alu import ALU_OPCODES, FLAG_C, FLAG_S, FLAG_V, FLAG_Z
+
+# Opcodes ending a block: JMP, CALL, RET and HLT (a conditional branch only when taken)
+BLOCK_END_OPCODES = frozenset({0x2B, 0x30, 0x31, 0x3F})
+
+# The longest block that is compiled; longer straight-line code is split
+MAX_BLOCK_LENGTH = 64
+
+# Globals of the generated code
+_NAMESPACE = {
+    "ALU_ADD": ALU_ADD, "ALU_ADC": ALU_ADC, "ALU_SUB": ALU_SUB, "ALU_SUC": ALU_SUC,
+    "ALU_AND": ALU_AND, "ALU_OR": ALU_OR, "ALU_XOR": ALU_XOR, "ALU_CMA": ALU_CMA,
+}
+
+# Source templates of the straight-line opcodes. {operand} is the operand, {byte} the operand
+# truncated to 8 bits.
+_TEMPLATES = {
+    0x16: ["P = ALU_CMA[A]", "A = P & 0xFF", "F = P >> 8"],
+    0x1A: ["A = B"],
+    0x1B: ["A = C"],
+    0x1C: ["B = A"],
+    0x1D: ["B = C"],
+    0x1E: ["C = A"],
+    0x1F: ["C = B"],
+    0x20: ["A = {byte}"],
+    0x21: ["B = {byte}"],
+    0x22: ["C = {byte}"],
+    0x23: ["A = mem[{operand}]"],
+    0x24: ["B = mem[{operand}]"],
+    0x25: ["C = mem[{operand}]"],
+    0x29: ["A = mem[C]"],
+    0x3E: [],
+}
+
+# The ALU opcodes are generated from their description in alu.py
+for _code, _dest, _operation, _first, _second in ALU_OPCODES:
+    _second = "{operand}" if _second == "imm" else _second
+    _lookup = f"ALU_{_operation}[({_first} << 8) | {_second}]"
+    if _dest is None:
+        _TEMPLATES[_code] = [f"F = {_lookup} >> 8"]
+    else:
+        _TEMPLATES[_code] = [f"P = {_lookup}", f"{_dest} = P & 0xFF", "F = P >> 8"]
+
+_BRANCH_FLAGS = {0x2C: FLAG_S, 0x2D: FLAG_Z, 0x2E: FLAG_C, 0x2F: FLAG_V}
+
+
+class BlockCompiler:
+    """
+    Runs an emulator by executing compiled blocks instead of single instructions.
+    The final state is identical to SimpleCPUEmulator.run_full; no trace events are produced.
+    leaders: optional set of addresses where blocks must start (e.g. branch targets),
+    so that code jumped into is not compiled twice as part of a longer block.
+    """
+
+    def __init__(self, emulator, leaders=None):
+        self.emulator = emulator
+        self.leaders = frozenset(leaders or ())
+        self.blocks = {}                                        # entry address -> function
+        self._ranges = {}                                       # entry address -> (start, end)
+        self._covering = [[] for _ in range(len(emulator.memory))]  # byte -> entry addresses
+        self.compiled = 0                                       # number of blocks compiled
+        emulator._write_listeners.append(self.invalidate)
+
+    def invalidate(self, start, end):
+        """Drop every cached block overlapping the byte range [start, end)."""
+        covering = self._covering
+        for address in range(start, min(end, len(covering))):
+            for entry in covering[address]:
+                if entry in self.blocks:
+                    del self.blocks[entry]
+                    block_start, block_end = self._ranges.pop(entry)
+                    for byte in range(block_start, block_end):
+                        if byte != address:
+                            covering[byte].remove(entry)
+            covering[address] = []
+
+    def _block_source(self, entry):
+        """Generate the source of the block starting at entry; None if nothing can be compiled."""
+        memory = self.emulator.memory
+        dispatch = self.emulator.dispatch_table
+        lengths = self.emulator.opcode_lengths
+        size = len(memory)
+
+        # First find the instructions of the block
+        instructions = []
+        address = entry
+        while address < size and len(instructions) < MAX_BLOCK_LENGTH:
+            if address != entry and address in self.leaders:
+                break
+            opcode = memory[address]
+            if opcode not in dispatch:
+                break
+            length = lengths[opcode]
+            if address + length > size:
+                break
+            operand = memory[address + 1] if length == 2 else None
+            instructions.append((address, opcode, operand, length))
+            address += length
+            if opcode in BLOCK_END_OPCODES:
+                break
+        if not instructions:
+            return None, entry, instructions
+        end = address
+        # A branch back to the entry repeats the block in a loop; the instructions and cycles
+        # of the completed rounds are kept in n and cy
+        loops = any(operand == entry for _address, opcode, operand, _length in instructions
+                    if opcode == 0x2B or opcode in _BRANCH_FLAGS)
+        costs = self.emulator._cycle_costs
+        indent = "        " if loops else "    "
+        write_back = "emu.register_A = A; emu.register_B = B; emu.register_C = C; emu.flags = F"
+
+        def leave(count, cycles, ip):
+            # Leave after count instructions (of this round) costing cycles
+            steps, spent = (f"n + {count}", f"cy + {cycles}") if loops else (count, cycles)
+            return f"{write_back}; emu.steps += {steps}; emu.cycles += {spent}; emu.ip = {ip}; return"
+
+        def repeat(count, cycles):
+            return f"n += {count}; cy += {cycles}; continue"
+
+        lines = [
+            "def block(emu):",
+            "    mem = emu.memory",
+            "    A = emu.register_A; B = emu.register_B; C = emu.register_C; F = emu.flags",
+        ]
+        if loops:
+            lines += ["    n = cy = 0", "    while True:"]
+        cycles = 0
+        for count, (address, opcode, operand, length) in enumerate(instructions, 1):
+            operand = int(operand) if operand is not None else None
+            cycles += costs[opcode]
+            next_address = address + length
+            name = self.emulator.opcode_names[opcode]
+            code = []
+            lines.append(f"{indent}# {address:02X}: {name}" + (f" {operand:02X}" if operand is not None else ""))
+
+            if opcode in _TEMPLATES:
+                values = {"operand": operand, "byte": operand & 0xFF} if operand is not None else {}
+                code.extend(line.format(**values) for line in _TEMPLATES[opcode])
+            elif opcode == 0x26:    # STA Address
+                code.append(f"emu.write_memory({operand}, A)")
+                if entry <= operand < end:
+                    # The block modifies itself: leave it right after the store
+                    code.append(leave(count, cycles, next_address))
+            elif opcode == 0x2A:    # STA C
+                code.append("emu.write_memory(C, A)")
+                code.append(f"if {entry} <= C < {end}:")
+                code.append(f"    {leave(count, cycles, next_address)}")
+            elif opcode == 0x2B:    # JMP
+                code.append(repeat(count, cycles) if operand == entry else leave(count, cycles, operand))
+            elif opcode in _BRANCH_FLAGS:
+                code.append(f"if F & {_BRANCH_FLAGS[opcode]}:")
+                code.append("    " + (repeat(count, cycles) if operand == entry else leave(count, cycles, operand)))
+            elif opcode == 0x30:    # CALL: store the return address at 0xFF
+                code.append(f"emu.write_memory(0xFF, {next_address & 0xFF})")
+                code.append(leave(count, cycles, operand))
+            elif opcode == 0x31:    # RET
+                code.append(leave(count, cycles, "mem[0xFF]"))
+            elif opcode == 0x3F:    # HLT
+                code.append("emu.halted = True")
+                code.append(leave(count, cycles, next_address))
+            else:
+                raise ValueError(f"No block template for opcode {opcode:02X}")
+            lines.extend(indent + line for line in code)
+
+        if instructions[-1][1] not in BLOCK_END_OPCODES:
+            # Straight-line code (or an untaken branch) running into the next block
+            lines.append(indent + leave(len(instructions), cycles, end))
+        return "\n".join(lines), end, instructions
+
+    def compile_block(self, entry):
+        """Compile and cache the block starting at entry. Returns the function or None."""
+        source, end, instructions = self._block_source(entry)
+        if source is None:
+            return None
+        namespace = dict(_NAMESPACE)
+        exec(compile(source, f"<block {entry:02X}>", "exec"), namespace)
+        function = namespace["block"]
+        function.source = source
+        self.blocks[entry] = function
+        self._ranges[entry] = (entry, end)
+        for byte in range(entry, end):
+            self._covering[byte].append(entry)
+        self.compiled += 1
+        return function
+
+    def run(self):
+        """Run until HLT or the IP leaves memory. Returns the number of executed instructions."""
+        emulator = self.emulator
+        blocks = self.blocks
+        size = len(emulator.memory)
+        start = emulator.steps
+        while not emulator.halted:
+            ip = emulator.ip
+            if not 0 <= ip < size:
+                break
+            block = blocks.get(ip) or self.compile_block(ip)
+            if block is None:
+                # Not compilable (invalid opcode, operand outside memory): let the interpreter
+                # execute it, which raises the same error as run_full (and counts the step)
+                emulator.step()
+                continue
+            # The block adds its instructions and cycles to the emulator's counters
+            block(emulator)
+        return emulator.steps - start
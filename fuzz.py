@@ -0,0 +1,433 @@
+# fuzz.py
+#
+# Differential fuzzer for the instruction set.
+# Random programs (valid instructions with random operands, followed by random data) and
+# raw random memory images are run on the reference interpreter (SimpleCPUEmulator.step)
+# and on every alternative engine with the same step budget; their final states (memory,
+# IP, registers, flags, halted), step counts and errors must be identical:
+#   limited   run_full(max_steps=...) on an image loaded by read_into_memory
+#   fast      run_full() without a budget
+#   compiled  run_compiled()
+#   memo      run_full(max_steps=...) with a memo.CallMemo replaying routines
+#   batch     batch_engine.run_batch (requires NumPy, runs a whole chunk in lockstep)
+# fast and compiled have no step budget, so they only run the programs the reference
+# finishes within the budget, under a watchdog timer in case they do not finish. A diverging
+# program is minimized (smallest budget, fewest bytes, as many bytes as possible replaced
+# by NOP / 0x00) and printed as a reproducer.
+#
+# Program i of seed s is always the same program, so chunks of programs are generated and
+# checked in parallel worker processes. With --corpus DIR the Intel HEX and object files in
+# DIR are replayed first and mutated into new programs, and minimized reproducers are saved
+# there as "<engine>-<steps>-<digest>.hex" (replayed with that step budget).
+#
+# "Usage: python fuzz.py [--seed N] [--programs N] [--budget STEPS] [--engines NAMES]
+#         [--jobs N] [--corpus DIR] [--no-minimize]"
+
+import argparse
+import contextlib
+import hashlib
+import os
+import random
+import re
+import signal
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import batch_engine
+from analyzer import Instruction, disassemble
+from memo import CallMemo
+from object_format import mapped_image, write_intel_hex
+from simple_cpu_emulator import STATE_FORMAT, SimpleCPUEmulator
+
+DEFAULT_PROGRAMS = 10_000
+DEFAULT_BUDGET = 256
+# Programs per task handed to a worker process (and per lockstep batch)
+CHUNK_SIZE = 256
+# Divergences minimized and printed per engine
+MAX_REPORTED = 3
+# Seconds an engine without a step budget may run, plus this per step of the budget
+WATCHDOG_SECONDS = 0.2
+WATCHDOG_SECONDS_PER_STEP = 10e-6
+
+MEMORY_SIZE = 256
+NOP = 0x3E
+OPCODES = sorted(SimpleCPUEmulator.opcode_lengths)
+# Immediate values at the edges of the flag computations
+EDGE_VALUES = (0x00, 0x01, 0x7F, 0x80, 0x81, 0xFE, 0xFF)
+
+# Final state of one run. state is SimpleCPUEmulator.to_bytes(), error the message of the
+# exception the run raised (or None), finished whether it stopped before the step budget.
+Outcome = namedtuple("Outcome", ["state", "steps", "error", "finished"])
+
+# An engine runs a list of images with a step budget and returns one Outcome per image.
+# bounded: the engine honors the budget (else it only gets programs the reference finishes)
+Engine = namedtuple("Engine", ["run", "bounded"])
+
+# A program on which an engine disagrees with the reference
+Divergence = namedtuple("Divergence", ["engine", "image", "budget", "expected", "actual"])
+
+ENGINES = {}
+
+def engine(name, bounded=True):
+    def decorator(func):
+        ENGINES[name] = Engine(func, bounded)
+        return func
+    return decorator
+
+
+class WatchdogTimeout(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def watchdog(seconds):
+    """Raise WatchdogTimeout inside the with block after seconds (Unix; elsewhere no limit)."""
+    if seconds is None or not hasattr(signal, "setitimer"):
+        yield
+        return
+    def expire(signum, frame):
+        raise WatchdogTimeout(f"Still running after {seconds:.2f} s")
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _outcome(emulator, error):
+    finished = error is not None or emulator.halted or not 0 <= emulator.ip < len(emulator.memory)
+    return Outcome(emulator.to_bytes(), emulator.steps, error, finished)
+
+
+def _run_each(images, run, read=False, timeout=None, **options):
+    """
+    Outcomes of run(emulator) on a fresh silent emulator per image. The image is loaded
+    through from_bytes, or with read through read_into_memory; either way instructions
+    are decoded on their first execution. A run taking longer than timeout seconds ends
+    with a WatchdogTimeout error.
+    """
+    outcomes = []
+    for image in images:
+        if read:
+            emulator = SimpleCPUEmulator(silent=True, **options)
+            emulator.read_into_memory(image)
+        else:
+            state = STATE_FORMAT.pack(image.ljust(MEMORY_SIZE, b"\0"), 0, 0, 0, 0, 0, False)
+            emulator = SimpleCPUEmulator.from_bytes(state, silent=True, **options)
+        error = None
+        try:
+            with watchdog(timeout):
+                run(emulator)
+        except Exception as exception:
+            error = str(exception)
+        outcomes.append(_outcome(emulator, error))
+    return outcomes
+
+
+def reference(images, budget):
+    """The expected outcomes: one step() at a time on a fresh emulator."""
+    def run(emulator):
+        size = len(emulator.memory)
+        while emulator.steps < budget and not emulator.halted and 0 <= emulator.ip < size:
+            emulator.step()
+    return _run_each(images, run)
+
+
+@engine("limited")
+def run_limited(images, budget):
+    return _run_each(images, lambda emulator: emulator.run_full(max_steps=budget), read=True)
+
+
+def _watchdog_seconds(budget):
+    return WATCHDOG_SECONDS + budget * WATCHDOG_SECONDS_PER_STEP
+
+
+@engine("memo")
+def run_memo(images, budget):
+    return _run_each(images, lambda emulator: CallMemo().attach(emulator).run(emulator, budget))
+
+
+@engine("fast", bounded=False)
+def run_fast(images, budget):
+    return _run_each(images, lambda emulator: emulator.run_full(), timeout=_watchdog_seconds(budget))
+
+
+@engine("compiled", bounded=False)
+def run_compiled(images, budget):
+    return _run_each(images, lambda emulator: emulator.run_compiled(), timeout=_watchdog_seconds(budget))
+
+
+@engine("batch")
+def run_batch(images, budget):
+    if not images:
+        return []
+    outcomes = []
+    # NumPy would read a bytes object as one string, not as byte values
+    for result in batch_engine.run_batch([list(image) for image in images], budget):
+        state = STATE_FORMAT.pack(result.memory, result.ip, result.register_A, result.register_B,
+                                  result.register_C, result.flags, result.halted)
+        finished = result.error is not None or result.halted or not 0 <= result.ip < len(result.memory)
+        outcomes.append(Outcome(state, result.steps, result.error, finished))
+    return outcomes
+
+
+def available_engines():
+    """Names of the engines that can run here (batch needs NumPy)."""
+    return [name for name in ENGINES if name != "batch" or batch_engine.np is not None]
+
+
+def generate(seed, index, corpus=()):
+    """Program index of seed as a memory image (bytes); with a corpus, often a mutation of an entry."""
+    rng = random.Random(f"{seed}:{index}")
+    if corpus and rng.random() < 0.5:
+        return mutate(rng, rng.choice(corpus))
+    if rng.random() < 0.1:
+        return rng.randbytes(rng.randint(1, MEMORY_SIZE))
+
+    size = rng.randint(4, 96)
+    image = bytearray()
+    while len(image) < size:
+        opcode = rng.choice(OPCODES)
+        image.append(opcode)
+        if SimpleCPUEmulator.opcode_lengths[opcode] == 2:
+            if SimpleCPUEmulator.opcode_groups[opcode] == "branch":
+                image.append(rng.randrange(size + 1))          # mostly into the program
+            elif opcode in SimpleCPUEmulator.opcode_reads or opcode in SimpleCPUEmulator.opcode_writes:
+                image.append(rng.randrange(MEMORY_SIZE))
+            else:
+                image.append(rng.choice(EDGE_VALUES) if rng.random() < 0.3 else rng.randrange(256))
+    if rng.random() < 0.5:
+        image.append(0x3F)      # HLT
+    image += rng.randbytes(rng.randint(0, 32))
+    return bytes(image[:MEMORY_SIZE])
+
+
+def mutate(rng, image):
+    """A copy of image with a few bytes replaced, inserted or removed."""
+    image = bytearray(image)
+    for _ in range(rng.randint(1, 4)):
+        address = rng.randrange(len(image) + 1)
+        choice = rng.random()
+        value = rng.choice(OPCODES) if rng.random() < 0.5 else rng.randrange(256)
+        if choice < 0.6 and address < len(image):
+            image[address] = value
+        elif choice < 0.8 and len(image) < MEMORY_SIZE:
+            image.insert(address, value)
+        elif len(image) > 1 and address < len(image):
+            del image[address]
+    return bytes(image)
+
+
+def check(images, budget, engines):
+    """Run images on the reference and the engines; returns ({engine: programs compared}, [Divergence])."""
+    expected = reference(images, budget)
+    compared = {}
+    divergences = []
+    for name in engines:
+        engine = ENGINES[name]
+        selected = range(len(images)) if engine.bounded else [i for i, outcome in enumerate(expected)
+                                                              if outcome.finished]
+        actual = engine.run([images[i] for i in selected], budget)
+        for i, outcome in zip(selected, actual):
+            if outcome != expected[i]:
+                divergences.append(Divergence(name, images[i], budget, expected[i], outcome))
+        compared[name] = len(selected)
+    return compared, divergences
+
+
+def fuzz_chunk(seed, start, count, budget, engines, corpus=()):
+    """Generate and check programs start .. start + count - 1 of seed."""
+    return check([generate(seed, index, corpus) for index in range(start, start + count)], budget, engines)
+
+
+def _fuzz_chunk(arguments):
+    return fuzz_chunk(*arguments)
+
+
+def fuzz(seed, programs, budget=DEFAULT_BUDGET, engines=None, jobs=None, corpus=()):
+    """
+    Check programs generated programs in a pool of worker processes.
+    Yields the ({engine: programs compared}, [Divergence]) of every chunk as it completes.
+    """
+    engines = engines or available_engines()
+    jobs = jobs or os.cpu_count() or 1
+    work = [(seed, start, min(CHUNK_SIZE, programs - start), budget, engines, corpus)
+            for start in range(0, programs, CHUNK_SIZE)]
+    if jobs == 1:
+        yield from map(_fuzz_chunk, work)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(_fuzz_chunk, work)
+
+
+def diverges(image, budget, name):
+    """Whether engine name disagrees with the reference on image."""
+    return bool(check([image], budget, [name])[1])
+
+
+def minimize(divergence):
+    """A Divergence with the smallest budget and simplest image that still diverge."""
+    name, image, budget = divergence.engine, bytes(divergence.image), divergence.budget
+
+    def fewest_steps(budget):
+        if not ENGINES[name].bounded:
+            return budget
+        low, high = 0, budget       # no divergence after 0 steps, one after budget steps
+        while high - low > 1:
+            middle = (low + high) // 2
+            if diverges(image, middle, name):
+                high = middle
+            else:
+                low = middle
+        return high
+
+    budget = fewest_steps(budget)
+    # Shortest prefix of the image
+    cut = len(image) // 2
+    while cut:
+        if len(image) > cut and diverges(image[:-cut], budget, name):
+            image = image[:-cut]
+        else:
+            cut //= 2
+    # Fewest and simplest bytes: remove a byte, else replace it by NOP or 0x00
+    changed = True
+    while changed:
+        changed = False
+        for address in reversed(range(len(image))):
+            candidates = [image[:address] + image[address + 1:]]
+            for value in (NOP, 0x00):
+                if image[address] == value:
+                    break
+                candidates.append(image[:address] + bytes([value]) + image[address + 1:])
+            for candidate in candidates:
+                if candidate and diverges(candidate, budget, name):
+                    image = candidate
+                    changed = True
+                    break
+    budget = fewest_steps(budget)
+    return check([image], budget, [name])[1][0]
+
+
+def listing(image):
+    """The image disassembled from address 0, one "address: bytes  instruction" line each."""
+    lines = []
+    address = 0
+    while address < len(image):
+        opcode = image[address]
+        length = SimpleCPUEmulator.opcode_lengths.get(opcode, 1)
+        operand = image[address + 1] if length == 2 and address + 1 < len(image) else None
+        code = image[address:address + length]
+        lines.append(f"{address:02X}: {code.hex(' ').upper():6}  "
+                     f"{disassemble(Instruction(address, opcode, operand, length))}")
+        address += length
+    return "\n".join(lines)
+
+
+def differences(expected, actual):
+    """Text lines naming the fields in which two Outcomes differ."""
+    lines = []
+    fields = ("memory", "ip", "A", "B", "C", "flags", "halted")
+    for field, want, got in zip(fields, STATE_FORMAT.unpack(expected.state), STATE_FORMAT.unpack(actual.state)):
+        if field == "memory" and want != got:
+            address = next(i for i, (a, b) in enumerate(zip(want, got)) if a != b)
+            lines.append(f"memory[{address:02X}]: expected {want[address]:02X}, got {got[address]:02X}")
+        elif field != "memory" and want != got:
+            lines.append(f"{field}: expected {want}, got {got}")
+    for field in ("steps", "error"):
+        if getattr(expected, field) != getattr(actual, field):
+            lines.append(f"{field}: expected {getattr(expected, field)!r}, got {getattr(actual, field)!r}")
+    return lines
+
+
+def load_corpus(directory):
+    """[(path, image, budget or None)] for the Intel HEX and object files in directory."""
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith((".hex", ".obj")):
+            continue
+        path = os.path.join(directory, name)
+        with mapped_image(path) as view:
+            image = bytes(view)
+        steps = re.match(r".*-(\d+)-[0-9a-f]+\.hex$", name)
+        corpus.append((path, image, int(steps.group(1)) if steps else None))
+    return corpus
+
+
+def save_reproducer(directory, divergence):
+    """Write the image of a minimized divergence into the corpus directory; returns the path."""
+    digest = hashlib.sha1(divergence.image).hexdigest()[:12]
+    path = os.path.join(directory, f"{divergence.engine}-{divergence.budget}-{digest}.hex")
+    write_intel_hex(path, divergence.image, [(0, len(divergence.image))])
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the emulator's engines.")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated programs")
+    parser.add_argument("--programs", type=int, default=DEFAULT_PROGRAMS, help="number of programs to generate")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="step budget per program")
+    parser.add_argument("--engines", default=None,
+                        help=f"comma-separated engines (default: all available of {', '.join(ENGINES)})")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--corpus", default=None, help="directory of .hex/.obj programs to replay and mutate")
+    parser.add_argument("--no-minimize", action="store_true", help="report diverging programs as generated")
+    args = parser.parse_args()
+
+    engines = args.engines.split(",") if args.engines else available_engines()
+    for name in engines:
+        if name not in ENGINES:
+            print(f"Unknown engine '{name}'. Available: {', '.join(ENGINES)}")
+            sys.exit(1)
+    if "batch" in engines and batch_engine.np is None:
+        print("The batch engine requires NumPy (pip install numpy)")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    compared = dict.fromkeys(engines, 0)
+    divergences = []
+    corpus = []
+    if args.corpus:
+        os.makedirs(args.corpus, exist_ok=True)
+        corpus = load_corpus(args.corpus)
+        for path, image, budget in corpus:
+            counts, found = check([image], budget or args.budget, engines)
+            for name, count in counts.items():
+                compared[name] += count
+            divergences += found
+    for counts, found in fuzz(args.seed, args.programs, args.budget, engines, args.jobs,
+                              tuple(image for _path, image, _budget in corpus)):
+        for name, count in counts.items():
+            compared[name] += count
+        divergences += found
+    elapsed = time.perf_counter() - start
+
+    total = args.programs + len(corpus)
+    print(f"{total:,} programs in {elapsed:.1f} s ({total / elapsed:,.0f} programs/s), "
+          f"compared: {', '.join(f'{name} {count:,}' for name, count in compared.items())}")
+    if not divergences:
+        print("No divergences.")
+        return
+
+    print(f"{len(divergences)} divergences")
+    reported = set()
+    for name in engines:
+        for divergence in [d for d in divergences if d.engine == name][:MAX_REPORTED]:
+            if not args.no_minimize:
+                divergence = minimize(divergence)
+            if (name, divergence.image) in reported:
+                continue
+            reported.add((name, divergence.image))
+            print(f"\n== {name}: {len(divergence.image)} bytes, {divergence.budget} steps ==")
+            print(listing(divergence.image))
+            for line in differences(divergence.expected, divergence.actual):
+                print(f"  {line}")
+            if args.corpus:
+                print(f"  saved as {save_reproducer(args.corpus, divergence)}")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 # Assemble and execute
-# "Usage: python.py <asm_file.asm>"
+# "Usage: python.py <asm_file.asm> [--no-cache] [--optimize]"
 
 import sys
+from asm_cache import AssemblyCache
 from simple_assembler import SimpleAssembler
 from simple_cpu_emulator import SimpleCPUEmulator
 
@@ -14,12 +15,18 @@ def read_asm_file(filename):
     return '\n'.join(asm_program)
 
 def main():
+    # --no-cache bypasses the assembly cache (see asm_cache.py),
+    # --optimize runs the peephole optimizer (see peephole.py)
+    arguments = [arg for arg in sys.argv[1:] if arg not in ("--no-cache", "--optimize")]
+    use_cache = "--no-cache" not in sys.argv[1:]
+    optimize = "--optimize" in sys.argv[1:]
+
     # check that a file name was provided!
-    if len(sys.argv) < 2:
-        print("Usage: python.py <asm_file.asm>")
+    if len(arguments) < 1:
+        print("Usage: python.py <asm_file.asm> [--no-cache] [--optimize]")
         sys.exit(1)
 
-    asm_file = sys.argv[1]
+    asm_file = arguments[0]
 
     # Read in the assembler file
     try:
@@ -32,15 +39,26 @@ def main():
     print("Assembler program:")
     print(asm_program)
 
-    assembler = SimpleAssembler()
-    mc_program, mc_listing = assembler.assemble_with_listing(asm_program)
+    assembler = SimpleAssembler(optimize)
+    if use_cache:
+        mc_program, mc_listing = AssemblyCache().assemble_with_listing(asm_program, assembler)
+    else:
+        mc_program, mc_listing = assembler.assemble_with_listing(asm_program)
     
+    report = assembler.peephole_report
+    if report is not None and report.declined:
+        print(f"Peephole optimizer declined: {report.declined}")
+    elif report is not None:
+        print(f"Peephole optimizer: removed {report.instructions} instructions, "
+              f"saved {report.bytes} bytes and ~{report.cycles} cycles")
+
     print("Machine code listing:")
     print(mc_listing)
     print("Machine code program:")
     print(mc_program)
 
     emulator = SimpleCPUEmulator()
+    emulator.symbols = assembler.labels     # labels can be used for breakpoints
 
     emulator.read_into_memory(mc_program)
 
@@ -0,0 +1,247 @@
+# memo.py
+#
+# Memoization of subroutines called with CALL.
+# With a CallMemo attached (memo.attach(emulator)), run_full records every routine it
+# enters through CALL, from its first instruction up to the first RET: the registers and
+# flags it reads before writing them and the memory cells it reads before writing them
+# (its inputs; these include the bytes of its instructions and the return address cell
+# 0xFF that RET reads), and the registers, flags and memory cells it writes (its effects).
+# When CALL later enters the routine with the same input registers and all recorded input
+# cells still hold their recorded values, the effects are replayed instead of executing
+# the routine. The step and cycle counters advance by the recorded amounts, so a memoized
+# run ends in exactly the state and with the counts of a plain run.
+#
+# Entries are keyed by the routine's address, the return address and the values of the
+# registers the routine read in any of its recordings. An entry whose input cells changed
+# (data the routine read, or its code) is dropped on its next lookup and recorded again.
+# The number of entries is bounded; the least recently used entry is evicted first.
+# Recording is slower than plain execution, so memoization pays off for routines that are
+# called again and again with the same inputs.
+
+from collections import OrderedDict, namedtuple
+
+from alu import ALU_OPCODES
+from simple_cpu_emulator import TALLY_SHIFT, TALLY_STEPS, RunOutcome
+
+CALL, RET = 0x30, 0x31
+RETURN_ADDRESS_CELL = 0xFF
+
+DEFAULT_CAPACITY = 1024
+# Routines running longer than this are not recorded (they run normally)
+MAX_RECORDED_STEPS = 10_000
+
+# Registers by index: A, B, C and the flags (status byte)
+REGISTERS = "ABCF"
+
+
+def _register_effects():
+    """{opcode: (indices of the registers read, indices of the registers written)}"""
+    effects = {}
+    for code, dest, operation, first, second in ALU_OPCODES:
+        reads = first + (second if second in ("A", "B", "C") else "") + ("F" if operation in ("ADC", "SUC") else "")
+        effects[code] = (reads, (dest or "") + "F")
+    effects[0x16] = ("A", "AF")                                     # CMA
+    for code, (dest, source) in zip(range(0x1A, 0x20), ["AB", "AC", "BA", "BC", "CA", "CB"]):
+        effects[code] = (source, dest)                              # MOV
+    for code, dest in zip(range(0x20, 0x23), "ABC"):
+        effects[code] = ("", dest)                                  # MVI
+    for code, dest in zip(range(0x23, 0x26), "ABC"):
+        effects[code] = ("", dest)                                  # LDA / LDB / LDC
+    effects[0x26] = ("A", "")                                       # STA
+    effects[0x29] = ("C", "A")                                      # LDA C
+    effects[0x2A] = ("AC", "")                                      # STA C
+    for code in range(0x2C, 0x30):
+        effects[code] = ("F", "")                                   # JS / JZ / JC / JV
+    return {code: (tuple(map(REGISTERS.index, reads)), tuple(map(REGISTERS.index, writes)))
+            for code, (reads, writes) in effects.items()}
+
+# Opcodes missing here (JMP, CALL, RET, NOP, HLT) neither read nor write registers
+REGISTER_EFFECTS = _register_effects()
+
+# One recorded invocation. inputs / writes: ((address, value), ...) of the cells read
+# before being written and of the cells written; registers: ((index, value), ...) of the
+# registers written (see REGISTERS); ip: the address RET returned to
+MemoEntry = namedtuple("MemoEntry", ["inputs", "registers", "writes", "ip", "steps", "cycles"])
+
+
+class CallMemo:
+    """
+    Records and replays the routines entered through CALL (see the module comment).
+    capacity: maximum number of recorded invocations.
+    A CallMemo can be shared by several emulators (e.g. forks) with the same cycle costs.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.entries = OrderedDict()        # key -> MemoEntry, least recently used first
+        self.declined = set()               # routines that halted, left memory or ran too long
+        self.signatures = {}                # routine address -> indices of its input registers
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.replayed_steps = 0
+
+    def attach(self, emulator):
+        """Memoize the routines in emulator's run_full. Returns self."""
+        emulator.memo = self
+        return self
+
+    def clear(self):
+        """Forget all recordings."""
+        self.entries.clear()
+        self.declined.clear()
+        self.signatures.clear()
+
+    def stats(self):
+        """Hit/miss statistics and the number of entries."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "replayed_steps": self.replayed_steps,
+        }
+
+    def run(self, emulator, max_steps=None):
+        """Run emulator like run_full(max_steps) (see there) and return a RunOutcome."""
+        decoded = emulator._predecoded()
+        decode = emulator._decode
+        size = len(emulator.memory)
+        call = emulator._dispatch[CALL]
+        entered = 0         # steps of the routines recorded or replayed
+        tallies = 0         # of the other instructions (see SimpleCPUEmulator._decode)
+        try:
+            while not emulator.halted:
+                ip = emulator.ip
+                if not 0 <= ip < size:
+                    break
+                if max_steps is not None and entered + (tallies & TALLY_STEPS) >= max_steps:
+                    return RunOutcome("step_budget", entered + (tallies & TALLY_STEPS), None)
+                operation, operand, length, tally = decoded[ip] or decode(ip)
+                emulator.ip = ip + length
+                operation(emulator, operand)
+                tallies += tally
+                if operation is call:
+                    remaining = None if max_steps is None else max_steps - entered - (tallies & TALLY_STEPS)
+                    entered += self._enter(emulator, remaining)
+        finally:
+            emulator.steps += tallies & TALLY_STEPS
+            emulator.cycles += tallies >> TALLY_SHIFT
+        return RunOutcome("halted" if emulator.halted else "ip_out_of_range", entered + (tallies & TALLY_STEPS), None)
+
+    def _enter(self, emulator, remaining):
+        """
+        Right after a CALL: replay the routine at the IP or record it.
+        remaining: the steps left in the run's budget (None: no budget).
+        Returns the number of steps executed or replayed.
+        """
+        entry = emulator.ip
+        if entry in self.declined:
+            return 0
+        memory = emulator.memory
+        values = (emulator.register_A, emulator.register_B, emulator.register_C, emulator.flags)
+        key = (entry, memory[RETURN_ADDRESS_CELL]) + tuple(values[index] for index in self.signatures.get(entry, ()))
+        recorded = self.entries.get(key)
+        if recorded is not None:
+            if all(memory[address] == value for address, value in recorded.inputs):
+                if remaining is not None and recorded.steps > remaining:
+                    return 0        # the budget ends inside the routine: execute it
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self._replay(emulator, recorded)
+            del self.entries[key]
+            self.invalidations += 1
+        self.misses += 1
+        return self._record(emulator, values, MAX_RECORDED_STEPS if remaining is None
+                            else min(remaining, MAX_RECORDED_STEPS))
+
+    def _replay(self, emulator, recorded):
+        memory = emulator.memory
+        for address, value in recorded.writes:
+            if memory[address] != value:
+                emulator.write_memory(address, value)
+        for index, value in recorded.registers:
+            if index == 0:
+                emulator.register_A = value
+            elif index == 1:
+                emulator.register_B = value
+            elif index == 2:
+                emulator.register_C = value
+            else:
+                emulator.flags = value
+        emulator.ip = recorded.ip
+        emulator.steps += recorded.steps
+        emulator.cycles += recorded.cycles
+        self.replayed_steps += recorded.steps
+        return recorded.steps
+
+    def _record(self, emulator, values, limit):
+        """
+        Execute the routine at the IP up to its RET (at most limit steps) and store a
+        MemoEntry. values: the registers and flags (see REGISTERS) when CALL entered it.
+        """
+        entry = emulator.ip
+        return_address = emulator.memory[RETURN_ADDRESS_CELL]
+        memory = emulator.memory
+        decoded = emulator._predecoded()
+        decode = emulator._decode
+        lengths = emulator.opcode_lengths
+        memory_accesses = emulator.memory_accesses
+        size = len(memory)
+        inputs = {}         # address -> value before the routine wrote it, in order of reading
+        written = set()
+        register_inputs = set()
+        registers_written = set()
+        steps = 0
+        tallies = 0
+        try:
+            while True:
+                ip = emulator.ip
+                if emulator.halted or not 0 <= ip < size or steps >= MAX_RECORDED_STEPS:
+                    self.declined.add(entry)
+                    return steps
+                if steps >= limit:
+                    return steps
+                opcode = memory[ip]
+                for address in range(ip, min(ip + lengths.get(opcode, 1), size)):
+                    if address not in written:
+                        inputs.setdefault(address, memory[address])
+                read, write = memory_accesses(ip)
+                if read is not None and read not in written:
+                    inputs.setdefault(read, memory[read])
+                reads, writes = REGISTER_EFFECTS.get(opcode, ((), ()))
+                register_inputs.update(index for index in reads if index not in registers_written)
+                operation, operand, length, tally = decoded[ip] or decode(ip)
+                emulator.ip = ip + length
+                operation(emulator, operand)
+                tallies += tally
+                steps += 1
+                if write is not None:
+                    written.add(write)
+                registers_written.update(writes)
+                if opcode == RET:
+                    break
+        finally:
+            emulator.steps += steps
+            emulator.cycles += tallies >> TALLY_SHIFT
+
+        # The key holds the registers any recording of the routine read
+        signature = tuple(sorted(register_inputs.union(self.signatures.get(entry, ()))))
+        self.signatures[entry] = signature
+        final = (emulator.register_A, emulator.register_B, emulator.register_C, emulator.flags)
+        key = (entry, return_address) + tuple(values[index] for index in signature)
+        self.entries[key] = MemoEntry(
+            tuple(inputs.items()),
+            tuple((index, final[index]) for index in sorted(registers_written)),
+            tuple((address, memory[address]) for address in sorted(written)),
+            emulator.ip, steps, tallies >> TALLY_SHIFT,
+        )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return steps
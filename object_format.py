@@ -0,0 +1,201 @@
+# object_format.py
+#
+# Binary object files and Intel HEX files for assembled programs.
+# An object file holds everything the assembler knows about a program, so it can be run
+# (or debugged with labels) without assembling again:
+#
+#   header      magic "SCPUOBJ1", image size, number of segments, number of symbols
+#   image       the raw memory image (image size bytes, what read_into_memory loads)
+#   segments    (start, length) of every contiguous run of emitted bytes (ORG blocks)
+#   symbols     name length, name (UTF-8), address for every label
+#   source map  one 32-bit source line number per image byte (0 where nothing was emitted)
+#
+# All numbers are little-endian. The image comes right after the fixed-size header, so a
+# loader can map the file and copy the image out of the mapping in one slice assignment.
+# Intel HEX files only carry the segments (data records of up to 16 bytes and an end record).
+
+import contextlib
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+OBJECT_MAGIC = b"SCPUOBJ1"
+
+# magic, image size, number of segments, number of symbols
+HEADER = struct.Struct("<8sHHH")
+# start address, length
+SEGMENT = struct.Struct("<HH")
+# address (after the length-prefixed name)
+SYMBOL_ADDRESS = struct.Struct("<H")
+
+# Data bytes per Intel HEX record
+HEX_RECORD_BYTES = 16
+
+# The contents of an object file. image is a bytes object, symbols maps label -> address,
+# source_map is an array("I") of source line numbers.
+ObjectFile = namedtuple("ObjectFile", ["image", "segments", "symbols", "source_map"])
+
+
+def segments_of(source_map):
+    """[(start, length)] of the contiguous runs of emitted bytes (non-zero source map entries)."""
+    segments = []
+    start = None
+    for address, line in enumerate(source_map):
+        if line and start is None:
+            start = address
+        elif not line and start is not None:
+            segments.append((start, address - start))
+            start = None
+    if start is not None:
+        segments.append((start, len(source_map) - start))
+    return segments
+
+
+def _source_map_bytes(source_map):
+    lines = array("I", source_map)
+    if sys.byteorder == "big":
+        lines.byteswap()
+    return lines.tobytes()
+
+
+def write_object(path, image, source_map, symbols):
+    """Write an object file for image (bytes-like) with its source map and symbol table."""
+    segments = segments_of(source_map)
+    parts = [HEADER.pack(OBJECT_MAGIC, len(image), len(segments), len(symbols)), bytes(image)]
+    parts += [SEGMENT.pack(start, length) for start, length in segments]
+    for name, address in symbols.items():
+        encoded = name.encode()
+        if len(encoded) > 0xFF:
+            raise ValueError(f"Label too long for an object file: {name!r}")
+        parts.append(bytes([len(encoded)]) + encoded + SYMBOL_ADDRESS.pack(address))
+    parts.append(_source_map_bytes(source_map))
+    with open(path, "wb") as f:
+        f.write(b"".join(parts))
+
+
+def _check_header(data, path):
+    if len(data) < HEADER.size:
+        raise ValueError(f"Not an object file: {path!r}")
+    magic, image_size, segment_count, symbol_count = HEADER.unpack_from(data)
+    if magic != OBJECT_MAGIC or len(data) < HEADER.size + image_size:
+        raise ValueError(f"Not an object file: {path!r}")
+    return image_size, segment_count, symbol_count
+
+
+def read_object(path):
+    """Read an object file completely into an ObjectFile."""
+    with open(path, "rb") as f:
+        data = f.read()
+    image_size, segment_count, symbol_count = _check_header(data, path)
+    offset = HEADER.size
+    image = data[offset:offset + image_size]
+    offset += image_size
+    symbols = {}
+    try:
+        segments = [SEGMENT.unpack_from(data, offset + i * SEGMENT.size) for i in range(segment_count)]
+        offset += segment_count * SEGMENT.size
+        for _ in range(symbol_count):
+            length = data[offset]
+            name = data[offset + 1:offset + 1 + length].decode()
+            offset += 1 + length
+            symbols[name] = SYMBOL_ADDRESS.unpack_from(data, offset)[0]
+            offset += SYMBOL_ADDRESS.size
+        source_map = array("I")
+        source_map.frombytes(data[offset:offset + image_size * source_map.itemsize])
+    except (IndexError, struct.error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Truncated object file: {path!r}") from None
+    if len(source_map) != image_size:
+        raise ValueError(f"Truncated object file: {path!r}")
+    if sys.byteorder == "big":
+        source_map.byteswap()
+    return ObjectFile(image, [tuple(segment) for segment in segments], symbols, source_map)
+
+
+def write_intel_hex(path, image, segments):
+    """Write the given segments of image as an Intel HEX file."""
+    lines = []
+    for start, length in segments:
+        for address in range(start, start + length, HEX_RECORD_BYTES):
+            data = bytes(image[address:min(address + HEX_RECORD_BYTES, start + length)])
+            record = bytes([len(data), address >> 8, address & 0xFF, 0x00]) + data
+            checksum = -sum(record) & 0xFF
+            lines.append(f":{record.hex().upper()}{checksum:02X}")
+    lines.append(":00000001FF")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_intel_hex(path):
+    """Read an Intel HEX file; returns (image as bytearray, segments)."""
+    with open(path, "rb") as f:
+        return _parse_intel_hex(f.read())
+
+
+def _parse_intel_hex(data):
+    chunks = []
+    for number, line in enumerate(data.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if not line.startswith(b":"):
+                raise ValueError
+            record = bytes.fromhex(line[1:].decode("ascii"))
+            if len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid Intel HEX record in line {number}: {line!r}") from None
+        kind = record[3]
+        if kind == 0x01:
+            break
+        if kind != 0x00:
+            raise ValueError(f"Unsupported Intel HEX record type {kind:02X} in line {number}")
+        chunks.append(((record[1] << 8) | record[2], record[4:-1]))
+
+    size = max((address + len(data) for address, data in chunks), default=0)
+    image = bytearray(size)
+    segments = []
+    for address, data in sorted(chunks):
+        image[address:address + len(data)] = data
+        if segments and segments[-1][0] + segments[-1][1] == address:
+            segments[-1] = (segments[-1][0], segments[-1][1] + len(data))
+        else:
+            segments.append((address, len(data)))
+    return image, segments
+
+
+@contextlib.contextmanager
+def mapped_image(path):
+    """
+    A memoryview of the image of an object file (or of the data of an Intel HEX file).
+    Object files are memory-mapped and the view points into the mapping, so copying it
+    into memory is a single slice assignment; the view is only valid inside the with block.
+    """
+    with open(path, "rb") as f:
+        if f.read(1) == b":":
+            f.seek(0)
+            image, _segments = _parse_intel_hex(f.read())
+            mapping = None
+        else:
+            try:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:      # empty file
+                raise ValueError(f"Not an object file: {path!r}") from None
+    if mapping is None:
+        yield memoryview(image)
+        return
+    try:
+        view = memoryview(mapping)
+        try:
+            image_size = _check_header(view, path)[0]
+            image = view[HEADER.size:HEADER.size + image_size]
+            try:
+                yield image
+            finally:
+                image.release()
+        finally:
+            view.release()
+    finally:
+        mapping.close()
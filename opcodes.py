@@ -2,411 +2,238 @@
 
 # Import the Emulator class
 from simple_cpu_emulator import SimpleCPUEmulator
-
-def opcode(code):
-    def decorator(func):
-        SimpleCPUEmulator.dispatch_table[code] = func
-        return func
-    return decorator
+from alu import ALU_ADC, ALU_ADD, ALU_AND, ALU_CMA, ALU_OR, ALU_SUB, ALU_SUC, ALU_XOR
+from alu import FLAG_C, FLAG_S, FLAG_V, FLAG_Z
+
+# Every handler is called as handler(emulator, operand) by the execution cycle, which has
+# already fetched the operand byte of two-byte instructions (None for one-byte instructions)
+# and advanced the instruction pointer to the next instruction.
+# Handlers are registered with SimpleCPUEmulator.opcode(code, name, length=1, reads=None,
+# writes=None, cycles=None, group=None):
+# name:   the mnemonic reported to an attached trace sink
+# length: instruction length in bytes (opcode plus optional operand byte)
+# reads / writes: the memory cell the instruction reads or writes, if any:
+#         "operand" (the address operand), "C" (the address in register C) or a fixed address
+# cycles: cycle cost (default: one per byte fetched plus one per memory access)
+# group:  "alu", "memory", "branch" or "other" (default: "memory" if it accesses memory)
+opcode = SimpleCPUEmulator.opcode
 
 ################
 ### Arithmetic
 ################
 
-@opcode(0x02)
-def opcode_ADD_B(self):
-    print("Executing opcode: ADD B")
-    op1 = self.register_A
-    op2 = self.register_B
-    total = op1 + op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags with the original operands for addition.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x03)
-def opcode_ADD_C(self):
-    print("Executing opcode: ADD C")
-    op1 = self.register_A
-    op2 = self.register_C
-    total = op1 + op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags with the original operands for addition.
-    self.update_flags(total, result, op1, op2)
+# Every ALU opcode is a single lookup in the precomputed tables of alu.py.
+# An entry packs the 8-bit result and the status byte: entry = result | (flags << 8)
+
+@opcode(0x02, "ADD B", group="alu")
+def opcode_ADD_B(self, operand):
+    packed = ALU_ADD[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x03, "ADD C", group="alu")
+def opcode_ADD_C(self, operand):
+    packed = ALU_ADD[(self.register_A << 8) | self.register_C]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
 
 # Add with carry. Necessary when doing multi-byte additions
-@opcode(0x04)
-def opcode_ADC_B(self):
-    print("Executing opcode: ADC B")
-    op1 = self.register_A
-    op2 = self.register_B
-    total = op1 + op2 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags with the original operands for addition.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x05)
-def opcode_SUB_B(self):
-    print("Executing opcode: SUB B")
-    op1 = self.register_A
-    # Compute two's complement of register_B.
-    neg_B = (~self.register_B) & 0xFF
-    total = op1 + neg_B + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_B)
-
-@opcode(0x06)
-def opcode_SUB_C(self):
-    print("Executing opcode: SUB C")
-    op1 = self.register_A
-    # Compute two's complement of register_C.
-    neg_C = (~self.register_C) & 0xFF
-    total = op1 + neg_C + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_C)
+@opcode(0x04, "ADC B", group="alu")
+def opcode_ADC_B(self, operand):
+    packed = ALU_ADC[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+# Subtraction adds the two's complement of the second operand (see alu.py)
+@opcode(0x05, "SUB B", group="alu")
+def opcode_SUB_B(self, operand):
+    packed = ALU_SUB[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x06, "SUB C", group="alu")
+def opcode_SUB_C(self, operand):
+    packed = ALU_SUB[(self.register_A << 8) | self.register_C]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
 
 # Subtract with borrow. Necessary when doing multi-byte subtractions
-@opcode(0x07)
-def opcode_SUC_B(self):
-    print("Executing opcode: SUC B")
-    op1 = self.register_A
-    # Compute two's complement of register_B.
-    neg_B = (~self.register_B) & 0xFF
-    total = op1 + neg_B # borrow is taken into account
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_B)
-
-@opcode(0x08)
-def opcode_CMP(self):
-    print("Executing opcode: CMP")
-    op1 = self.register_A
-    # Compute two's complement of register_B.
-    neg_B = (~self.register_B) & 0xFF
-    total = op1 + neg_B + 1
-    result = total & 0xFF  # Truncate to 8 bits.
+@opcode(0x07, "SUC B", group="alu")
+def opcode_SUC_B(self, operand):
+    packed = ALU_SUC[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x08, "CMP", group="alu")
+def opcode_CMP(self, operand):
     # Discard the result, just compute the flags
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_B)
-
-@opcode(0x09)
-def opcode_INR_A(self):
-    print("Executing opcode: INR A")
-    op1 = self.register_A
-    total = op1 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags with the original operands for addition.
-    self.update_flags(total, result, op1, 1)
-
-@opcode(0x0A)
-def opcode_INR_B(self):
-    print("Executing opcode: INR B")
-    op1 = self.register_B
-    total = op1 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_B = result
-
-    # Update flags with the original operands for addition.
-    self.update_flags(total, result, op1, 1)
-
-@opcode(0x0B)
-def opcode_INR_C(self):
-    print("Executing opcode: INR C")
-    op1 = self.register_C
-    total = op1 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_C = result
-
-    # Update flags with the original operands for addition.
-    self.update_flags(total, result, op1, 1)
-
-@opcode(0x0C)
-def opcode_DCR_A(self):
-    print("Executing opcode: DCR A")
-    op1 = self.register_A
-    op2 = 1
-    # Compute two's complement of op2.
-    neg_2 = (~op2) & 0xFF
-    total = op1 + neg_2 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_2)
-
-@opcode(0x0D)
-def opcode_DCR_B(self):
-    print("Executing opcode: DCR B")
-    op1 = self.register_B
-    op2 = 1
-    # Compute two's complement of op2.
-    neg_2 = (~op2) & 0xFF
-    total = op1 + neg_2 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_B = result
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_2)
-
-@opcode(0x0E)
-def opcode_DCR_C(self):
-    print("Executing opcode: DCR C")
-    op1 = self.register_C
-    op2 = 1
-    # Compute two's complement of op2.
-    neg_2 = (~op2) & 0xFF
-    total = op1 + neg_2 + 1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_C = result
-
-    # Update flags passing op1 and neg_B (i.e., the effective second operand).
-    self.update_flags(total, result, op1, neg_2)
+    self.flags = ALU_SUB[(self.register_A << 8) | self.register_B] >> 8
+
+@opcode(0x09, "INR A", group="alu")
+def opcode_INR_A(self, operand):
+    packed = ALU_ADD[(self.register_A << 8) | 1]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x0A, "INR B", group="alu")
+def opcode_INR_B(self, operand):
+    packed = ALU_ADD[(self.register_B << 8) | 1]
+    self.register_B = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x0B, "INR C", group="alu")
+def opcode_INR_C(self, operand):
+    packed = ALU_ADD[(self.register_C << 8) | 1]
+    self.register_C = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x0C, "DCR A", group="alu")
+def opcode_DCR_A(self, operand):
+    packed = ALU_SUB[(self.register_A << 8) | 1]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x0D, "DCR B", group="alu")
+def opcode_DCR_B(self, operand):
+    packed = ALU_SUB[(self.register_B << 8) | 1]
+    self.register_B = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x0E, "DCR C", group="alu")
+def opcode_DCR_C(self, operand):
+    packed = ALU_SUB[(self.register_C << 8) | 1]
+    self.register_C = packed & 0xFF
+    self.flags = packed >> 8
 
 ###########
 ### Logic
 ###########
 
-@opcode(0x0F)
-def opcode_ANA_B(self):
-    print("Executing opcode: ANA B")
-    op1 = self.register_A
-    op2 = self.register_B
-    total = op1 & op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x10)
-def opcode_ANA_C(self):
-    print("Executing opcode: ANA C")
-    op1 = self.register_A
-    op2 = self.register_C
-    total = op1 & op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x11)
-def opcode_TST(self):
-    print("Executing opcode: TST")
-    op1 = self.register_A
-    op2 = self.register_B
-    total = op1 & op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    # Discard the result, just compute the flags
+@opcode(0x0F, "ANA B", group="alu")
+def opcode_ANA_B(self, operand):
+    packed = ALU_AND[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x10, "ANA C", group="alu")
+def opcode_ANA_C(self, operand):
+    packed = ALU_AND[(self.register_A << 8) | self.register_C]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
 
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x12)
-def opcode_ORA_B(self):
-    print("Executing opcode: ORA B")
-    op1 = self.register_A
-    op2 = self.register_B
-    total = op1 | op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x13)
-def opcode_ORA_C(self):
-    print("Executing opcode: ORA C")
-    op1 = self.register_A
-    op2 = self.register_C
-    total = op1 | op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x14)
-def opcode_XRA_B(self):
-    print("Executing opcode: XRA B")
-    op1 = self.register_A
-    op2 = self.register_B
-    total = op1 ^ op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x15)
-def opcode_XRA_C(self):
-    print("Executing opcode: XRA C")
-    op1 = self.register_A
-    op2 = self.register_C
-    total = op1 ^ op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x16)
-def opcode_CMA(self):
-    print("Executing opcode: CMA")
-    op1 = self.register_A
-    op2 = 0x00
-    total = ~op1
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
-
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x17)
-def opcode_ANI(self):
-    print("Executing opcode: ANI Byte")
+@opcode(0x11, "TST", group="alu")
+def opcode_TST(self, operand):
+    # Discard the result, just compute the flags
+    self.flags = ALU_AND[(self.register_A << 8) | self.register_B] >> 8
+
+@opcode(0x12, "ORA B", group="alu")
+def opcode_ORA_B(self, operand):
+    packed = ALU_OR[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x13, "ORA C", group="alu")
+def opcode_ORA_C(self, operand):
+    packed = ALU_OR[(self.register_A << 8) | self.register_C]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x14, "XRA B", group="alu")
+def opcode_XRA_B(self, operand):
+    packed = ALU_XOR[(self.register_A << 8) | self.register_B]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x15, "XRA C", group="alu")
+def opcode_XRA_C(self, operand):
+    packed = ALU_XOR[(self.register_A << 8) | self.register_C]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x16, "CMA", group="alu")
+def opcode_CMA(self, operand):
+    packed = ALU_CMA[self.register_A]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x17, "ANI Byte", length=2, group="alu")
+def opcode_ANI(self, operand):
     # The argument of this opcode is the immediate value with which we want to perform a logical AND
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
-    # This operation is not memory safe: no checks are done on the validity of the address
-    op1 = self.register_A
-    op2 = self.memory[self.ip]   # The immediate value Byte
-    total = op1 & op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
- 
-    # We need to advance the instruction pointer
-    self.ip += 1
- 
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x18)
-def opcode_ORI(self):
-    print("Executing opcode: ORI Byte")
+    # The execution cycle passes it as operand, the instruction pointer already points past it
+    packed = ALU_AND[(self.register_A << 8) | operand]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x18, "ORI Byte", length=2, group="alu")
+def opcode_ORI(self, operand):
     # The argument of this opcode is the immediate value with which we want to perform a logical OR
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
-    # This operation is not memory safe: no checks are done on the validity of the address
-    op1 = self.register_A
-    op2 = self.memory[self.ip]   # The immediate value Byte
-    total = op1 | op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
- 
-    # We need to advance the instruction pointer
-    self.ip += 1
- 
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
-
-@opcode(0x19)
-def opcode_XRI(self):
-    print("Executing opcode: XRI Byte")
+    # The execution cycle passes it as operand, the instruction pointer already points past it
+    packed = ALU_OR[(self.register_A << 8) | operand]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
+
+@opcode(0x19, "XRI Byte", length=2, group="alu")
+def opcode_XRI(self, operand):
     # The argument of this opcode is the immediate value with which we want to perform a logical XOR
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
-    # This operation is not memory safe: no checks are done on the validity of the address
-    op1 = self.register_A
-    op2 = self.memory[self.ip]   # The immediate value Byte
-    total = op1 ^ op2
-    result = total & 0xFF  # Truncate to 8 bits.
-    self.register_A = result
- 
-    # We need to advance the instruction pointer
-    self.ip += 1
- 
-    # Update flags passing op1 and op2.
-    self.update_flags(total, result, op1, op2)
+    # The execution cycle passes it as operand, the instruction pointer already points past it
+    packed = ALU_XOR[(self.register_A << 8) | operand]
+    self.register_A = packed & 0xFF
+    self.flags = packed >> 8
 
 
 ##########################
 ### Register to register
 ##########################
 
-@opcode(0x1A)
-def opcode_MOV_A_B(self):
-    print("Executing opcode: MOV A B")
+@opcode(0x1A, "MOV A B")
+def opcode_MOV_A_B(self, operand):
     self.register_A = (self.register_B) & 0xFF
     # No flags are updated
 
-@opcode(0x1B)
-def opcode_MOV_A_C(self):
-    print("Executing opcode: MOV A C")
+@opcode(0x1B, "MOV A C")
+def opcode_MOV_A_C(self, operand):
     self.register_A = (self.register_C) & 0xFF
     # No flags are updated
 
-@opcode(0x1C)
-def opcode_MOV_B_A(self):
-    print("Executing opcode: MOV B A")
+@opcode(0x1C, "MOV B A")
+def opcode_MOV_B_A(self, operand):
     self.register_B = (self.register_A) & 0xFF
     # No flags are updated
 
-@opcode(0x1D)
-def opcode_MOV_B_C(self):
-    print("Executing opcode: MOV B C")
+@opcode(0x1D, "MOV B C")
+def opcode_MOV_B_C(self, operand):
     self.register_B = (self.register_C) & 0xFF
     # No flags are updated
 
-@opcode(0x1E)
-def opcode_MOV_C_A(self):
-    print("Executing opcode: MOV C A")
+@opcode(0x1E, "MOV C A")
+def opcode_MOV_C_A(self, operand):
     self.register_C = (self.register_A) & 0xFF
     # No flags are updated
 
-@opcode(0x1F)
-def opcode_MOV_C_B(self):
-    print("Executing opcode: MOV C B")
+@opcode(0x1F, "MOV C B")
+def opcode_MOV_C_B(self, operand):
     self.register_C = (self.register_B) & 0xFF
     # No flags are updated
 
-@opcode(0x20)
-def opcode_MVI_A_Byte(self):
-    print("Executing opcode: MVI A Byte")
+@opcode(0x20, "MVI A Byte", length=2)
+def opcode_MVI_A_Byte(self, operand):
     # The argument of this opcode is the immediate value which we want to copy into A
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
-    # This operation is not memory safe: no checks are done on the validity of the address    
-    self.register_A = self.memory[self.ip] & 0xFF
-
-    # We need to advance the instruction pointer
-    self.ip += 1
+    # The execution cycle passes it as operand, the instruction pointer already points past it
+    self.register_A = operand & 0xFF
     # No flags are updated
 
-@opcode(0x21)
-def opcode_MVI_B_Byte(self):
-    print("Executing opcode: MVI B Byte")
+@opcode(0x21, "MVI B Byte", length=2)
+def opcode_MVI_B_Byte(self, operand):
     # The argument of this opcode is the immediate value which we want to copy into B
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
-    # This operation is not memory safe: no checks are done on the validity of the address    
-    self.register_B = self.memory[self.ip] & 0xFF
-
-    # We need to advance the instruction pointer
-    self.ip += 1
+    # The execution cycle passes it as operand, the instruction pointer already points past it
+    self.register_B = operand & 0xFF
     # No flags are updated
 
-@opcode(0x22)
-def opcode_MVI_C_Byte(self):
-    print("Executing opcode: MVI C Byte")
+@opcode(0x22, "MVI C Byte", length=2)
+def opcode_MVI_C_Byte(self, operand):
     # The argument of this opcode is the immediate value which we want to copy into C
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
-    # This operation is not memory safe: no checks are done on the validity of the address    
-    self.register_C = self.memory[self.ip] & 0xFF
-
-    # We need to advance the instruction pointer
-    self.ip += 1
+    # The execution cycle passes it as operand, the instruction pointer already points past it
+    self.register_C = operand & 0xFF
     # No flags are updated
 
 
@@ -414,68 +241,51 @@ def opcode_MVI_C_Byte(self):
 ### Memory access
 ###################
 
-@opcode(0x23)
-def opcode_LDA_Address(self):
-    print("Executing opcode: LDA Address")
+@opcode(0x23, "LDA Address", length=2, reads="operand")
+def opcode_LDA_Address(self, operand):
     # The argument of this opcode is the memory address from which we want to read.
-    # The instruction pointer should point to the argument
+    # The execution cycle passes it as operand
     # This operation is not memory safe: no checks are done on the validity of the address
-    address = self.memory[self.ip]
-    self.register_A = self.memory[address]
-    # We need to advance the instruction pointer
-    self.ip += 1
+    self.register_A = self.memory[operand]
     # No flags are updated
 
-@opcode(0x24)
-def opcode_LDB_Address(self):
-    print("Executing opcode: LDB Address")
+@opcode(0x24, "LDB Address", length=2, reads="operand")
+def opcode_LDB_Address(self, operand):
     # The argument of this opcode is the memory address from which we want to read.
-    # The instruction pointer should point to the argument
+    # The execution cycle passes it as operand
     # This operation is not memory safe: no checks are done on the validity of the address
-    address = self.memory[self.ip]
-    self.register_B = self.memory[address]
-    # We need to advance the instruction pointer
-    self.ip += 1
+    self.register_B = self.memory[operand]
     # No flags are updated
 
-@opcode(0x25)
-def opcode_LDC_Address(self):
-    print("Executing opcode: LDC Address")
+@opcode(0x25, "LDC Address", length=2, reads="operand")
+def opcode_LDC_Address(self, operand):
     # The argument of this opcode is the memory address from which we want to read.
-    # The instruction pointer should point to the argument
+    # The execution cycle passes it as operand
     # This operation is not memory safe: no checks are done on the validity of the address
-    address = self.memory[self.ip]
-    self.register_C = self.memory[address]
-    # We need to advance the instruction pointer
-    self.ip += 1
+    self.register_C = self.memory[operand]
     # No flags are updated
 
-@opcode(0x26)
-def opcode_STA_Address(self):
-    print("Executing opcode: STA Address")
+@opcode(0x26, "STA Address", length=2, writes="operand")
+def opcode_STA_Address(self, operand):
     # The argument of this opcode is the memory address to which we want to write.
-    # The instruction pointer should point to the argument
+    # The execution cycle passes it as operand
     # This operation is not memory safe: no checks are done on the validity of the address
-    address = self.memory[self.ip]
-    self.memory[address] = self.register_A
-    # We need to advance the instruction pointer
-    self.ip += 1
+    # Writes go through write_memory, which invalidates predecoded instructions at the address
+    self.write_memory(operand, self.register_A)
     # No flags are updated
 
-@opcode(0x29)
-def opcode_LDA_C(self):
-    print("Executing opcode: LDA C")
+@opcode(0x29, "LDA C", reads="C")
+def opcode_LDA_C(self, operand):
     # This operation is not memory safe: no checks are done on the validity of the address in register C
     address = self.register_C
     self.register_A = self.memory[address]
     # No flags are updated
 
-@opcode(0x2A)
-def opcode_STA_C(self):
-    print("Executing opcode: STA C")
+@opcode(0x2A, "STA C", writes="C")
+def opcode_STA_C(self, operand):
     # This operation is not memory safe: no checks are done on the validity of the address in register C
     address = self.register_C
-    self.memory[address] = self.register_A
+    self.write_memory(address, self.register_A)
     # No flags are updated
 
 
@@ -483,87 +293,66 @@ def opcode_STA_C(self):
 ### Branches
 ##############
 
-@opcode(0x2B)
-def opcode_JMP(self):
-    print("Executing opcode: JMP Address")
+@opcode(0x2B, "JMP Address", length=2, group="branch")
+def opcode_JMP(self, operand):
     # The argument of this opcode is the memory address to which we want to jump.
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
+    # The execution cycle passes it as operand
     # This operation is not memory safe: no checks are done on the validity of the address
-    address = self.memory[self.ip]
-    self.ip = address
+    self.ip = operand
     # No flags are updated
 
-@opcode(0x2C)
-def opcode_JS(self):
-    print("Executing opcode: JS Address")
+@opcode(0x2C, "JS Address", length=2, group="branch")
+def opcode_JS(self, operand):
     # The argument of this opcode is the memory address to which we want to jump.
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
+    # The execution cycle passes it as operand, the instruction pointer already points past it
     # This operation is not memory safe: no checks are done on the validity of the address
-    if self.flag_S == 1:
-        address = self.memory[self.ip]
-        self.ip = address
-    else:
-        self.ip += 1
+    if self.flags & FLAG_S:
+        self.ip = operand
     # No flags are updated
 
-@opcode(0x2D)
-def opcode_JZ(self):
-    print("Executing opcode: JZ Address")
+@opcode(0x2D, "JZ Address", length=2, group="branch")
+def opcode_JZ(self, operand):
     # The argument of this opcode is the memory address to which we want to jump.
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
+    # The execution cycle passes it as operand, the instruction pointer already points past it
     # This operation is not memory safe: no checks are done on the validity of the address
-    if self.flag_Z == 1:
-        address = self.memory[self.ip]
-        self.ip = address
-    else:
-        self.ip += 1
+    if self.flags & FLAG_Z:
+        self.ip = operand
     # No flags are updated
 
-@opcode(0x2E)
-def opcode_JC(self):
-    print("Executing opcode: JC Address")
+@opcode(0x2E, "JC Address", length=2, group="branch")
+def opcode_JC(self, operand):
     # The argument of this opcode is the memory address to which we want to jump.
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
+    # The execution cycle passes it as operand, the instruction pointer already points past it
     # This operation is not memory safe: no checks are done on the validity of the address
-    if self.flag_C == 1:
-        address = self.memory[self.ip]
-        self.ip = address
-    else:
-        self.ip += 1
+    if self.flags & FLAG_C:
+        self.ip = operand
     # No flags are updated
 
-@opcode(0x2F)
-def opcode_JV(self):
-    print("Executing opcode: JV Address")
+@opcode(0x2F, "JV Address", length=2, group="branch")
+def opcode_JV(self, operand):
     # The argument of this opcode is the memory address to which we want to jump.
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
+    # The execution cycle passes it as operand, the instruction pointer already points past it
     # This operation is not memory safe: no checks are done on the validity of the address
-    if self.flag_V == 1:
-        address = self.memory[self.ip]
-        self.ip = address
-    else:
-        self.ip += 1
+    if self.flags & FLAG_V:
+        self.ip = operand
     # No flags are updated
 
 ##########################
 ### Call methods
 ##########################
 
-@opcode(0x30)
-def opcode_CALL(self):
-    print("Executing opcode: CALL Address")
+@opcode(0x30, "CALL Address", length=2, writes=0xFF, group="branch")
+def opcode_CALL(self, operand):
     # The argument of this opcode is the memory address where the routine is found
-    # The instruction pointer should point to the argument (correct value set by the execution cycle)
+    # The execution cycle passes it as operand, the instruction pointer already points to
+    # the next instruction: the address where we want to return to
     # This operation is not memory safe: no checks are done on the validity of the address
-    address = self.memory[self.ip]      # The address where the routine is
-    self.ip += 1                        # The address whre we want to return to
-    self.memory[0xFF] = self.ip         # Store the return address at 0xFF
-    self.ip = address                   # Jump to the routine
+    self.write_memory(0xFF, self.ip & 0xFF)  # Store the return address at 0xFF
+    self.ip = operand                   # Jump to the routine
     # No flags are updated
 
-@opcode(0x31)
-def opcode_RET(self):
-    print("Executing opcode: RET")
+@opcode(0x31, "RET", reads=0xFF, group="branch")
+def opcode_RET(self, operand):
     # Return from a routine call
     # The return address is expected to be at position 0xFF
     # This operation is not memory safe: no checks are done on the validity of the address
@@ -575,15 +364,13 @@ def opcode_RET(self):
 ### Miscellaneous
 ##########################
 
-@opcode(0x3E)
-def opcode_NOP(self):
-    print("Executing opcode: NOP")
+@opcode(0x3E, "NOP")
+def opcode_NOP(self, operand):
     # No operation—just consume the cycle and return.
     pass
 
 
-@opcode(0x3F)
-def opcode_HLT(self):
-    print("Executing opcode: HLT")
+@opcode(0x3F, "HLT")
+def opcode_HLT(self, operand):
     # Just stop the machine. Flags are not touched
     self.halted = True
@@ -0,0 +1,173 @@
+# peephole.py
+#
+# Peephole optimizer of the SimpleAssembler (SimpleAssembler(optimize=True)).
+# It runs on the classified lines between the two assembler passes and removes
+# instructions that cannot change the result of a program:
+#   - NOP,
+#   - MOV / MVI that load a register with the value it already holds
+#     (e.g. the MOV B,A in "MOV A,B / MOV B,A"),
+#   - MOV / MVI / LDA / LDB / LDC whose register is overwritten before it is read
+#     (e.g. an MVI A followed by LDA x).
+# None of these instructions touches the flags, so flag semantics are preserved. The
+# optimizer works on straight-line windows that end at labels, data and control flow:
+# nothing moves across a label, and at the end of a window every register counts as read.
+# Removing instructions moves code, so the optimizer declines programs that could depend
+# on absolute code addresses: numeric address operands, ORG/DB, LDA C / STA C, and loads or
+# stores whose label marks code instead of data.
+
+from collections import namedtuple
+
+from simple_cpu_emulator import SimpleCPUEmulator
+
+REGISTERS = frozenset("ABC")
+
+# Registers read and written by each mnemonic. Control flow (JMP, Jcc, CALL, RET, HLT)
+# ends a window and is not listed.
+REGISTER_EFFECTS = {
+    "ADD B": ("AB", "A"), "ADD C": ("AC", "A"), "ADC B": ("AB", "A"),
+    "SUB B": ("AB", "A"), "SUB C": ("AC", "A"), "SUC B": ("AB", "A"),
+    "CMP": ("AB", ""), "TST": ("AB", ""),
+    "INR A": ("A", "A"), "INR B": ("B", "B"), "INR C": ("C", "C"),
+    "DCR A": ("A", "A"), "DCR B": ("B", "B"), "DCR C": ("C", "C"),
+    "ANA B": ("AB", "A"), "ANA C": ("AC", "A"), "ORA B": ("AB", "A"), "ORA C": ("AC", "A"),
+    "XRA B": ("AB", "A"), "XRA C": ("AC", "A"), "CMA": ("A", "A"),
+    "ANI": ("A", "A"), "ORI": ("A", "A"), "XRI": ("A", "A"),
+    "MOV A,B": ("B", "A"), "MOV A,C": ("C", "A"), "MOV B,A": ("A", "B"),
+    "MOV B,C": ("C", "B"), "MOV C,A": ("A", "C"), "MOV C,B": ("B", "C"),
+    "MVI A": ("", "A"), "MVI B": ("", "B"), "MVI C": ("", "C"),
+    "LDA": ("", "A"), "LDB": ("", "B"), "LDC": ("", "C"),
+    "STA": ("A", ""),
+    "NOP": ("", ""),
+}
+
+# Instructions without effects besides writing their one register (no flags, no memory writes)
+PURE_LOADS = frozenset({"MOV A,B", "MOV A,C", "MOV B,A", "MOV B,C", "MOV C,A", "MOV C,B",
+                        "MVI A", "MVI B", "MVI C", "LDA", "LDB", "LDC"})
+
+# Instructions reading memory at their (label) operand
+MEMORY_OPERANDS = frozenset({"LDA", "LDB", "LDC", "STA"})
+
+# Result of an optimization: removed instructions, saved bytes, saved cycles (one execution
+# of every removed instruction, from the emulator's cycle table) and the reason the
+# optimizer declined the program (or None)
+PeepholeReport = namedtuple("PeepholeReport", ["instructions", "bytes", "cycles", "declined"])
+
+
+def _decline_reason(classified, opcodes):
+    """Why the program must not be optimized (None if it can be)."""
+    labels = set()
+    data_labels = set()
+    for index, (t, _number, _raw, _code, _comment, details) in enumerate(classified):
+        if t in ("org", "db"):
+            return "ORG/DB place code at absolute addresses"
+        if t == "label":
+            labels.add(details)
+            # A label marks data if the next line that is not a label is data
+            following = index + 1
+            while following < len(classified) and classified[following][0] == "label":
+                following += 1
+            if following < len(classified) and classified[following][0] == "data":
+                data_labels.add(details)
+        elif t == "instr" and details[0] in ("LDA C", "STA C"):
+            return "LDA C / STA C use computed addresses"
+    for t, _number, raw, _code, _comment, details in classified:
+        if t != "instr" or opcodes[details[0]][1] != 2:
+            continue
+        inst, operand = details
+        if opcodes[inst][2] == "imm":
+            try:
+                if 0 <= int(operand, 0) <= 0xFF:
+                    continue
+            except ValueError:
+                pass
+            return f"invalid operand in {raw.strip()!r}"     # reported by the second pass
+        if operand not in labels:
+            return f"numeric address operand in {raw.strip()!r}"
+        if inst in MEMORY_OPERANDS and operand not in data_labels:
+            return f"memory access into code in {raw.strip()!r}"
+    return None
+
+
+def _windows(classified):
+    """Lists of indices of consecutive instructions not separated by labels, data or control flow."""
+    window = []
+    for index, (t, _number, _raw, _code, _comment, details) in enumerate(classified):
+        if t == "instr" and details[0] in REGISTER_EFFECTS:
+            window.append(index)
+            continue
+        if window:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def _redundant(window, classified):
+    """Indices of MOV / MVI loading a value the register already holds, and of NOPs."""
+    removed = []
+    known = dict.fromkeys(REGISTERS)        # register -> symbolic value or None (unknown)
+    fresh = 0
+    for index in window:
+        inst, operand = classified[index][5]
+        if inst == "NOP":
+            removed.append(index)
+        elif inst.startswith("MVI"):
+            value = ("const", int(operand, 0) & 0xFF)
+            if known[inst[-1]] == value:
+                removed.append(index)
+            known[inst[-1]] = value
+        elif inst.startswith("MOV"):
+            target, source = inst[4], inst[6]
+            if known[source] is None:
+                fresh += 1
+                known[source] = ("value", fresh)
+            if known[target] == known[source]:
+                removed.append(index)
+            known[target] = known[source]
+        else:
+            for register in REGISTER_EFFECTS[inst][1]:
+                known[register] = None
+    return removed
+
+
+def _dead(window, classified):
+    """Indices of pure loads whose register is overwritten before it is read."""
+    removed = []
+    live = set(REGISTERS)       # what follows the window may read every register
+    for index in reversed(window):
+        inst = classified[index][5][0]
+        reads, writes = REGISTER_EFFECTS[inst]
+        if inst in PURE_LOADS and writes not in live:
+            removed.append(index)
+            continue
+        live.difference_update(writes)
+        live.update(reads)
+    return removed
+
+
+def optimize(classified, opcodes):
+    """
+    Optimize the classified lines of SimpleAssembler's first pass.
+    Returns (optimized lines, PeepholeReport).
+    """
+    reason = _decline_reason(classified, opcodes)
+    if reason is not None:
+        return classified, PeepholeReport(0, 0, 0, reason)
+
+    instructions = saved_bytes = saved_cycles = 0
+    while True:
+        removed = set()
+        for window in _windows(classified):
+            removed.update(_redundant(window, classified))
+            window = [index for index in window if index not in removed]
+            removed.update(_dead(window, classified))
+        if not removed:
+            break
+        for index in removed:
+            inst = classified[index][5][0]
+            length = opcodes[inst][1]
+            instructions += 1
+            saved_bytes += length
+            saved_cycles += SimpleCPUEmulator.opcode_cycles[opcodes[inst][0]]
+        classified = [line for index, line in enumerate(classified) if index not in removed]
+    return classified, PeepholeReport(instructions, saved_bytes, saved_cycles, None)
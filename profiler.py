@@ -0,0 +1,151 @@
+# profiler.py
+#
+# Execution profiler for the SimpleCPUEmulator.
+# Attach a Profiler to an emulator (emulator.profiler = Profiler(...)) and run_full counts
+# every executed instruction per address and per opcode. Without a profiler the silent
+# run loop is unchanged, so profiling costs nothing when it is turned off.
+#
+# "Usage: python profiler.py <asm_file.asm> [--json profile.json] [--top N]"
+
+import argparse
+import bisect
+import json
+import re
+
+from simple_cpu_emulator import SimpleCPUEmulator
+
+# An address line of the assembler listing: "XX: 0xYY ..."
+_LISTING_ADDRESS = re.compile(r"^([0-9A-F]{2}): ")
+
+
+class Profiler:
+    """
+    Execution counts of a program run.
+    symbols: optional symbol table (label name -> address), e.g. SimpleAssembler.labels,
+             used to attribute addresses to the label they follow.
+    """
+
+    def __init__(self, symbols=None, memory_size=256):
+        self.address_counts = [0] * memory_size     # executions per instruction address
+        self.opcode_counts = [0] * 256              # executions per opcode byte
+        self.symbols = dict(symbols or {})
+        labels = sorted((address, name) for name, address in self.symbols.items())
+        self._label_addresses = [address for address, _name in labels]
+        self._label_names = [name for _address, name in labels]
+
+    def attach(self, emulator):
+        """Profile the runs of emulator. Returns self."""
+        emulator.profiler = self
+        return self
+
+    def reset(self):
+        """Clear all counts."""
+        self.address_counts[:] = [0] * len(self.address_counts)
+        self.opcode_counts[:] = [0] * 256
+
+    @property
+    def total(self):
+        """Number of profiled instructions."""
+        return sum(self.opcode_counts)
+
+    def label_of(self, address):
+        """The label at or before address (None before the first label)."""
+        index = bisect.bisect_right(self._label_addresses, address) - 1
+        return self._label_names[index] if index >= 0 else None
+
+    def location(self, address):
+        """An address as "LABEL+offset" (or just the hex address without labels)."""
+        label = self.label_of(address)
+        if label is None:
+            return f"{address:02X}"
+        offset = address - self.symbols[label]
+        return label if offset == 0 else f"{label}+{offset}"
+
+    def by_address(self):
+        """[(address, count)] of all executed addresses, hottest first."""
+        counts = [(address, count) for address, count in enumerate(self.address_counts) if count]
+        return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+    def by_opcode(self):
+        """[(opcode name, count)] of all executed opcodes, most frequent first."""
+        names = SimpleCPUEmulator.opcode_names
+        counts = [(names.get(code, f"{code:02X}"), count) for code, count in enumerate(self.opcode_counts) if count]
+        return sorted(counts, key=lambda item: (-item[1], item[0]))
+
+    def by_label(self):
+        """[(label, count)] summed over the addresses following each label, hottest first."""
+        totals = {}
+        for address, count in enumerate(self.address_counts):
+            if count:
+                label = self.label_of(address)
+                totals[label] = totals.get(label, 0) + count
+        return sorted(totals.items(), key=lambda item: (-item[1], item[0] or ""))
+
+    def report(self, top=10):
+        """A textual hotspot report: hottest addresses, opcodes and labels."""
+        total = self.total or 1
+        lines = [f"Profiled instructions: {self.total}", "", "Hottest addresses:"]
+        for address, count in self.by_address()[:top]:
+            lines.append(f"  {address:02X}  {count:>10}  {100 * count / total:6.2f}%  {self.location(address)}")
+        lines += ["", "Opcodes:"]
+        for name, count in self.by_opcode()[:top]:
+            lines.append(f"  {name:<14} {count:>10}  {100 * count / total:6.2f}%")
+        if self.symbols:
+            lines += ["", "Labels:"]
+            for label, count in self.by_label()[:top]:
+                lines.append(f"  {label or '(before first label)':<20} {count:>10}  {100 * count / total:6.2f}%")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        """The profile as a JSON-serializable dict."""
+        return {
+            "instructions": self.total,
+            "addresses": {f"{address:02X}": count for address, count in self.by_address()},
+            "opcodes": dict(self.by_opcode()),
+            "labels": {label or "": count for label, count in self.by_label()},
+        }
+
+    def dump(self, path):
+        """Write the profile as JSON to path."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def annotate_listing(self, listing):
+        """
+        Prefix every line of an assembler listing with the execution count of its address.
+        Lines of executed instructions get their count, all other lines are left blank.
+        """
+        lines = []
+        for line in listing.splitlines():
+            match = _LISTING_ADDRESS.match(line)
+            count = self.address_counts[int(match.group(1), 16)] if match else 0
+            lines.append(f"{count:>10}  {line}" if count else f"{'':>10}  {line}")
+        return "\n".join(lines)
+
+
+def main():
+    from main import read_asm_file
+    from simple_assembler import SimpleAssembler
+
+    parser = argparse.ArgumentParser(description="Run an .asm program silently and profile it.")
+    parser.add_argument("asm_file")
+    parser.add_argument("--json", help="also write the profile as JSON to this file")
+    parser.add_argument("--top", type=int, default=10, help="entries per report section")
+    args = parser.parse_args()
+
+    assembler = SimpleAssembler()
+    program, listing = assembler.assemble_with_listing(read_asm_file(args.asm_file))
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(program)
+    profiler = Profiler(assembler.labels).attach(emulator)
+    outcome = emulator.run_full()
+
+    print(profiler.annotate_listing(listing))
+    print()
+    print(f"Run finished: {outcome.status}")
+    print(profiler.report(args.top))
+    if args.json:
+        profiler.dump(args.json)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
+import re
+from array import array
+
+import object_format
+import peephole
+
+
 class SimpleAssembler:
     # mnemonic → (opcode_byte, length_in_bytes, mode)
     # mode: "none"=no operand, "imm"=immediate literal, "addr"=label/address
@@ -61,11 +68,42 @@ class SimpleAssembler:
         "DB":  (None, 1, "imm"),  # Platziert Bytes ab der aktuellen Adresse
     }
 
+    def __init__(self, optimize=False):
+        # Run the peephole optimizer (see peephole.py) between the two passes
+        self.optimize = optimize
+        # What the optimizer did with the last program (a peephole.PeepholeReport), or None
+        self.peephole_report = None
+        # Symbol table of the last assembled program: label name (upper case) → address
+        self.labels = {}
+        # Source map of the last assembled program: address → source line number (1-based,
+        # 0 where nothing was emitted)
+        self.source_map = array("I")
+        # Emission records of the last assembled program, (address, value, comment) in
+        # emission order; the listing is built from them on demand
+        self._emitted = []
+        # Memory image of the last assembled program
+        self._image = b""
+
     # Pretty-print ints as 0xHH when you print the list, while staying real ints.
     class _HexInt(int):
         def __repr__(self):
             return f"0x{self:02X}"
 
+    @classmethod
+    def _mnemonic_pattern(cls):
+        """
+        A regex matching the mnemonic at the start of a line, compiled once per class.
+        The alternatives are ordered longest first, so the longest mnemonic wins. A mnemonic
+        must not run on into a word, so "LDA COUNT" is LDA with the operand COUNT, not LDA C.
+        """
+        cached = cls.__dict__.get("_mnemonic_cache")
+        if cached is None or cached[0] is not cls.OPCODES:
+            keys = sorted(cls.OPCODES.keys(), key=len, reverse=True)
+            alternatives = "|".join(re.escape(key) for key in keys)
+            cached = (cls.OPCODES, re.compile(rf"(?:{alternatives})(?!\w)"))
+            cls._mnemonic_cache = cached
+        return cached[1]
+
     def _split_mnemonic(self, line):
         """
         Return (mnemonic_key, operand_text) by matching longest key.
@@ -73,166 +111,210 @@ class SimpleAssembler:
         """
         code = line.split(';', 1)[0].strip().upper()
         code = code.replace(', ', ',').replace(' ,', ',')
-        for key in sorted(self.OPCODES.keys(), key=len, reverse=True):
-            if code.startswith(key):
-                rest = code[len(key):].strip()
-                return key, rest
-        raise ValueError(f"Unknown instruction in line: {line!r}")
+        match = self._mnemonic_pattern().match(code)
+        if match is None:
+            raise ValueError(f"Unknown instruction in line: {line!r}")
+        key = match.group()
+        return key, code[len(key):].strip()
 
     def _normalize_source(self, source):
-        """Return list of dicts: [{'raw','code','comment'}] preserving comments."""
+        """Return list of tuples: [(line_number, raw, code, comment)] preserving comments."""
         if isinstance(source, str):
             lines = source.splitlines()
         else:
             lines = source
         out = []
-        for raw in lines:
+        for number, raw in enumerate(lines, 1):
             code, sep, comment = raw.partition(';')
-            code = code.rstrip()
+            code = code.strip()
             comment = comment.strip() if sep else ""
             # keep empty code lines only if they carry a standalone comment? (skip here)
-            if code.strip() or comment:  # we only keep non-empty code (comments kept attached)
-                out.append({"raw": raw, "code": code.strip(), "comment": comment})
+            if code or comment:  # we only keep non-empty code (comments kept attached)
+                out.append((number, raw, code, comment))
         return out
 
     def assemble(self, source):
         """Assemble and return the raw integer bytes (for the emulator)."""
-        machine, _listing = self.assemble_with_listing(source)
-        return machine
+        return self._as_machine_list(self.assemble_bytes(source))
 
     def assemble_with_listing(self, source):
+        """Assemble and return the raw integer bytes and the human-readable listing."""
+        image = self.assemble_bytes(source)
+        return self._as_machine_list(image), self.listing()
+
+    def _as_machine_list(self, image):
+        # Emitted bytes print as 0xHH; addresses nothing was emitted to are plain 0
+        HexInt = self._HexInt
+        return [HexInt(byte) if line else 0 for byte, line in zip(image, self.source_map)]
+
+    def listing(self):
+        """The listing of the last assembled program: one "XX: 0xYY ; comment" line per emitted byte."""
+        return "\n".join(f"{addr:02X}: 0x{val:02X}" + (f" ; {comment}" if comment else "")
+                         for addr, val, comment in self._emitted)
+
+    def write_object(self, path):
+        """Write the last assembled program as an object file with symbols and source map (see object_format.py)."""
+        object_format.write_object(path, self._image, self.source_map, self.labels)
+
+    def write_intel_hex(self, path):
+        """Write the last assembled program as an Intel HEX file."""
+        object_format.write_intel_hex(path, self._image, object_format.segments_of(self.source_map))
+
+    def _classify(self, code, raw):
+        """
+        Classify one line of code: returns (type, details) with type "org" (details: the
+        address), "db" (the operand strings), "label" (its name), "instr" ((mnemonic,
+        operand text)) or "data" (None). Does not depend on the line's address.
+        """
+        upper = code.upper()
+
+        if upper.startswith("ORG"):
+            operand = code[3:].strip()
+            try:
+                return "org", int(operand, 0)
+            except ValueError:
+                raise ValueError(f"Invalid address for ORG: {operand!r}")
+
+        if upper.startswith("DB"):
+            return "db", [op.strip() for op in code[2:].split(",")]
+
+        if code.endswith(':'):
+            return "label", code[:-1].strip().upper()
+
+        try:
+            return "instr", self._split_mnemonic(code)
+        except ValueError:
+            try:
+                int(code, 0)
+            except ValueError:
+                raise ValueError(f"Line not instruction or data: {raw!r}")
+            return "data", None
+
+    def assemble_bytes(self, source):
+        """
+        Assemble and return the program as a bytearray. Also records the symbol table
+        (labels), the source map and the emission records the listing is built from.
+        """
         lines = self._normalize_source(source)
+        opcodes = self.OPCODES
+        classify = self._classify
 
-        # First pass: compute addresses for labels; also classify lines
+        # First pass: compute addresses for labels; also classify lines.
+        # Each classified line is a tuple (type, line_number, raw, code, comment, details).
         labels = {}
         addr = 0
         classified = []
         max_addr = 0  # Track the maximum address used
         current_org_addr = 0
 
-        for entry in lines:
-            code = entry["code"]
-            if not code:
-                continue
-
-            if code.upper().startswith("ORG"):
-                operand = code[3:].strip()
-                try:
-                    org_addr = int(operand, 0)
-                except ValueError:
-                    raise ValueError(f"Invalid address for ORG: {operand!r}")
-                classified.append({**entry, "type": "org", "addr": org_addr})
-                current_org_addr = org_addr
-                max_addr = max(max_addr, org_addr)
-                continue
-
-            if code.upper().startswith("DB"):
-                operands = [op.strip() for op in code[2:].split(",")]
-                db_addr = current_org_addr + len(operands) - 1  # Letzte Adresse, die durch DB belegt wird
-                max_addr = max(max_addr, db_addr)
-                classified.append({**entry, "type": "db", "operands": operands})
-                continue
+        for number, raw, code, comment in lines:
+            if code:
+                t, details = classify(code, raw)
+                classified.append((t, number, raw, code, comment, details))
 
-            if code.endswith(':'):
-                label_name = code[:-1].strip().upper()
-                labels[label_name] = addr
-                classified.append({**entry, "type": "label", "name": label_name})
-                continue
+        if self.optimize:
+            classified, self.peephole_report = peephole.optimize(classified, opcodes)
 
-            try:
-                inst, operand = self._split_mnemonic(code)
-                _, length, _ = self.OPCODES[inst]
-                classified.append({**entry, "type": "instr", "inst": inst, "operand": operand})
-                addr += length
-                max_addr = max(max_addr, addr - 1)  # Aktualisiere max_addr auf die letzte verwendete Adresse
-            except ValueError:
-                try:
-                    int(code, 0)
-                except ValueError:
-                    raise ValueError(f"Line not instruction or data: {entry['raw']!r}")
-                classified.append({**entry, "type": "data"})
-                addr += 1
+        for t, number, raw, code, comment, details in classified:
+            if t == "org":
+                current_org_addr = details
+                max_addr = max(max_addr, details)
+            elif t == "db":
+                db_addr = current_org_addr + len(details) - 1  # Letzte Adresse, die durch DB belegt wird
+                max_addr = max(max_addr, db_addr)
+            elif t == "label":
+                labels[details] = addr
+            else:
+                addr += opcodes[details[0]][1] if t == "instr" else 1
                 max_addr = max(max_addr, addr - 1)  # Aktualisiere max_addr auf die letzte verwendete Adresse
 
-        # Second pass: emit bytes + build listing
-        machine = [None] * (max_addr + 1)  # Initialize with enough space
-        listing_lines = []
+        self.labels = labels
+
+        # Second pass: emit bytes, the source map and the emission records for the listing
+        image = bytearray(max_addr + 1)  # Initialize with enough space
+        source_map = array("I", [0]) * (max_addr + 1)
+        emitted = []
+        emit = emitted.append
         addr = 0
         pending_label_comment = None
         current_org_addr = 0
 
-        for entry in classified:
-            t = entry["type"]
-
-            if t == "org":
-                current_org_addr = entry["addr"]
-                addr = current_org_addr
-                continue
+        try:
+            for t, number, raw, code, comment, details in classified:
+
+                if t == "org":
+                    current_org_addr = details
+                    addr = current_org_addr
+                    continue
+
+                if t == "label":
+                    pending_label_comment = comment or None
+                    continue
+
+                if t == "db":
+                    for val_str in details:
+                        val = int(val_str, 0)
+                        if not (0 <= val <= 0xFF):
+                            raise ValueError(f"Data byte out of range: {val_str!r}")
+                        image[addr] = val
+                        source_map[addr] = number
+                        emit((addr, val, comment))
+                        addr += 1
+                    continue
+
+                if t == "data":
+                    val = int(code, 0)
+                    if not (0 <= val <= 0xFF):
+                        raise ValueError(f"Data byte out of range: {raw!r}")
+                    image[addr] = val
+                    source_map[addr] = number
+                    emit((addr, val, comment or pending_label_comment))
+                    addr += 1
+                    pending_label_comment = None
+                    continue
 
-            if t == "label":
-                pending_label_comment = entry["comment"] or None
-                continue
+                if t == "instr":
+                    inst, operand_text = details
+                    opcode, length, mode = opcodes[inst]
 
-            if t == "db":
-                for val_str in entry["operands"]:
-                    val = int(val_str, 0)
-                    if not (0 <= val <= 0xFF):
-                        raise ValueError(f"Data byte out of range: {val_str!r}")
-                    machine[addr] = self._HexInt(val)
-                    comment = entry["comment"] or ""
-                    listing_lines.append(f"{addr:02X}: 0x{val:02X}" + (f" ; {comment}" if comment else ""))
+                    image[addr] = opcode
+                    source_map[addr] = number
+                    emit((addr, opcode, comment))
                     addr += 1
-                continue
-
-            if t == "data":
-                val = int(entry["code"], 0)
-                if not (0 <= val <= 0xFF):
-                    raise ValueError(f"Data byte out of range: {entry['raw']!r}")
-                machine[addr] = self._HexInt(val)
-                comment = entry["comment"] or pending_label_comment or ""
-                listing_lines.append(f"{addr:02X}: 0x{val:02X}" + (f" ; {comment}" if comment else ""))
-                addr += 1
-                pending_label_comment = None
-                continue
-
-            if t == "instr":
-                inst = entry["inst"]
-                operand_text = entry["operand"]
-                opcode, length, mode = self.OPCODES[inst]
-
-                machine[addr] = self._HexInt(opcode)
-                comment = entry["comment"] or ""
-                listing_lines.append(f"{addr:02X}: 0x{opcode:02X}" + (f" ; {comment}" if comment else ""))
-                addr += 1
-
-                if length == 2:
-                    if not operand_text:
-                        raise ValueError(f"Missing operand for '{inst}'")
-
-                    if mode == "imm":
-                        try:
-                            val = int(operand_text, 0)
-                        except ValueError:
-                            raise ValueError(f"Immediate expected for '{inst}', got: {operand_text!r}")
-                    else:  # addr mode
-                        if operand_text in labels:
-                            val = labels[operand_text]
-                        else:
+
+                    if length == 2:
+                        if not operand_text:
+                            raise ValueError(f"Missing operand for '{inst}'")
+
+                        if mode == "imm":
                             try:
                                 val = int(operand_text, 0)
                             except ValueError:
-                                raise ValueError(f"Label/address expected for '{inst}', got: {operand_text!r}")
+                                raise ValueError(f"Immediate expected for '{inst}', got: {operand_text!r}")
+                        else:  # addr mode
+                            if operand_text in labels:
+                                val = labels[operand_text]
+                            else:
+                                try:
+                                    val = int(operand_text, 0)
+                                except ValueError:
+                                    raise ValueError(f"Label/address expected for '{inst}', got: {operand_text!r}")
+
+                        if not (0 <= val <= 0xFF):
+                            raise ValueError(f"Operand out of range for '{inst}': {operand_text!r}")
+
+                        image[addr] = val
+                        source_map[addr] = number
+                        emit((addr, val, None))
+                        addr += 1
 
-                    if not (0 <= val <= 0xFF):
-                        raise ValueError(f"Operand out of range for '{inst}': {operand_text!r}")
-
-                    machine[addr] = self._HexInt(val)
-                    listing_lines.append(f"{addr:02X}: 0x{val:02X}")
-                    addr += 1
-
-            pending_label_comment = None
+                pending_label_comment = None
 
-        # Filter out None values and replace them with 0x00
-        machine = [byte if byte is not None else 0x00 for byte in machine]
+        except IndexError:
+            # Only possible when ORG moves code beyond the addresses counted in the first pass
+            raise IndexError(f"Address {addr:02X} lies beyond the assembled program (check ORG)") from None
 
-        return list(machine), "\n".join(listing_lines)
+        self.source_map = source_map
+        self._emitted = emitted
+        self._image = bytes(image)
+        return image
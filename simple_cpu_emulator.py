@@ -1,18 +1,197 @@
+import os
+import struct
+import time
+from collections import namedtuple
+from functools import partial
+
+from alu import FLAG_C, FLAG_S, FLAG_V, FLAG_Z, TABLES
+from block_compiler import BlockCompiler
+from object_format import mapped_image
+from time_travel import History
+from tracing import TraceEvent, make_trace_sink, print_sink
+
+
+# Handlers of predecoded entries that cannot be executed. Like every handler they run after
+# the instruction pointer was advanced past the (one-byte) instruction.
+def _invalid_opcode(self, operand):
+    raise Exception(f"Invalid opcode @ {self.ip-1:02X}: {self.memory[self.ip-1]:02X}")
+
+def _missing_operand(self, operand):
+    raise IndexError(f"Operand of instruction @ {self.ip-1:02X} lies outside memory")
+
+# A conditional branch in the last memory cell: only a taken branch needs its operand, an
+# untaken one moves the IP past the end of memory (the handler runs with the IP advanced by 2)
+def _branch_without_operand(mask, self, operand):
+    if self.flags & mask:
+        raise IndexError(f"Operand of instruction @ {self.ip-2:02X} lies outside memory")
+
+
+# Fast-forwarding of loops (see run_full). _decode gives the first instruction of these
+# loops a handler that raises FastForward with the outcome of the whole loop while run_full
+# allows skipping it, and else executes the instruction normally:
+#   a JMP to itself, or a conditional branch to itself whose flag is set: never ends
+#   DCR r / INR r, JZ exit, JMP back to the DCR / INR: counts r down (up) to zero
+JMP, JZ = 0x2B, 0x2D
+BRANCH_FLAGS = {0x2C: FLAG_S, 0x2D: FLAG_Z, 0x2E: FLAG_C, 0x2F: FLAG_V}
+# Register and ALU operation (with operand 1, see alu.ALU_OPCODES) of INR and DCR
+COUNTERS = {0x09: ("register_A", "ADD"), 0x0A: ("register_B", "ADD"), 0x0B: ("register_C", "ADD"),
+            0x0C: ("register_A", "SUB"), 0x0D: ("register_B", "SUB"), 0x0E: ("register_C", "SUB")}
+LOOP_STARTS = {JMP, *BRANCH_FLAGS, *COUNTERS}
+
+
+class FastForward(Exception):
+    """
+    Raised by the first instruction of a loop that run_full may skip.
+    address: the instruction; steps / cycles: what running the loop takes (steps None: it
+    never ends, cycles is then the cost of one round); register, value, flags, target:
+    the register the loop counts, its final value, the final status byte and the IP.
+    """
+
+    def __init__(self, address, steps, cycles, register=None, value=None, flags=None, target=None):
+        super().__init__(address)
+        self.address = address
+        self.steps = steps
+        self.cycles = cycles
+        self.register = register
+        self.value = value
+        self.flags = flags
+        self.target = target
+
+
+def _loop_to_self(operation, address, mask, self, operand):
+    if self._fast_forwarding and (mask is None or self.flags & mask):
+        raise FastForward(address, None, self._cycle_costs[self.memory[address]])
+    operation(self, operand)
+
+def _counter_loop(operation, address, self, operand):
+    memory = self.memory
+    # The entry is only dropped when its own byte is written, so check the rest of the loop
+    if (self._fast_forwarding and address + 4 < len(memory) and memory[address + 1] == JZ
+            and memory[address + 3] == JMP and memory[address + 4] == address):
+        opcode = memory[address]
+        register, name = COUNTERS[opcode]
+        value = getattr(self, register)
+        if name == "SUB":
+            rounds, last = value or 256, 1
+        else:
+            rounds, last = (256 - value) % 256 or 256, 0xFF
+        costs = self._cycle_costs
+        # Every round runs the counter and JZ, all but the last one the JMP back
+        raise FastForward(address, 3 * rounds - 1, rounds * (costs[opcode] + costs[JZ]) + (rounds - 1) * costs[JMP],
+                          register, 0, TABLES[name][(last << 8) | 1] >> 8, memory[address + 2])
+    operation(self, operand)
+
+
+# The full machine state as bytes: memory, IP, registers A, B, C, status byte, halted
+STATE_FORMAT = struct.Struct("<256sH4B?")
+
+# The result of SimpleCPUEmulator.run_full(). status is one of
+#   "halted"           the program executed HLT
+#   "ip_out_of_range"  the instruction pointer left memory
+#   "step_budget"      max_steps instructions were executed
+#   "time_budget"      the time limit was reached
+#   "loop"             a machine state repeated, so the program never terminates;
+#                      cycle_length is the number of instructions in one round of the loop
+#   "breakpoint"       the IP reached a breakpoint (the instruction there is not executed yet);
+#                      address is the breakpoint
+#   "watchpoint"       an instruction accessed a watched memory cell (and was executed);
+#                      address is the memory cell
+#   "idle"             the IP reached a JMP to itself (or a taken conditional branch to
+#                      itself), which never ends; the IP stays there
+# steps is the number of instructions executed by this call; report is a RunReport if
+# run_full(report=True) was called.
+RunOutcome = namedtuple("RunOutcome", ["status", "steps", "cycle_length", "address", "report"],
+                        defaults=(None, None))
+
+
+# The last field of a predecoded entry is the instruction's tally: its cycles shifted left
+# by TALLY_SHIFT plus one, so summing tallies counts instructions and cycles in one addition
+TALLY_SHIFT = 40
+TALLY_STEPS = (1 << TALLY_SHIFT) - 1
+
+
+def default_cycles(length, reads=None, writes=None):
+    """Default cycle cost of an opcode: one cycle per byte fetched plus one per data memory access."""
+    return length + (reads is not None) + (writes is not None)
+
+
+class RunReport(namedtuple("RunReport", ["instructions", "cycles", "memory_reads", "memory_writes", "groups"])):
+    """
+    Performance of one run_full(report=True) call. groups maps each opcode group ("alu",
+    "memory", "branch", "other") to (instructions, cycles, memory accesses).
+    Memory accesses are data reads and writes; instruction fetches are not counted.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        lines = [f"Instructions: {self.instructions}   cycles: {self.cycles}   "
+                 f"memory reads: {self.memory_reads}   memory writes: {self.memory_writes}"]
+        for group, (instructions, cycles, accesses) in self.groups.items():
+            lines.append(f"  {group:<8} {instructions:>10} instructions {cycles:>10} cycles {accesses:>10} memory accesses")
+        return "\n".join(lines)
+
+
+# A checkpoint taken by SimpleCPUEmulator.snapshot(). decoded holds the predecode entries,
+# which are only reused when restoring into an emulator with the same dispatch table and
+# cycle costs (dispatch holds both).
+Snapshot = namedtuple("Snapshot", [
+    "memory", "ip", "register_A", "register_B", "register_C", "flags", "halted", "dispatch", "decoded",
+])
+
+
 class SimpleCPUEmulator:
 
+    # Fixed set of attributes: no per-instance __dict__, which keeps large fleets small
+    __slots__ = (
+        "memory", "ip", "register_A", "register_B", "register_C", "flags",
+        "halted", "step_by_step", "steps", "_dispatch", "_decoded", "_entries", "_write_listeners", "_compiler", "trace",
+        "profiler", "symbols", "breakpoints", "watchpoints", "cycles", "_cycle_costs", "memo",
+        "fast_forward", "_fast_forwarding",
+    )
+
     # Fixed class-level dispatch table. Shared by all instances of the SimpleCPUEmulator
     dispatch_table = {}
+    # Opcode names (for tracing) and instruction lengths in bytes, filled in by opcodes.py
+    opcode_names = {}
+    opcode_lengths = {}
+    # The memory cell an opcode reads or writes: "operand", "C" or a fixed address
+    # (only opcodes accessing memory as data are listed, filled in by opcodes.py)
+    opcode_reads = {}
+    opcode_writes = {}
+    # Cycle cost of every opcode (see default_cycles) and its group for run reports:
+    # "alu", "memory", "branch" or "other" (filled in by opcodes.py)
+    opcode_cycles = {}
+    opcode_groups = {}
+    # The entry table of the dispatch table and default cycle costs (see _entry_table)
+    _default_entries = None
     
     @classmethod
-    def opcode(cls, code):
+    def opcode(cls, code, name, length=1, reads=None, writes=None, cycles=None, group=None):
         def decorator(func):
             cls.dispatch_table[code] = func
+            cls.opcode_names[code] = name
+            cls.opcode_lengths[code] = length
+            if reads is not None:
+                cls.opcode_reads[code] = reads
+            if writes is not None:
+                cls.opcode_writes[code] = writes
+            cls.opcode_cycles[code] = default_cycles(length, reads, writes) if cycles is None else cycles
+            cls.opcode_groups[code] = group or ("memory" if reads or writes else "other")
+            cls._default_entries = None
             return func
         return decorator
 
 
-    def __init__(self):
-        self.memory = [0] * 256 # Assuming 256 memory locations
+    def __init__(self, silent=False, trace=None, cycle_costs=None, fast_forward=True):
+        """
+        silent:     run headless; no per-opcode output is produced.
+        trace:      optional trace sink (callable, logging.Logger or writer, see tracing.py)
+                    receiving a TraceEvent for every executed instruction.
+        cycle_costs: optional {opcode: cycles} overriding the cycle costs of opcodes.py
+        fast_forward: let run_full skip idle and counter loops (see there)
+        Without a trace sink, a non-silent emulator prints every executed opcode.
+        """
+        self.memory = bytearray(256)    # Assuming 256 memory locations
         self.ip = 0             # The instruction pointer
         
         # The general purpose registers
@@ -20,24 +199,293 @@ class SimpleCPUEmulator:
         self.register_B = 0
         self.register_C = 0
 
-        # The flags
-        self.flag_Z = False
-        self.flag_S = False
-        self.flag_V = False
-        self.flag_C = False
+        # The flags, packed into a status byte (see alu.py for the bit layout)
+        self.flags = 0
         
         # Controling the machine
         self.halted = False
         self.step_by_step = False
+        self.steps = 0          # instructions executed so far
+        self.cycles = 0         # their cycles, by the cycle cost table
+        self._cycle_costs = {**self.opcode_cycles, **cycle_costs} if cycle_costs else self.opcode_cycles
+        self.fast_forward = fast_forward
+        self._fast_forwarding = False     # set while a run_full loop can skip loops
+
+        self._dispatch = self.dispatch_table
+        # Predecoded instructions: one (handler, operand, length, tally) entry per address,
+        # None until the address is decoded and again after a write invalidated it. The
+        # table itself is only allocated when a program first runs (see _predecoded)
+        self._decoded = None
+        self._entries = None
+        # Called as listener(start, end) when the byte range [start, end) was written
+        # (e.g. by the block compiler, which drops compiled code in that range)
+        self._write_listeners = []
+        self._compiler = None
+
+        # Tracing: None means no events are built at all
+        if trace is not None:
+            self.trace = make_trace_sink(trace)
+        elif not silent:
+            self.trace = print_sink
+        else:
+            self.trace = None
+        # Optional profiler.Profiler counting the instructions run_full executes
+        self.profiler = None
+        # Optional memo.CallMemo replaying the routines run_full enters through CALL
+        self.memo = None
+
+        # Debugging: label name (upper case) -> address, e.g. SimpleAssembler.labels;
+        # breakpoint addresses; watched memory cells -> "r", "w" or "rw"
+        self.symbols = {}
+        self.breakpoints = set()
+        self.watchpoints = {}
 
     def read_into_memory(self, program, start_address=0x00):
-        """Load a list of byte-values into memory at the given start address."""
+        """
+        Load a list of byte-values into memory at the given start address. program may also
+        be the path of an object file or an Intel HEX file (see object_format.py).
+        """
+        if isinstance(program, (str, os.PathLike)):
+            self._load_image_file(program, start_address)
+            return
         end = start_address + len(program)
         if end > len(self.memory):
             raise ValueError(f"Program (size {len(program)}) exceeds memory bounds at {start_address:02X}.")
+        try:
+            program = bytes(program)
+        except ValueError:
+            raise ValueError("Program contains values that are not bytes (0x00-0xFF).") from None
+        # Reloading the bytes already there (e.g. the next run of a batch) keeps their decoded entries
+        if self.memory[start_address:end] == program:
+            return
         # Copy program bytes in; leave the rest untouched
-        for offset, byte in enumerate(program):
-            self.memory[start_address + offset] = byte
+        self.memory[start_address:end] = program
+        self._loaded(start_address, end)
+
+    def _load_image_file(self, path, start_address):
+        # The image is copied straight out of the mapped file, so loading does no per-byte work in Python
+        with mapped_image(path) as image:
+            end = start_address + len(image)
+            if end > len(self.memory):
+                raise ValueError(f"Program (size {len(image)}) exceeds memory bounds at {start_address:02X}.")
+            self.memory[start_address:end] = image
+        self._loaded(start_address, end)
+
+    def _loaded(self, start_address, end):
+        # Instructions are decoded on first execution, not when loaded: a short program then
+        # only decodes the instructions it runs. Drop the entries of the loaded range and of
+        # the instruction before it, which may have its operand in it.
+        if self._decoded is not None:
+            first = max(start_address - 1, 0)
+            self._decoded[first:end] = [None] * (end - first)
+        for listener in self._write_listeners:
+            listener(start_address, end)
+
+    def write_memory(self, address, value):
+        """
+        Write a byte to memory and invalidate the predecoded instructions it belongs to:
+        the instruction starting at address and a two-byte instruction starting before it.
+        Code that writes into memory while a program is loaded must use this method.
+        """
+        self.memory[address] = value
+        if self._decoded is not None:
+            self._decoded[address] = None
+            if address > 0:
+                self._decoded[address - 1] = None
+        for listener in self._write_listeners:
+            listener(address, address + 1)
+
+    def invalidate_decoded(self):
+        """Drop all predecoded instructions, e.g. after modifying memory directly."""
+        if self._decoded is not None:
+            self._decoded[:] = [None] * len(self.memory)
+        for listener in self._write_listeners:
+            listener(0, len(self.memory))
+
+    def _predecoded(self):
+        """The predecode table, allocated on first use: a fresh emulator does not carry one."""
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._decoded = [None] * len(self.memory)
+        return decoded
+
+    def _entry_table(self):
+        """
+        Per opcode byte, the entry _decode starts from: (handler, None, length, tally).
+        Emulators with the class dispatch table and default cycle costs share one table.
+        """
+        shared = self._dispatch is self.dispatch_table and self._cycle_costs is self.opcode_cycles
+        entries = type(self).__dict__.get("_default_entries") if shared else None
+        if entries is None:
+            costs = self._cycle_costs
+            entries = [(_invalid_opcode, None, 1, 0)] * 256
+            for opcode, operation in self._dispatch.items():
+                entries[opcode] = (operation, None, self.opcode_lengths[opcode], (costs[opcode] << TALLY_SHIFT) | 1)
+            if shared:
+                type(self)._default_entries = entries
+        self._entries = entries
+        return entries
+
+    def _decode(self, address):
+        """Decode the instruction at address into a (handler, operand, length, tally) entry and cache it."""
+        memory = self.memory
+        opcode = memory[address]
+        entry = (self._entries or self._entry_table())[opcode]
+        if entry[2] == 2:
+            if address + 1 < len(memory):
+                entry = (entry[0], memory[address + 1], 2, entry[3])
+            elif opcode in BRANCH_FLAGS:
+                entry = (partial(_branch_without_operand, BRANCH_FLAGS[opcode]), None, 2, entry[3])
+            else:
+                entry = (_missing_operand, None, 1, 0)
+        if opcode in LOOP_STARTS and entry[3]:
+            entry = self._loop_entry(address, entry)
+        decoded = self._decoded
+        if decoded is None:
+            decoded = self._predecoded()
+        decoded[address] = entry
+        return entry
+
+    def _loop_entry(self, address, entry):
+        """entry, or a fast-forwarding version of it if it starts a loop run_full can skip."""
+        memory = self.memory
+        operation, operand, length, tally = entry
+        opcode = memory[address]
+        if opcode in COUNTERS:
+            if (address + 4 < len(memory) and memory[address + 1] == JZ and memory[address + 3] == JMP
+                    and memory[address + 4] == address):
+                return (partial(_counter_loop, operation, address), operand, length, tally)
+        elif operand == address:
+            return (partial(_loop_to_self, operation, address, BRANCH_FLAGS.get(opcode)), operand, length, tally)
+        return entry
+
+    def _skip_loop(self, loop):
+        """Set the state a counter loop ends in (see FastForward)."""
+        setattr(self, loop.register, loop.value)
+        self.flags = loop.flags
+        self.ip = loop.target
+
+    def memory_accesses(self, address=None):
+        """
+        (read address, write address) of the instruction at address (default: the IP) if it
+        executed now; None where the instruction does not read or write a memory cell.
+        """
+        if address is None:
+            address = self.ip
+        opcode = self.memory[address]
+        accesses = []
+        for table in (self.opcode_reads, self.opcode_writes):
+            target = table.get(opcode)
+            if target == "operand":
+                target = self.memory[address + 1] if address + 1 < len(self.memory) else None
+            elif target == "C":
+                target = self.register_C
+            accesses.append(target)
+        return tuple(accesses)
+
+    def resolve_address(self, location):
+        """An address given as int, label name (see symbols) or number string (hex or dec)."""
+        if isinstance(location, int):
+            address = location
+        elif location.strip().upper() in self.symbols:
+            address = self.symbols[location.strip().upper()]
+        else:
+            try:
+                address = int(location, 0)
+            except ValueError:
+                raise ValueError(f"Unknown label or address: {location!r}") from None
+        if not 0 <= address < len(self.memory):
+            raise ValueError(f"Address out of range: {location!r}")
+        return address
+
+    def add_breakpoint(self, location):
+        """Stop run_full before the instruction at location (address or label) executes."""
+        self.breakpoints.add(self.resolve_address(location))
+
+    def remove_breakpoint(self, location):
+        self.breakpoints.discard(self.resolve_address(location))
+
+    def toggle_breakpoint(self, location):
+        """Set or clear a breakpoint; returns True if it is set now."""
+        address = self.resolve_address(location)
+        if address in self.breakpoints:
+            self.breakpoints.remove(address)
+            return False
+        self.breakpoints.add(address)
+        return True
+
+    def add_watchpoint(self, location, mode="w"):
+        """Stop run_full after an instruction reads ("r"), writes ("w") or accesses ("rw") a memory cell."""
+        if not mode or set(mode) - {"r", "w"}:
+            raise ValueError(f"Watchpoint mode must be 'r', 'w' or 'rw', got: {mode!r}")
+        self.watchpoints[self.resolve_address(location)] = mode
+
+    def remove_watchpoint(self, location):
+        self.watchpoints.pop(self.resolve_address(location), None)
+
+    def _watch_hit(self, address):
+        """The watched memory cell the instruction at address would access now, or None."""
+        read, write = self.memory_accesses(address)
+        if read is not None and "r" in self.watchpoints.get(read, ""):
+            return read
+        if write is not None and "w" in self.watchpoints.get(write, ""):
+            return write
+        return None
+
+    def to_bytes(self):
+        """Serialize the full machine state (memory, IP, registers, flags, halted) to bytes."""
+        return STATE_FORMAT.pack(bytes(self.memory), self.ip, self.register_A, self.register_B,
+                                 self.register_C, self.flags, self.halted)
+
+    @classmethod
+    def from_bytes(cls, state, **options):
+        """Create an emulator from the result of to_bytes(); options are passed to __init__."""
+        memory, ip, a, b, c, flags, halted = STATE_FORMAT.unpack(state)
+        emulator = cls(**options)
+        emulator.memory[:] = memory     # nothing is predecoded yet: decoded on first execution
+        emulator.ip = ip
+        emulator.register_A, emulator.register_B, emulator.register_C = a, b, c
+        emulator.flags = flags
+        emulator.halted = halted
+        return emulator
+
+    def snapshot(self):
+        """Capture the machine state (memory, IP, registers, flags, halted) as a Snapshot."""
+        return Snapshot(bytes(self.memory), self.ip, self.register_A, self.register_B, self.register_C,
+                        self.flags, self.halted, (self._dispatch, self._cycle_costs),
+                        None if self._decoded is None else tuple(self._decoded))
+
+    def restore(self, snapshot):
+        """Return to the state captured by snapshot(). Memory is only copied if it changed."""
+        if self.memory != snapshot.memory:
+            self.memory[:] = snapshot.memory
+            for listener in self._write_listeners:
+                listener(0, len(self.memory))
+        if snapshot.decoded is not None and snapshot.dispatch == (self._dispatch, self._cycle_costs):
+            self._predecoded()[:] = snapshot.decoded
+        elif self._decoded is not None:
+            self._decoded[:] = [None] * len(self.memory)
+        self.ip = snapshot.ip
+        self.register_A, self.register_B, self.register_C = snapshot.register_A, snapshot.register_B, snapshot.register_C
+        self.flags = snapshot.flags
+        self.halted = snapshot.halted
+
+    def fork(self):
+        """
+        Return an independent copy of this emulator in its current state, e.g. to run many
+        continuations from a checkpoint. The copy shares the trace sink, profiler and call
+        memo but no compiled blocks.
+        """
+        clone = object.__new__(type(self))
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        clone.memory = bytearray(self.memory)
+        clone._decoded = None if self._decoded is None else list(self._decoded)
+        clone._write_listeners = []
+        clone._compiler = None
+        clone.breakpoints = set(self.breakpoints)
+        clone.watchpoints = dict(self.watchpoints)
+        return clone
 
     def memory_dump(self, start=0x00, end=None):
         """Print a formatted hex dump of memory from start to end (exclusive)."""
@@ -50,7 +498,20 @@ class SimpleCPUEmulator:
             lines.append(f"{addr:02X}: {hex_bytes}")
         print("\n".join(lines))
     
-    # Updating the flags after executing an ALU operation
+    # The individual flags as 0/1, stored in the status byte
+    def _flag_property(mask):
+        return property(lambda self: 1 if self.flags & mask else 0,
+                        lambda self, value: setattr(self, "flags", self.flags | mask if value else self.flags & ~mask))
+
+    flag_Z = _flag_property(FLAG_Z)
+    flag_S = _flag_property(FLAG_S)
+    flag_V = _flag_property(FLAG_V)
+    flag_C = _flag_property(FLAG_C)
+    del _flag_property
+
+    # Updating the flags after executing an ALU operation.
+    # The opcode handlers use the precomputed tables in alu.py instead; this is the reference
+    # definition the tables are built from and verified against.
     def update_flags(self, total, result, op1, op2):
         
         self.flag_Z = 1 if result == 0 else 0
@@ -91,39 +552,286 @@ class SimpleCPUEmulator:
         else:
             self.run_full()
     
-    def run_full(self):
-        while not self.halted and 0 <= self.ip < len(self.memory):
-            opcode = self.memory[self.ip]
-            self.ip += 1
+    def step(self):
+        """Execute a single (predecoded) instruction."""
+        address = self.ip
+        operation, operand, length, tally = (self._decoded or self._predecoded())[address] or self._decode(address)
+        if self.trace is not None and operation is not _invalid_opcode:
+            opcode = self.memory[address]
+            self.trace(TraceEvent(address, opcode, self.opcode_names[opcode], operand))
+        self.ip = address + length
+        operation(self, operand)
+        self.steps += 1
+        self.cycles += tally >> TALLY_SHIFT
+
+    def run_full(self, max_steps=None, time_limit=None, detect_loops=False, report=False):
+        """
+        Run until HLT or the IP leaves memory and return a RunOutcome.
+        With a profiler attached (see profiler.py) every instruction is counted. The run
+        stops at breakpoints and watchpoints; the instruction at the IP when run_full is
+        called always executes, so calling it again continues after a breakpoint.
+        max_steps:    stop after this many instructions
+        time_limit:   stop after this many seconds (checked every 1024 instructions)
+        detect_loops: stop as soon as the machine state after a backward jump repeats.
+                      A hash of every state seen there is kept, so memory grows with the run.
+        report:       count the executed opcodes and return a RunReport (cycles, memory
+                      accesses, breakdown by opcode group) in the outcome's report field
+        The cycles of the executed instructions are added to self.cycles in every mode.
+        With a call memo attached (see memo.py) routines entered through CALL are replayed
+        from recordings, unless the run traces, profiles, reports or has breakpoints,
+        watchpoints, a time limit or loop detection; only a step budget is supported.
+        Loops are fast-forwarded: a JMP to itself (or a taken conditional branch to itself)
+        ends the run with status "idle" at once (with max_steps, the remaining steps are
+        counted as executed), and a DCR / INR, JZ, JMP loop jumps to its final state.
+        Registers, flags, steps and cycles are exactly those of executing the loops.
+        Loops are executed instruction by instruction instead if any of these holds:
+          - fast_forward is False
+          - a call memo is attached and runs the program
+          - a trace sink or a profiler is attached, or report is set
+          - breakpoints or watchpoints are set, or detect_loops is set
+        """
+        if (self.memo is not None and self.trace is None and self.profiler is None and not self.breakpoints
+                and not self.watchpoints and time_limit is None and not detect_loops and not report):
+            return self.memo.run(self, max_steps)
+        if (self.trace is not None or self.profiler is not None or self.breakpoints or self.watchpoints
+                or max_steps is not None or time_limit is not None or detect_loops or report):
+            if not report:
+                return self._run_limited(max_steps, time_limit, detect_loops)
+            counts = [0] * 256
+            outcome = self._run_limited(max_steps, time_limit, detect_loops, counts)
+            return outcome._replace(report=self.run_report(counts))
+
+        # Silent run: no trace events are built, instructions come from the predecoded array
+        decoded = self._predecoded()
+        size = len(self.memory)
+        tallies = 0
+        status = None
+        self._fast_forwarding = self.fast_forward
+        try:
+            while status is None:
+                try:
+                    while not self.halted:
+                        ip = self.ip
+                        if not 0 <= ip < size:
+                            break
+                        operation, operand, length, tally = decoded[ip] or self._decode(ip)
+                        self.ip = ip + length
+                        operation(self, operand)
+                        tallies += tally
+                    status = "halted" if self.halted else "ip_out_of_range"
+                except FastForward as loop:
+                    if loop.steps is None:
+                        self.ip = loop.address
+                        status = "idle"
+                    else:
+                        self._skip_loop(loop)
+                        tallies += (loop.cycles << TALLY_SHIFT) | loop.steps
+        finally:
+            self._fast_forwarding = False
+            steps = tallies & TALLY_STEPS
+            self.steps += steps
+            self.cycles += tallies >> TALLY_SHIFT
+        return RunOutcome(status, steps, None)
 
-            operation = self.dispatch_table.get(opcode)
-            if operation is None:
-                raise Exception(f"Invalid opcode @ {self.ip-1:02X}: {opcode:02X}")
-            operation(self)
+    def run_report(self, opcode_counts):
+        """A RunReport for the given executions per opcode byte (e.g. Profiler.opcode_counts)."""
+        costs = self._cycle_costs
+        groups = {}
+        total_cycles = reads = writes = 0
+        for opcode, count in enumerate(opcode_counts):
+            if not count:
+                continue
+            cycles = count * costs.get(opcode, 0)
+            accesses = count * ((opcode in self.opcode_reads) + (opcode in self.opcode_writes))
+            total_cycles += cycles
+            reads += count * (opcode in self.opcode_reads)
+            writes += count * (opcode in self.opcode_writes)
+            group = self.opcode_groups.get(opcode, "other")
+            instructions, group_cycles, group_accesses = groups.get(group, (0, 0, 0))
+            groups[group] = (instructions + count, group_cycles + cycles, group_accesses + accesses)
+        order = ("alu", "memory", "branch", "other")
+        return RunReport(sum(opcode_counts), total_cycles, reads, writes,
+                         {group: groups[group] for group in order if group in groups})
+
+    def _run_limited(self, max_steps, time_limit, detect_loops, counts=None):
+        """
+        run_full with budgets, loop detection, tracing, profiling or breakpoints.
+        counts: optional list receiving the executions per opcode byte (for run reports).
+        """
+        traced = self.trace is not None
+        profiler = self.profiler
+        if profiler is not None:
+            address_counts = profiler.address_counts
+            opcode_counts = profiler.opcode_counts
+        breakpoints = self.breakpoints
+        watchpoints = self.watchpoints
+        # Only opcodes that access memory as data can hit a watchpoint
+        accessing = self.opcode_reads.keys() | self.opcode_writes.keys() if watchpoints else ()
+        memory = self.memory
+        decoded = self._predecoded()
+        size = len(self.memory)
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        # The clock is read every 1024 steps; fast-forwarded loops advance steps in bulk
+        next_check = 0
+        # The machine is deterministic: if its complete state repeats, it loops forever.
+        # Every loop contains a jump to a lower (or the same) address, so only states
+        # right after such jumps are recorded: their hashes, mapped to the step count they
+        # were seen at. A matching hash is confirmed by running one period on a copy.
+        seen = {} if detect_loops else None
+        steps = 0
+        tallies = 0
+        self._fast_forwarding = (self.fast_forward and not traced and profiler is None and not breakpoints
+                                 and not watchpoints and seen is None and counts is None)
+        try:
+            while True:
+                if self.halted:
+                    return RunOutcome("halted", steps, None)
+                ip = self.ip
+                if not 0 <= ip < size:
+                    return RunOutcome("ip_out_of_range", steps, None)
+                if max_steps is not None and steps >= max_steps:
+                    return RunOutcome("step_budget", steps, None)
+                if deadline is not None and steps >= next_check:
+                    if time.monotonic() > deadline:
+                        return RunOutcome("time_budget", steps, None)
+                    next_check = steps + 1024
+                if breakpoints and steps and ip in breakpoints:
+                    return RunOutcome("breakpoint", steps, None, ip)
+                watched = self._watch_hit(ip) if watchpoints and memory[ip] in accessing else None
+
+                if profiler is not None:
+                    address_counts[ip] += 1
+                    opcode_counts[memory[ip]] += 1
+                if counts is not None:
+                    counts[memory[ip]] += 1
+                if traced:
+                    self.step()
+                else:
+                    operation, operand, length, tally = decoded[ip] or self._decode(ip)
+                    self.ip = ip + length
+                    try:
+                        operation(self, operand)
+                    except FastForward as loop:
+                        if loop.steps is None:
+                            self.ip = loop.address
+                            if max_steps is None:
+                                return RunOutcome("idle", steps, None)
+                            # Spend the rest of the budget in the loop
+                            tallies += ((max_steps - steps) * loop.cycles) << TALLY_SHIFT
+                            steps = max_steps
+                            continue
+                        if max_steps is None or steps + loop.steps <= max_steps:
+                            self._skip_loop(loop)
+                            tallies += loop.cycles << TALLY_SHIFT
+                            steps += loop.steps
+                            continue
+                        # The budget ends inside the loop: run it instruction by instruction
+                        self._fast_forwarding = False
+                        operation(self, operand)
+                        self._fast_forwarding = True
+                    tallies += tally
+                steps += 1
+                if watched is not None:
+                    return RunOutcome("watchpoint", steps, None, watched)
+
+                if seen is not None and self.ip <= ip:
+                    state = (self.ip, self.register_A, self.register_B, self.register_C,
+                             self.flags, bytes(self.memory))
+                    key = hash(state)
+                    first = seen.setdefault(key, steps)
+                    if first != steps:
+                        if self._returns_to(state, steps - first):
+                            return RunOutcome("loop", steps, steps - first)
+                        seen[key] = steps       # a hash collision
+        finally:
+            self._fast_forwarding = False
+            if not traced:      # step() counts its own instructions and cycles
+                self.steps += steps
+                self.cycles += tallies >> TALLY_SHIFT
+
+    def _returns_to(self, state, steps):
+        """Whether the machine is in state (see _run_limited) again after steps more instructions."""
+        clone = self.fork()
+        clone.trace = clone.profiler = clone.memo = None
+        clone.breakpoints, clone.watchpoints = set(), {}
+        outcome = clone.run_full(max_steps=steps)
+        return outcome.status == "step_budget" and state == (
+            clone.ip, clone.register_A, clone.register_B, clone.register_C, clone.flags, bytes(clone.memory))
+
+    def run_compiled(self, leaders=None):
+        """
+        Run like run_full, but execute compiled basic blocks (see block_compiler.py).
+        Produces no trace events. Returns the number of executed instructions.
+        leaders: addresses where blocks must start, e.g. analyzer.analyze(...).leaders();
+        only used when the first compiled run creates the block compiler.
+        """
+        if self._compiler is None:
+            self._compiler = BlockCompiler(self, leaders)
+        return self._compiler.run()
 
     def run_step_by_step(self):
+        # Every step is recorded, so [B]ack and [G]oto can move backwards (see time_travel.py)
+        history = History(self)
+
         # step loop
         while not self.halted and 0 <= self.ip < len(self.memory):
-            opcode = self.memory[self.ip]
-            self.ip += 1
-            operation = self.dispatch_table.get(opcode)
-            if operation is None:
-                raise Exception(f"Invalid opcode @ {self.ip-1:02X}: {opcode:02X}")
-            operation(self)
+            history.step()
 
             # show state
             self.display_current_state()
 
             # interactive menu
             while True:
-                print("\nOptions: [N]ext  [R]un to end  [D]ump memory  [I]nspect addr  [W]rite addr")
+                print(f"\nStep {history.position}")
+                print("Options: [N]ext  [B]ack  [G]oto step  [C]ontinue to breakpoint  [T]oggle breakpoint")
+                print("         [R]un to end  [D]ump memory  [I]nspect addr  [W]rite addr")
                 choice = input("Choice (default N): ").strip().lower() or 'n'
                 if choice == 'n':
                     # do one more step
                     break
+                elif choice == 'b':
+                    # undo the last step
+                    if history.position == 0:
+                        print("  >> already at the first step")
+                    else:
+                        history.back()
+                        self.display_current_state()
+                elif choice == 'g':
+                    step_s = input("  Step number? ")
+                    try:
+                        history.goto(int(step_s, 0))
+                        self.display_current_state()
+                    except ValueError:
+                        print("  >> bad number")
+                elif choice == 'c':
+                    # run (recording the history) until a breakpoint or watchpoint is hit
+                    while not self.halted and 0 <= self.ip < len(self.memory):
+                        watched = self._watch_hit(self.ip) if self.watchpoints else None
+                        history.step()
+                        if self.halted or not 0 <= self.ip < len(self.memory):
+                            break
+                        if watched is not None:
+                            print(f"  Watchpoint [{watched:02X}]")
+                            break
+                        if self.ip in self.breakpoints:
+                            print(f"  Breakpoint @ {self.ip:02X}")
+                            break
+                    self.display_current_state()
+                    if self.halted or not 0 <= self.ip < len(self.memory):
+                        break
+                elif choice == 't':
+                    location = input("  Address or label? ")
+                    try:
+                        if self.toggle_breakpoint(location):
+                            print(f"  Breakpoint set @ {self.resolve_address(location):02X}")
+                        else:
+                            print(f"  Breakpoint cleared @ {self.resolve_address(location):02X}")
+                    except ValueError as error:
+                        print(f"  >> {error}")
                 elif choice == 'r':
-                    # finish the program in full
-                    self.run_full()
+                    # finish the program in full, passing breakpoints and watchpoints
+                    while self.run_full().status in ("breakpoint", "watchpoint"):
+                        pass
                     return
                 elif choice == 'd':
                     self.memory_dump()
@@ -144,8 +852,10 @@ class SimpleCPUEmulator:
                         addr = int(addr_s, 0)
                         val  = int(val_s, 0) & 0xFF
                         if 0 <= addr < len(self.memory):
-                            self.memory[addr] = val
+                            self.write_memory(addr, val)
                             print(f"  Wrote {val:02X} to [{addr:02X}]")
+                            # The history cannot undo manual writes: start a new one here
+                            history.reset()
                         else:
                             print("  >> address out of range")
                     except ValueError:
@@ -0,0 +1,29 @@
+# Tests of the precomputed ALU tables (alu.py)
+
+from alu import ALU_ADD, ALU_CMA, ALU_SUB, FLAG_C, FLAG_S, FLAG_V, FLAG_Z, reference_handlers, verify_tables
+from simple_cpu_emulator import SimpleCPUEmulator
+
+
+def test_tables_match_update_flags_over_full_operand_space():
+    assert verify_tables() == []
+
+
+def test_every_alu_opcode_has_a_reference_handler():
+    assert set(reference_handlers()) <= set(SimpleCPUEmulator.dispatch_table)
+
+
+def test_packed_entries():
+    # result in the low byte, status byte above it
+    assert ALU_ADD[(0x7F << 8) | 0x01] == 0x80 | (FLAG_S | FLAG_V) << 8
+    assert ALU_ADD[(0xFF << 8) | 0x01] == 0x00 | (FLAG_Z | FLAG_C) << 8
+    assert ALU_SUB[(0x05 << 8) | 0x05] & 0xFF == 0
+    assert ALU_SUB[(0x05 << 8) | 0x05] >> 8 & FLAG_Z
+    assert ALU_CMA[0x0F] & 0xFF == 0xF0
+
+
+def test_alu_opcode_sets_register_and_flags():
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory([0x20, 0x7F, 0x21, 0x01, 0x02, 0x3F])    # MVI A / MVI B / ADD B / HLT
+    emulator.run_full()
+    assert emulator.register_A == 0x80
+    assert (emulator.flag_S, emulator.flag_V, emulator.flag_Z, emulator.flag_C) == (1, 1, 0, 0)
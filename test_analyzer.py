@@ -0,0 +1,149 @@
+# Tests of the static control-flow analyzer (analyzer.py)
+
+import json
+
+from analyzer import BasicBlock, Edge, Finding, Loop, analyze
+from simple_assembler import SimpleAssembler
+
+PROGRAM = """
+    MVI B 0x03
+loop:
+    DCR B
+    JZ done
+    JMP loop
+done:
+    CALL sub
+    HLT
+sub:
+    CALL inner
+    STA 0xFF
+    RET
+inner:
+    RET
+"""
+
+
+def analyzed(source):
+    assembler = SimpleAssembler()
+    image = assembler.assemble_bytes(source)
+    return analyze(image, source_map=assembler.source_map), assembler.labels
+
+
+def test_blocks_and_edges():
+    analysis, labels = analyzed(PROGRAM)
+    assert labels == {"LOOP": 0x02, "DONE": 0x07, "SUB": 0x0A, "INNER": 0x0F}
+    assert sorted(analysis.blocks) == [0x00, 0x02, 0x05, 0x07, 0x09, 0x0A, 0x0C, 0x0F]
+    assert analysis.blocks[0x02] == BasicBlock(0x02, 0x05, analysis.blocks[0x02].instructions)
+    assert [instruction.opcode for instruction in analysis.blocks[0x02].instructions] == [0x0D, 0x2D]
+    assert set(analysis.edges) >= {
+        Edge(0x00, 0x02, "fallthrough"),
+        Edge(0x02, 0x07, "branch"),
+        Edge(0x02, 0x05, "fallthrough"),
+        Edge(0x05, 0x02, "jump"),
+        Edge(0x07, 0x0A, "call"),
+        Edge(0x07, 0x09, "return"),
+        Edge(0x0A, 0x0F, "call"),
+    }
+    assert analysis.routines == [0x0A, 0x0F]
+    assert analysis.leaders() == set(analysis.blocks)
+    assert analysis.block_of(0x03).start == 0x02
+    assert analysis.block_of(0x40) is None
+
+
+def test_loops():
+    analysis, _ = analyzed(PROGRAM)
+    assert analysis.loops == [Loop(0x02, 0x05, [0x02, 0x05])]
+
+
+def test_nested_loops():
+    analysis, labels = analyzed("""
+        MVI C 0x02
+    outer:
+        MVI B 0x02
+    inner:
+        DCR B
+        JZ next
+        JMP inner
+    next:
+        DCR C
+        JZ done
+        JMP outer
+    done:
+        HLT
+    """)
+    headers = {loop.header: loop for loop in analysis.loops}
+    assert set(headers) == {labels["OUTER"], labels["INNER"]}
+    assert set(headers[labels["INNER"]].blocks) < set(headers[labels["OUTER"]].blocks)
+
+
+def test_nested_call_and_store_into_the_return_address():
+    analysis, labels = analyzed(PROGRAM)
+    kinds = {finding.kind: finding for finding in analysis.findings}
+    assert kinds["nested_call"].address == labels["SUB"]
+    assert kinds["store_into_return_address"].address == labels["SUB"] + 2
+    assert set(kinds) == {"nested_call", "store_into_return_address"}
+
+
+def test_store_into_code():
+    analysis, _ = analyzed("""
+        MVI A 0x05
+        STA 0x01
+        HLT
+    """)
+    assert analysis.findings == [Finding("store_into_code", 0x02, "stores into the code at 01")]
+
+
+def test_call_into_a_routine_at_the_end_of_memory():
+    image = bytearray(256)
+    image[0:3] = bytes([0x30, 0xFE, 0x3F])      # CALL 0xFE / HLT
+    image[0xFE:0x100] = bytes([0x3E, 0x31])     # NOP / RET
+    analysis = analyze(image)
+    assert Finding("call_overwrites_code", 0x00, "stores into the code at FF") in analysis.findings
+
+
+def test_invalid_opcode_and_running_off_memory():
+    analysis = analyze(bytes([0x20, 0x01, 0x2D, 0x05, 0xEE, 0x3F]))     # MVI A / JZ 0x05 / ?? / HLT
+    assert [(finding.kind, finding.address) for finding in analysis.findings] == [("invalid_opcode", 0x04)]
+    assert analysis.unreachable == [(0x04, 0x05)]
+
+    image = bytearray(256)
+    image[0:2] = bytes([0x2B, 0xFF])        # JMP 0xFF
+    image[0xFF] = 0x20                      # MVI A without its operand byte
+    analysis = analyze(image)
+    assert [(finding.kind, finding.address) for finding in analysis.findings] == [("falls_off_memory", 0xFF)]
+
+
+def test_unreachable_ranges_follow_the_source_map():
+    analysis, _ = analyzed("""
+        JMP start
+        0x00
+        0x07
+    start:
+        HLT
+    """)
+    # The data bytes are emitted by the assembler, even the zero
+    assert analysis.unreachable == [(0x02, 0x04)]
+
+
+def test_to_dot():
+    analysis, labels = analyzed(PROGRAM)
+    dot = analysis.to_dot(labels)
+    assert dot.startswith("digraph cfg {") and dot.endswith("}")
+    assert 'b02 [label="LOOP:\\l02: DCR B\\l03: JZ 0x07\\l"];' in dot
+    assert "b05 -> b02;" in dot
+    assert 'b02 -> b07 [label="taken"];' in dot
+    assert 'b07 -> b0A [style=dashed, label="call"];' in dot
+    assert dot.count(" -> ") == len(analysis.edges)
+
+
+def test_to_dict():
+    analysis, labels = analyzed(PROGRAM)
+    graph = json.loads(json.dumps(analysis.to_dict(labels)))
+    assert graph["entry_points"] == ["00"]
+    assert graph["routines"] == ["0A", "0F"]
+    blocks = {block["start"]: block for block in graph["blocks"]}
+    assert blocks["02"] == {"start": "02", "end": "05", "labels": ["LOOP"],
+                            "instructions": ["02: DCR B", "03: JZ 0x07"]}
+    assert {"source": "05", "target": "02", "kind": "jump"} in graph["edges"]
+    assert graph["loops"] == [{"header": "02", "latch": "05", "blocks": ["02", "05"]}]
+    assert {finding["kind"] for finding in graph["findings"]} == {"nested_call", "store_into_return_address"}
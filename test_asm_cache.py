@@ -0,0 +1,104 @@
+# Tests of the on-disk assembly cache (asm_cache.py)
+
+import json
+
+from asm_cache import AssemblyCache
+from object_format import read_object
+from simple_assembler import SimpleAssembler
+
+SOURCE = """
+start:
+    MVI A 0x02      ; two
+    ADD B
+    STA result
+    HLT
+result:
+    0x00
+"""
+
+
+def test_miss_then_hit_returns_the_same_program(tmp_path):
+    cache = AssemblyCache(tmp_path)
+    first = cache.assemble_with_listing(SOURCE, SimpleAssembler())
+    assembler = SimpleAssembler()
+    second = cache.assemble_with_listing(SOURCE, assembler)
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert second == first == SimpleAssembler().assemble_with_listing(SOURCE)
+    assert assembler.labels == {"START": 0, "RESULT": 6}
+
+
+def test_hit_leaves_the_assembler_ready_for_output(tmp_path):
+    cache = AssemblyCache(tmp_path / "cache")
+    fresh = SimpleAssembler()
+    fresh.assemble(SOURCE + "ORG 0x20\nDB 0x07\n")
+    cache.assemble(SOURCE + "ORG 0x20\nDB 0x07\n")
+    assembler = SimpleAssembler()
+    cache.assemble(SOURCE + "ORG 0x20\nDB 0x07\n", assembler)
+    assert cache.hits == 1
+    assert assembler.source_map == fresh.source_map
+    assert assembler.listing() == fresh.listing()
+    for name, write in (("hit", assembler), ("fresh", fresh)):
+        write.write_object(tmp_path / f"{name}.obj")
+        write.write_intel_hex(tmp_path / f"{name}.hex")
+    assert read_object(tmp_path / "hit.obj") == read_object(tmp_path / "fresh.obj")
+    assert read_object(tmp_path / "hit.obj").image[0x20] == 0x07
+    assert (tmp_path / "hit.hex").read_text() == (tmp_path / "fresh.hex").read_text()
+
+
+def test_hit_survives_a_new_cache_object(tmp_path):
+    AssemblyCache(tmp_path).assemble(SOURCE)
+    cache = AssemblyCache(tmp_path)
+    assert cache.assemble(SOURCE) == SimpleAssembler().assemble(SOURCE)
+    assert cache.hits == 1
+
+
+def test_whitespace_edits_hit_and_code_edits_miss(tmp_path):
+    cache = AssemblyCache(tmp_path)
+    cache.assemble(SOURCE)
+    cache.assemble(SOURCE.replace("    ADD B", "  ADD B   "))
+    assert cache.hits == 1
+    changed = SOURCE.replace("ADD B", "ADD C")
+    assert cache.assemble(changed) == SimpleAssembler().assemble(changed)
+    assert cache.misses == 2
+
+
+def test_optimized_and_plain_assembly_are_cached_separately(tmp_path):
+    cache = AssemblyCache(tmp_path)
+    cache.assemble(SOURCE, SimpleAssembler())
+    cache.assemble(SOURCE, SimpleAssembler(optimize=True))
+    assert cache.misses == 2
+
+
+def test_eviction_keeps_the_cache_bounded(tmp_path):
+    cache = AssemblyCache(tmp_path, max_bytes=2000)
+    for value in range(20):
+        cache.assemble(SOURCE.replace("0x02", hex(value)))
+    assert cache.stats()["bytes"] <= 2000
+    assert cache.evictions > 0
+
+
+def test_unreadable_entries_are_reassembled(tmp_path):
+    cache = AssemblyCache(tmp_path)
+    cache.assemble(SOURCE)
+    for path in tmp_path.glob("*.json"):
+        path.write_text("{broken")
+    assert cache.assemble(SOURCE) == SimpleAssembler().assemble(SOURCE)
+    assert cache.misses == 2
+
+
+def test_entries_missing_a_field_are_reassembled_and_rewritten(tmp_path):
+    cache = AssemblyCache(tmp_path)
+    cache.assemble(SOURCE)
+    path, = tmp_path.glob("*.json")
+    entry = json.loads(path.read_text())
+    for field in ["labels", "source_map", "emitted", "image", "listing"]:
+        path.write_text(json.dumps({name: value for name, value in entry.items() if name != field}))
+        assembler = SimpleAssembler()
+        assert cache.assemble(SOURCE, assembler) == SimpleAssembler().assemble(SOURCE), field
+        assert assembler.labels == {"START": 0, "RESULT": 6}
+        assert json.loads(path.read_text()) == entry, field
+    assert (cache.hits, cache.misses) == (0, 6)
+    path.write_text("[]")
+    cache.assemble(SOURCE)
+    cache.assemble(SOURCE)
+    assert (cache.hits, cache.misses) == (1, 7)
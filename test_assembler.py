@@ -0,0 +1,236 @@
+# Tests of the assembler (simple_assembler.py)
+
+import pytest
+
+from benchmark import TEST_PROGRAMS
+from simple_assembler import SimpleAssembler
+
+
+# The programs of test_programs.md in assembly, assembling to the same bytes
+SOURCES = {
+    "arithmetic": """
+    MVI A 0x0A
+    MVI B 0x05
+    ADD B
+    SUB B
+    INR A
+    DCR A
+    HLT
+""",
+    "logic": """
+    MVI A 0xF0
+    MVI B 0x0F
+    ANA B
+    CMA
+    ANI 0xAA
+    ORI 0x55
+    XRI 0x0F
+    TST
+    HLT
+""",
+    "regmove": """
+    MVI A 0x11
+    MOV A,B
+    MVI B 0x22
+    MOV A, B
+    MOV B,A
+    MVI C 0x33
+    MOV B,C
+    MOV C,A
+    MOV C,B
+    HLT
+""",
+    "memory": """
+    MVI A 0xAA
+    STA 0x10
+    MVI B 0x05
+    LDB 0x10
+    MVI C 0x05
+    LDA C
+    STA C
+    LDA 0x10
+    HLT
+""",
+    "branches": """
+; every conditional branch falls through
+    MVI A 0x00
+    INR A           ; A=1, Z=0, S=0, C=0, V=0
+    JS 0x07
+    JZ 0x07
+    JC 0x07
+    JV 0x07
+    JMP landed      ; unconditional
+    HLT             ; skipped
+landed:             ; landed here via JMP
+    MVI A 0xFF
+    HLT
+""",
+    "call": """
+    MVI A 0x02
+    CALL routine    ; return address to 0xFF
+    HLT
+    NOP             ; padding up to the routine
+    NOP
+routine:
+    MVI B 0x03
+    ADD B           ; A = 2 + 3
+    RET
+""",
+    "misc": """
+    NOP
+    nop
+    HLT
+""",
+    "loop": """
+    MVI B 5
+loop:
+    DCR B
+    JZ done
+    JMP loop
+done:
+    HLT
+""",
+}
+
+MIXED = """; header
+    MVI A 0x02      ; A = 2
+    CALL sub        ; call
+    HLT
+sub:                ; the routine
+    MVI B 0x03
+    ADD B
+    RET
+value:              ; data after a label
+    0x05
+ORG 0x20
+DB 0x01, 0x02   ; table
+"""
+
+
+def scanned(line):
+    """The mnemonic split of the original assembler: the longest key the line starts with."""
+    code = line.split(';', 1)[0].strip().upper()
+    code = code.replace(', ', ',').replace(' ,', ',')
+    for key in sorted(SimpleAssembler.OPCODES.keys(), key=len, reverse=True):
+        if code.startswith(key):
+            return key, code[len(key):].strip()
+    raise ValueError(f"Unknown instruction in line: {line!r}")
+
+
+def split(line):
+    return SimpleAssembler()._split_mnemonic(line)
+
+
+def test_matcher_agrees_with_the_startswith_scan():
+    operands = ["", " 0x10", " 7", " LOOP", " B", " C", "  ; comment", " 0x01 ; comment"]
+    lines = [key + operand for key in SimpleAssembler.OPCODES for operand in operands]
+    lines += [line.lower() for line in lines] + ["  " + line + "  " for line in lines]
+    lines += ["MOV A, B", "mov b ,c", "MOV C , A", "Lda 0x20", "sta\t0x30"]
+    for line in lines:
+        assert split(line) == scanned(line), line
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("LDA 0x20", ("LDA", "0X20")),
+    ("LDA C", ("LDA C", "")),
+    ("lda c ; via C", ("LDA C", "")),
+    ("STA 0x20", ("STA", "0X20")),
+    ("STA C", ("STA C", "")),
+    ("STA total", ("STA", "TOTAL")),
+    ("MOV A,B", ("MOV A,B", "")),
+    ("MOV A, C", ("MOV A,C", "")),
+    ("mov b , a", ("MOV B,A", "")),
+    ("MOV C,B", ("MOV C,B", "")),
+    ("MVI C 0x05", ("MVI C", "0X05")),
+    ("ADD C", ("ADD C", "")),
+])
+def test_overlapping_mnemonics(line, expected):
+    assert split(line) == expected
+
+
+@pytest.mark.parametrize("line", ["LDA counter", "STA cell", "LDA c1"])
+def test_mnemonic_ends_at_a_word_boundary(line):
+    # The startswith scan read these as LDA C / STA C and dropped the rest of the operand
+    mnemonic, operand = split(line)
+    assert (mnemonic, operand) == (line.split()[0].upper(), line.split()[1].upper())
+    image = SimpleAssembler().assemble(f"{line}\nHLT\n{line.split()[1]}:\n0x00\n")
+    assert list(image) == [SimpleAssembler.OPCODES[mnemonic][0], 0x03, 0x3F, 0x00]
+
+
+@pytest.mark.parametrize("line", ["FOO", "MO A,B", "MOV  A,B", "MOV D,A", "LDAX 0x10", "JMPX", "", "; comment"])
+def test_unknown_mnemonics_are_rejected(line):
+    with pytest.raises(ValueError, match="Unknown instruction in line"):
+        split(line)
+
+
+def test_subclass_with_more_opcodes_gets_its_own_pattern():
+    class ExtendedAssembler(SimpleAssembler):
+        OPCODES = {**SimpleAssembler.OPCODES, "LDAX": (0x27, 1, "none")}
+
+    assert ExtendedAssembler()._split_mnemonic("LDAX") == ("LDAX", "")
+    assert ExtendedAssembler()._split_mnemonic("LDA X") == ("LDA", "X")
+    with pytest.raises(ValueError, match="Unknown instruction in line"):
+        split("LDAX")
+
+
+@pytest.mark.parametrize("name", SOURCES)
+def test_assemble_bytes_matches_assemble_on_the_test_programs(name):
+    assembler = SimpleAssembler()
+    image = assembler.assemble_bytes(SOURCES[name])
+    assert isinstance(image, bytearray)
+    assert image == bytes(TEST_PROGRAMS[name])
+    labels, listing = dict(assembler.labels), assembler.listing()
+    machine, machine_listing = assembler.assemble_with_listing(SOURCES[name])
+    assert machine == TEST_PROGRAMS[name] and machine_listing == listing
+    assert assembler.labels == labels
+    assert [repr(byte) for byte in machine] == [f"0x{byte:02X}" for byte in image]
+
+
+def test_labels_and_listing_of_the_test_programs():
+    assembler = SimpleAssembler()
+    assembler.assemble_bytes(SOURCES["loop"])
+    assert assembler.labels == {"LOOP": 0x02, "DONE": 0x07}
+    assert assembler.listing() == "\n".join(f"{address:02X}: 0x{byte:02X}"
+                                            for address, byte in enumerate(TEST_PROGRAMS["loop"]))
+    assembler.assemble_bytes(SOURCES["call"])
+    assert assembler.labels == {"ROUTINE": 0x07}
+    assert assembler.listing().splitlines() == [
+        "00: 0x20", "01: 0x02", "02: 0x30 ; return address to 0xFF", "03: 0x07", "04: 0x3F",
+        "05: 0x3E ; padding up to the routine", "06: 0x3E", "07: 0x21", "08: 0x03", "09: 0x02 ; A = 2 + 3",
+        "0A: 0x31",
+    ]
+
+
+def test_org_db_and_data_lines():
+    assembler = SimpleAssembler()
+    image = assembler.assemble_bytes(MIXED)
+    assert image == bytes([0x20, 0x02, 0x30, 0x05, 0x3F, 0x21, 0x03, 0x02, 0x31, 0x05]) + bytes(22) + bytes([1, 2])
+    assert assembler.labels == {"SUB": 0x05, "VALUE": 0x09}
+    assert assembler.listing().splitlines() == [
+        "00: 0x20 ; A = 2", "01: 0x02", "02: 0x30 ; call", "03: 0x05", "04: 0x3F", "05: 0x21", "06: 0x03",
+        "07: 0x02", "08: 0x31", "09: 0x05 ; data after a label", "20: 0x01 ; table", "21: 0x02 ; table",
+    ]
+    # Addresses nothing was emitted to are plain zeros in the machine list
+    machine = assembler.assemble(MIXED)
+    assert [repr(byte) for byte in machine[0x09:0x0C]] == ["0x05", "0", "0"]
+
+
+def test_source_map_maps_every_emitted_byte_to_its_line():
+    assembler = SimpleAssembler()
+    image = assembler.assemble_bytes(MIXED)
+    assert len(assembler.source_map) == len(image)
+    assert list(assembler.source_map) == [2, 2, 3, 3, 4, 6, 6, 7, 8, 10] + [0] * 22 + [12, 12]
+    listed = {int(line[:2], 16) for line in assembler.listing().splitlines()}
+    assert {address for address, line in enumerate(assembler.source_map) if line} == listed
+
+    # In the test programs every byte belongs to an instruction: its opcode and operand
+    for name, source in SOURCES.items():
+        image = assembler.assemble_bytes(source)
+        lines = source.splitlines()
+        source_map = list(assembler.source_map)
+        assert all(source_map), name
+        for number in set(source_map):
+            addresses = [address for address, line in enumerate(source_map) if line == number]
+            opcode, length, _ = SimpleAssembler.OPCODES[assembler._split_mnemonic(lines[number - 1])[0]]
+            assert image[addresses[0]] == opcode, (name, number)
+            assert addresses == list(range(addresses[0], addresses[0] + length)), (name, number)
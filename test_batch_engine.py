@@ -0,0 +1,97 @@
+# Tests of the NumPy lockstep engine (batch_engine.py) against the interpreter
+
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from batch_engine import BatchResult, run_batch
+from benchmark import TEST_PROGRAMS
+from simple_cpu_emulator import SimpleCPUEmulator
+
+
+def interpreted(image, max_steps=None):
+    """The final state of image on the interpreter, one step() at a time, as a BatchResult."""
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(list(image))
+    error = None
+    try:
+        while (not emulator.halted and 0 <= emulator.ip < len(emulator.memory)
+               and (max_steps is None or emulator.steps < max_steps)):
+            emulator.step()
+    except Exception as exception:
+        error = str(exception)
+    return BatchResult(emulator.ip, emulator.register_A, emulator.register_B, emulator.register_C,
+                       emulator.flags, emulator.halted, emulator.steps, bytes(emulator.memory), error)
+
+
+def random_image(rng):
+    """A short program of valid opcodes with random operands and some random bytes, ending in HLT."""
+    codes = sorted(SimpleCPUEmulator.dispatch_table)
+    image = []
+    while len(image) < rng.randrange(4, 48):
+        if rng.random() < 0.03:
+            image.append(rng.randrange(256))
+            continue
+        code = rng.choice(codes)
+        image.append(code)
+        if SimpleCPUEmulator.opcode_lengths[code] == 2:
+            # Addresses mostly within the program, so branches and stores hit it
+            image.append(rng.randrange(64) if rng.random() < 0.8 else rng.randrange(256))
+    return image + [0x3F]
+
+
+def test_test_programs_match_the_interpreter():
+    images = list(TEST_PROGRAMS.values())
+    results = run_batch(images)
+    assert len(results) == len(images)
+    for name, image, result in zip(TEST_PROGRAMS, images, results):
+        assert result == interpreted(image), name
+        assert result.halted and result.error is None, name
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_images_match_the_interpreter(seed):
+    rng = random.Random(seed)
+    images = [random_image(rng) for _ in range(200)]
+    for result, image in zip(run_batch(images, max_steps=300), images):
+        assert result == interpreted(image, max_steps=300), image
+
+
+def test_step_budget():
+    program = TEST_PROGRAMS["loop"]
+    for max_steps in [0, 1, 7, 15, 16, 30]:
+        result, = run_batch([program], max_steps=max_steps)
+        assert result.steps == min(max_steps, 16)
+        assert result.halted == (max_steps >= 16)
+        assert result == interpreted(program, max_steps)
+
+
+def test_invalid_opcode():
+    image = [0x20, 0x01, 0x2D, 0x05, 0xEE, 0x3F]    # MVI A 0x01 / JZ 0x05 / ?? / HLT
+    result, halting = run_batch([image, [0x3F]])
+    assert result.error == "Invalid opcode @ 04: EE"
+    assert (result.ip, result.steps, result.halted) == (0x05, 2, False)
+    assert result == interpreted(image)
+    assert halting.halted and halting.error is None
+
+
+@pytest.mark.parametrize("last, register_A, error", [
+    (0x20, 0x00, "Operand of instruction @ FF lies outside memory"),    # MVI A
+    (0x2D, 0x01, None),                                                 # untaken JZ falls through
+    (0x2D, 0x00, "Operand of instruction @ FF lies outside memory"),    # taken JZ
+])
+def test_operand_at_the_last_address(last, register_A, error):
+    image = [0] * 256
+    image[0:5] = [0x20, register_A, 0x19, 0x00, 0x2B]       # MVI A / XRI 0x00 (sets Z) / JMP
+    image[5] = 0xFF
+    image[0xFF] = last
+    result, = run_batch([image])
+    assert result.error == error and not result.halted
+    assert result == interpreted(image)
+
+
+def test_image_larger_than_memory():
+    with pytest.raises(ValueError, match=r"Image 1 \(size 257\) exceeds memory bounds."):
+        run_batch([[0x3F], [0] * 257])
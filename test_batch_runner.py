@@ -0,0 +1,42 @@
+# Tests of the headless batch runner (batch_runner.py)
+
+import json
+import os
+import subprocess
+import sys
+
+from batch_runner import collect_asm_files, run_batch, run_program_file
+
+
+def write_programs(directory):
+    (directory / "a_ok.asm").write_text("MVI A 0x03\nINR A\nHLT\n")
+    (directory / "b_org_overflow.asm").write_text("ORG 0xF0\n" + "MVI A 0x01\n" * 20 + "HLT\n")
+    (directory / "c_unknown.asm").write_text("FOO 0x01\n")
+    (directory / "d_forever.asm").write_text("loop:\nINR A\nJMP loop\n")
+    return collect_asm_files([str(directory)])
+
+
+def test_records(tmp_path):
+    files = write_programs(tmp_path)
+    records = {record["file"].rsplit("/", 1)[-1]: record for record in run_batch(files, max_steps=1000, jobs=1)}
+    ok = records["a_ok.asm"]
+    assert (ok["status"], ok["steps"], ok["registers"]["A"]) == ("halted", 3, 4)
+    assert records["b_org_overflow.asm"]["status"] == "assembly_error"
+    assert records["c_unknown.asm"]["status"] == "assembly_error"
+    assert (records["d_forever.asm"]["status"], records["d_forever.asm"]["steps"]) == ("step_budget", 1000)
+
+
+def test_loop_detection(tmp_path):
+    write_programs(tmp_path)
+    record = run_program_file(str(tmp_path / "d_forever.asm"), detect_loops=True)
+    assert (record["status"], record["cycle_length"]) == ("loop", 512)
+
+
+def test_assembly_errors_do_not_stop_a_parallel_batch(tmp_path):
+    files = write_programs(tmp_path)
+    out = tmp_path / "results.jsonl"
+    subprocess.run([sys.executable, "batch_runner.py", str(tmp_path), "--out", str(out), "--jobs", "2",
+                    "--no-cache", "--max-steps", "1000"], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    records = [json.loads(line) for line in out.read_text().splitlines()]
+    assert [record["file"] for record in records] == files
+    assert records[1]["status"] == "assembly_error"
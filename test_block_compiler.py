@@ -0,0 +1,74 @@
+# Tests of the block compiler (block_compiler.py): compiled runs must equal run_full
+
+import pytest
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+NESTED_LOOP = """
+    MVI C 0x03
+outer:
+    MVI B 0x05
+inner:
+    ADD B
+    DCR B
+    JZ next
+    JMP inner
+next:
+    DCR C
+    JZ done
+    JMP outer
+done:
+    HLT
+"""
+
+# The loop patches the operand of its own MVI B (at 0x03): every round must see the new value
+SELF_MODIFYING = """
+    MVI C 0x04
+loop:
+    MVI B 0x00
+    ADD B
+    INR B
+    MOV A,B
+    STA 0x03
+    DCR C
+    JZ done
+    JMP loop
+done:
+    HLT
+"""
+
+
+def state(emulator):
+    return (emulator.to_bytes(), emulator.steps, emulator.cycles)
+
+
+def runs(source, leaders=None):
+    program = SimpleAssembler().assemble(source)
+    reference = SimpleCPUEmulator(silent=True, fast_forward=False)
+    reference.read_into_memory(program)
+    reference.run_full()
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(program)
+    executed = emulator.run_compiled(leaders)
+    return emulator, reference, executed
+
+
+@pytest.mark.parametrize("source", [NESTED_LOOP, SELF_MODIFYING])
+def test_compiled_run_equals_run_full(source):
+    emulator, reference, executed = runs(source)
+    assert state(emulator) == state(reference)
+    assert executed == reference.steps
+
+
+def test_loops_back_to_the_entry_run_inside_one_block():
+    emulator, _reference, _executed = runs(NESTED_LOOP)
+    inner = emulator._compiler.blocks[0x04]
+    assert "while True:" in inner.source
+    assert emulator._compiler.compiled == 5
+
+
+def test_leaders_split_blocks():
+    emulator, reference, _executed = runs(NESTED_LOOP, leaders={0x08})
+    assert "JMP" not in emulator._compiler.blocks[0x04].source
+    assert state(emulator) == state(reference)
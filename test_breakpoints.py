@@ -0,0 +1,144 @@
+# Tests of breakpoints, watchpoints and [C]ontinue in the step-by-step mode
+
+import pytest
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+ASSEMBLER = SimpleAssembler()
+PROGRAM = ASSEMBLER.assemble("""
+    MVI B 0x03
+loop:
+    LDA n
+    ADD B
+    STA n
+    DCR B
+    JZ done
+    JMP loop
+done:
+    CALL sub
+    HLT
+sub:
+    RET
+n:
+    0x00
+""")
+LABELS = dict(ASSEMBLER.labels)
+
+
+def loaded(**options):
+    emulator = SimpleCPUEmulator(silent=True, **options)
+    emulator.read_into_memory(PROGRAM)
+    emulator.symbols = LABELS
+    return emulator
+
+
+def test_label_breakpoint_stops_before_the_instruction():
+    emulator = loaded()
+    emulator.add_breakpoint("done")
+    assert emulator.breakpoints == {LABELS["DONE"]}
+    outcome = emulator.run_full()
+    assert (outcome.status, outcome.address) == ("breakpoint", LABELS["DONE"])
+    assert emulator.ip == LABELS["DONE"] and emulator.memory[0xFF] == 0x00     # CALL not executed
+    assert emulator.memory[LABELS["N"]] == 3 + 2 + 1
+    # Calling run_full again executes the instruction at the breakpoint and continues
+    outcome = emulator.run_full()
+    assert outcome.status == "halted" and outcome.steps == 3
+
+
+def test_breakpoint_is_hit_on_every_round():
+    emulator = loaded()
+    emulator.add_breakpoint(" Loop ")
+    hits = []
+    while (outcome := emulator.run_full()).status == "breakpoint":
+        hits.append(emulator.register_B)
+    assert hits == [3, 2, 1]
+    assert emulator.memory[LABELS["N"]] == 3 + 2 + 1
+
+
+def test_breakpoint_addresses_and_toggling():
+    emulator = loaded()
+    emulator.add_breakpoint(0x02)
+    emulator.add_breakpoint("0x07")
+    assert emulator.breakpoints == {0x02, 0x07}
+    assert emulator.toggle_breakpoint("loop") is False
+    assert emulator.toggle_breakpoint("LOOP") is True
+    emulator.remove_breakpoint(7)
+    assert emulator.breakpoints == {0x02}
+    with pytest.raises(ValueError, match="Unknown label or address: 'nowhere'"):
+        emulator.add_breakpoint("nowhere")
+    with pytest.raises(ValueError, match="Address out of range: 256"):
+        emulator.add_breakpoint(256)
+
+
+@pytest.mark.parametrize("mode, opcodes", [
+    ("r", [0x23, 0x23, 0x23]),                      # LDA n on every round
+    ("w", [0x26, 0x26, 0x26]),                      # STA n on every round
+    ("rw", [0x23, 0x26, 0x23, 0x26, 0x23, 0x26]),
+])
+def test_watchpoint_modes(mode, opcodes):
+    emulator = loaded()
+    emulator.add_watchpoint("n", mode)
+    hits = []
+    while (outcome := emulator.run_full()).status == "watchpoint":
+        assert outcome.address == LABELS["N"]
+        previous = emulator.ip - 2                  # LDA and STA are two bytes long
+        hits.append(emulator.memory[previous])
+    assert outcome.status == "halted"
+    assert hits == opcodes
+
+
+def test_watchpoint_stops_after_the_write():
+    emulator = loaded()
+    emulator.add_watchpoint(LABELS["N"])
+    outcome = emulator.run_full()
+    assert (outcome.status, outcome.steps, outcome.address) == ("watchpoint", 4, LABELS["N"])
+    assert emulator.memory[LABELS["N"]] == 3 and emulator.ip == LABELS["LOOP"] + 5
+
+
+def test_watchpoint_on_the_return_address():
+    emulator = loaded()
+    emulator.add_watchpoint(0xFF, "r")
+    outcome = emulator.run_full()
+    assert (outcome.status, emulator.ip) == ("watchpoint", LABELS["DONE"] + 2)     # RET read it
+    emulator.remove_watchpoint(0xFF)
+    assert emulator.watchpoints == {}
+
+    emulator = loaded()
+    emulator.add_watchpoint(0xFF, "w")
+    outcome = emulator.run_full()
+    assert (outcome.status, emulator.ip) == ("watchpoint", LABELS["SUB"])         # CALL wrote it
+
+
+def test_watchpoint_mode_is_checked():
+    emulator = loaded()
+    for mode in ["", "x", "rx"]:
+        with pytest.raises(ValueError, match="Watchpoint mode must be 'r', 'w' or 'rw'"):
+            emulator.add_watchpoint("n", mode)
+    assert emulator.watchpoints == {}
+
+
+def test_continue_resumes_past_a_breakpoint(monkeypatch, capsys):
+    emulator = loaded()
+    emulator.add_breakpoint("loop")
+    # After the first step: continue twice, go back one step, clear the breakpoint and continue to the end
+    answers = iter(["c", "c", "b", "t", "loop", "c"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    emulator.run_step_by_step()
+    output = capsys.readouterr().out
+    assert output.count("Breakpoint @ 02") == 2
+    assert "Breakpoint cleared @ 02" in output
+    assert emulator.halted and emulator.memory[LABELS["N"]] == 3 + 2 + 1
+    assert next(answers, None) is None
+
+
+def test_continue_stops_at_a_watchpoint(monkeypatch, capsys):
+    emulator = loaded()
+    emulator.add_watchpoint("n", "w")
+    # [R]un to end does not stop at watchpoints
+    answers = iter(["c", "r"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    emulator.run_step_by_step()
+    output = capsys.readouterr().out
+    assert output.count(f"Watchpoint [{LABELS['N']:02X}]") == 1
+    assert emulator.halted and emulator.memory[LABELS["N"]] == 3 + 2 + 1
@@ -0,0 +1,130 @@
+# Tests of the step and time budgets and the loop detection of run_full
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+# INR A, JMP back: the state repeats every 256 rounds of 2 instructions
+COUNTING_FOREVER = """
+    MVI A 0x00
+loop:
+    INR A
+    JMP loop
+"""
+
+
+def loaded(source, **options):
+    emulator = SimpleCPUEmulator(silent=True, **options)
+    emulator.read_into_memory(SimpleAssembler().assemble(source))
+    return emulator
+
+
+def stepped(source, steps):
+    emulator = loaded(source)
+    for _ in range(steps):
+        emulator.step()
+    return emulator
+
+
+def test_step_budget_stops_after_exactly_max_steps():
+    emulator = loaded(COUNTING_FOREVER)
+    outcome = emulator.run_full(max_steps=101)
+    assert (outcome.status, outcome.steps, emulator.steps) == ("step_budget", 101, 101)
+    assert emulator.to_bytes() == stepped(COUNTING_FOREVER, 101).to_bytes()
+
+
+def test_step_budget_counts_cycles_like_single_steps():
+    emulator = loaded(COUNTING_FOREVER)
+    emulator.run_full(max_steps=77)
+    assert emulator.cycles == stepped(COUNTING_FOREVER, 77).cycles
+
+
+def test_runs_can_continue_after_a_budget():
+    emulator = loaded(COUNTING_FOREVER)
+    emulator.run_full(max_steps=40)
+    outcome = emulator.run_full(max_steps=60)
+    assert outcome.steps == 60
+    assert emulator.to_bytes() == stepped(COUNTING_FOREVER, 100).to_bytes()
+
+
+def test_program_halting_within_the_budget():
+    emulator = loaded("MVI A 0x01\nHLT")
+    outcome = emulator.run_full(max_steps=10)
+    assert (outcome.status, outcome.steps) == ("halted", 2)
+
+
+def test_time_budget():
+    emulator = loaded(COUNTING_FOREVER)
+    outcome = emulator.run_full(time_limit=0.05)
+    assert outcome.status == "time_budget"
+    assert outcome.steps == emulator.steps > 0
+
+
+def test_time_budget_is_checked_across_fast_forwarded_loops():
+    # Each round of the outer loop takes exactly 1024 steps, two of them in counter
+    # loops skipped at once, so the step count never lands on a multiple of 1024
+    emulator = loaded("""
+        MVI A 0x00
+        MVI C 0x00
+    outer:
+        MVI B 0x00
+    count_b:
+        DCR B
+        JZ done_b
+        JMP count_b
+    done_b:
+        MVI C 0x55
+    count_c:
+        DCR C
+        JZ done_c
+        JMP count_c
+    done_c:
+        JMP outer
+    """)
+    outcome = emulator.run_full(max_steps=10**9, time_limit=0.02)
+    assert outcome.status == "time_budget"
+
+
+def test_loop_detection_finds_the_period():
+    emulator = loaded(COUNTING_FOREVER)
+    outcome = emulator.run_full(detect_loops=True)
+    assert outcome.status == "loop"
+    assert outcome.cycle_length == 512
+
+
+def test_loop_detection_ignores_terminating_loops():
+    emulator = loaded("""
+        MVI B 0x10
+    loop:
+        DCR B
+        JZ done
+        JMP loop
+    done:
+        HLT
+    """)
+    outcome = emulator.run_full(detect_loops=True)
+    assert outcome.status == "halted"
+
+
+def test_loop_detection_sees_memory_changes():
+    # The state only repeats once the counter in memory wraps around
+    emulator = loaded("""
+    loop:
+        LDA n
+        INR A
+        STA n
+        JMP loop
+    n:
+        0x00
+    """)
+    outcome = emulator.run_full(detect_loops=True)
+    assert outcome.status == "loop"
+    assert outcome.cycle_length == 4 * 256
+
+
+def test_confirming_a_loop_leaves_no_trace_events():
+    events = []
+    emulator = loaded(COUNTING_FOREVER, trace=events.append)
+    outcome = emulator.run_full(detect_loops=True)
+    assert (outcome.status, outcome.cycle_length) == ("loop", 512)
+    assert len(events) == outcome.steps == emulator.steps
+    assert emulator.to_bytes() == stepped(COUNTING_FOREVER, outcome.steps).to_bytes()
@@ -0,0 +1,131 @@
+# Tests of cycle counting, run reports and opcode registration
+
+import pytest
+
+import opcodes
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import RunReport, SimpleCPUEmulator
+
+PROGRAM = SimpleAssembler().assemble("""
+    MVI B 0x04
+loop:
+    LDA n
+    ADD B
+    STA n
+    DCR B
+    JZ done
+    JMP loop
+done:
+    CALL sub
+    HLT
+sub:
+    INR A
+    RET
+n:
+    0x00
+""")
+
+
+def loaded(**options):
+    emulator = SimpleCPUEmulator(silent=True, **options)
+    emulator.read_into_memory(PROGRAM)
+    return emulator
+
+
+def executed_opcodes():
+    events = []
+    emulator = SimpleCPUEmulator(trace=events.append)
+    emulator.read_into_memory(PROGRAM)
+    emulator.run_full()
+    return [event.opcode for event in events]
+
+
+OPCODES = executed_opcodes()
+
+
+def test_default_cycle_costs():
+    costs = SimpleCPUEmulator.opcode_cycles
+    # One per byte plus one per data memory access
+    assert [costs[code] for code in (0x02, 0x21, 0x23, 0x26, 0x2B, 0x30, 0x31, 0x3F)] == [1, 2, 3, 3, 2, 3, 2, 1]
+    emulator = loaded()
+    emulator.run_full()
+    assert emulator.cycles == sum(costs[code] for code in OPCODES)
+
+
+@pytest.mark.parametrize("run", [
+    lambda emulator: emulator.run_full(),
+    lambda emulator: emulator.run_full(max_steps=1000),
+    lambda emulator: emulator.run_compiled(),
+    lambda emulator: [emulator.step() for _ in OPCODES],
+])
+def test_every_run_mode_counts_cycles(run):
+    emulator = loaded()
+    run(emulator)
+    assert emulator.halted
+    assert (emulator.steps, emulator.cycles) == (len(OPCODES), sum(map(SimpleCPUEmulator.opcode_cycles.get, OPCODES)))
+
+
+def test_run_report():
+    emulator = loaded()
+    outcome = emulator.run_full(report=True)
+    report = outcome.report
+    assert isinstance(report, RunReport)
+    assert report.instructions == outcome.steps == len(OPCODES)
+    assert report.cycles == emulator.cycles
+    assert report.memory_reads == OPCODES.count(0x23) + OPCODES.count(0x31)         # LDA n, RET
+    assert report.memory_writes == OPCODES.count(0x26) + OPCODES.count(0x30)        # STA n, CALL
+    assert list(report.groups) == ["alu", "memory", "branch", "other"]
+    assert report.groups["alu"] == (OPCODES.count(0x02) + OPCODES.count(0x0D) + OPCODES.count(0x09),
+                                    4 + 4 + 1, 0)
+    assert report.groups["memory"] == (4 + 4, 8 * 3, 8)
+    assert sum(group[0] for group in report.groups.values()) == report.instructions
+    assert sum(group[1] for group in report.groups.values()) == report.cycles
+    assert sum(group[2] for group in report.groups.values()) == report.memory_reads + report.memory_writes
+    assert str(report).splitlines()[0] == (f"Instructions: {len(OPCODES)}   cycles: {report.cycles}   "
+                                           f"memory reads: {report.memory_reads}   memory writes: 5")
+
+
+def test_run_report_of_a_continued_run():
+    emulator = loaded()
+    first = emulator.run_full(max_steps=10, report=True).report
+    second = emulator.run_full(report=True).report
+    assert first.instructions == 10 and first.instructions + second.instructions == len(OPCODES)
+    assert first.cycles + second.cycles == emulator.cycles
+    assert emulator.run_full().report is None
+
+
+def test_cycle_costs_override_single_opcodes():
+    emulator = loaded(cycle_costs={0x23: 10, 0x3F: 0})
+    outcome = emulator.run_full(report=True)
+    default = sum(map(SimpleCPUEmulator.opcode_cycles.get, OPCODES))
+    assert emulator.cycles == outcome.report.cycles == default + 7 * OPCODES.count(0x23) - 1
+
+    # The state is unchanged, and other emulators keep the default costs
+    reference = loaded()
+    reference.run_full()
+    assert emulator.to_bytes() == reference.to_bytes()
+    assert reference.cycles == default
+    compiled = loaded(cycle_costs={0x23: 10, 0x3F: 0})
+    compiled.run_compiled()
+    assert compiled.cycles == emulator.cycles
+
+
+def test_opcode_decorator_registers_with_the_emulator_class():
+    loaded().run_full()                     # the class caches its entry table
+    try:
+        @opcodes.opcode(0x3C, "SWP B", cycles=5, group="other")
+        def opcode_SWP_B(self, operand):
+            self.register_A, self.register_B = self.register_B, self.register_A
+
+        assert SimpleCPUEmulator.opcode_names[0x3C] == "SWP B"
+        emulator = SimpleCPUEmulator(silent=True)
+        emulator.read_into_memory([0x21, 0x07, 0x3C, 0x3F])     # MVI B 0x07 / SWP B / HLT
+        emulator.run_full()
+        assert (emulator.register_A, emulator.register_B) == (0x07, 0x00)
+        assert emulator.cycles == 2 + 5 + 1
+    finally:
+        for table in (SimpleCPUEmulator.dispatch_table, SimpleCPUEmulator.opcode_names,
+                      SimpleCPUEmulator.opcode_lengths, SimpleCPUEmulator.opcode_cycles,
+                      SimpleCPUEmulator.opcode_groups):
+            table.pop(0x3C, None)
+        SimpleCPUEmulator._default_entries = None
@@ -0,0 +1,112 @@
+# Tests of the fast-forwarding of idle and counter loops in run_full
+
+import itertools
+
+import pytest
+
+from simple_cpu_emulator import SimpleCPUEmulator
+
+MVI = {"A": 0x20, "B": 0x21, "C": 0x22}
+INR = {"A": 0x09, "B": 0x0A, "C": 0x0B}
+DCR = {"A": 0x0C, "B": 0x0D, "C": 0x0E}
+ADD_B, JZ, JMP, JC, HLT = 0x02, 0x2D, 0x2B, 0x2E, 0x3F
+
+
+def counter_loop(counter, register, value):
+    """MVI r, value / ADD B (flags) / counter r, JZ out, JMP counter / out: HLT"""
+    return [MVI[register], value, ADD_B, counter[register], JZ, 8, JMP, 3, HLT]
+
+
+def stepped(program, max_steps=None):
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(program)
+    while not emulator.halted and 0 <= emulator.ip < 256 and (max_steps is None or emulator.steps < max_steps):
+        emulator.step()
+    return emulator
+
+
+def run(program, max_steps=None, **options):
+    emulator = SimpleCPUEmulator(silent=True, **options)
+    emulator.read_into_memory(program)
+    return emulator, emulator.run_full(max_steps=max_steps)
+
+
+@pytest.mark.parametrize("counter, register, value", list(itertools.product(
+    [INR, DCR], "ABC", [0, 1, 2, 0x7F, 0x80, 0xFF])))
+def test_counter_loops_end_in_the_state_of_executing_them(counter, register, value):
+    program = counter_loop(counter, register, value)
+    reference = stepped(program)
+    emulator, outcome = run(program)
+    assert outcome.status == "halted"
+    assert emulator.to_bytes() == reference.to_bytes()
+    assert (emulator.steps, emulator.cycles) == (reference.steps, reference.cycles)
+
+
+@pytest.mark.parametrize("max_steps", [1, 3, 4, 100, 500, 767, 768, 10_000])
+def test_budgets_ending_inside_a_counter_loop(max_steps):
+    program = counter_loop(DCR, "B", 0)      # 256 rounds
+    reference = stepped(program, max_steps)
+    emulator, outcome = run(program, max_steps)
+    assert outcome.steps == reference.steps
+    assert emulator.to_bytes() == reference.to_bytes()
+    assert emulator.cycles == reference.cycles
+
+
+def test_idle_loop_ends_the_run():
+    program = [MVI["A"], 0x05, JMP, 0x02]
+    emulator, outcome = run(program)
+    assert (outcome.status, outcome.steps, emulator.ip) == ("idle", 1, 0x02)
+
+
+def test_idle_loop_spends_the_budget():
+    program = [MVI["A"], 0x05, JMP, 0x02]
+    reference = stepped(program, 1000)
+    emulator, outcome = run(program, 1000)
+    assert (outcome.status, outcome.steps) == ("step_budget", 1000)
+    assert emulator.to_bytes() == reference.to_bytes()
+    assert emulator.cycles == reference.cycles
+
+
+def test_conditional_branch_to_itself_is_only_idle_when_taken():
+    taken = [MVI["A"], 0xFF, 0x09, JC, 0x03]        # INR A sets carry: JC loops forever
+    emulator, outcome = run(taken)
+    assert outcome.status == "idle"
+    not_taken = [MVI["A"], 0x01, 0x09, JC, 0x03, HLT]
+    emulator, outcome = run(not_taken)
+    assert outcome.status == "halted"
+
+
+def test_changed_loop_bytes_are_rechecked():
+    program = counter_loop(DCR, "B", 0x10)
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(program)
+    emulator.run_full(max_steps=3)                  # decodes the DCR as a counter loop
+    emulator.write_memory(7, 2)                     # JMP back to ADD B instead
+    reference = SimpleCPUEmulator(silent=True)
+    reference.read_into_memory(program)
+    reference.write_memory(7, 2)
+    while reference.steps < 3:
+        reference.step()
+    emulator.run_full()
+    while not reference.halted:
+        reference.step()
+    assert emulator.to_bytes() == reference.to_bytes()
+    assert emulator.steps == reference.steps
+
+
+@pytest.mark.parametrize("setup", ["breakpoint", "trace", "fast_forward=False"])
+def test_debugging_switches_fast_forwarding_off(setup):
+    program = counter_loop(DCR, "B", 0x10)
+    events = []
+    emulator = SimpleCPUEmulator(silent=True, trace=events.append if setup == "trace" else None,
+                                 fast_forward=setup != "fast_forward=False")
+    emulator.read_into_memory(program)
+    if setup == "breakpoint":
+        emulator.add_breakpoint(4)
+        outcome = emulator.run_full()
+        assert (outcome.status, emulator.register_B) == ("breakpoint", 0x0F)
+    else:
+        emulator.run_full()
+        assert emulator.steps == stepped(program).steps
+        if setup == "trace":
+            assert len(events) == emulator.steps
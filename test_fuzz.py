@@ -0,0 +1,49 @@
+# Smoke tests of the differential fuzzer (fuzz.py)
+
+import fuzz
+from simple_cpu_emulator import SimpleCPUEmulator
+
+
+def inr_a_twice(self, operand):
+    self.register_A = (self.register_A + 2) & 0xFF
+
+
+def run_planted(images, budget):
+    """A broken engine: INR A adds 2."""
+    def run(emulator):
+        emulator._dispatch = {**SimpleCPUEmulator.dispatch_table, 0x09: inr_a_twice}
+        emulator.run_full(max_steps=budget)
+    return fuzz._run_each(images, run)
+
+
+# NOPs, MVI A 0x05, INR A, HLT and some data
+PLANTED = bytes([0x3E, 0x3E, 0x3E, 0x20, 0x05, 0x09, 0x3F, 0x12, 0x34])
+CLEAN = bytes([0x3E, 0x20, 0x05, 0x0C, 0x3F])
+
+
+def test_check_finds_a_planted_divergence(monkeypatch):
+    monkeypatch.setitem(fuzz.ENGINES, "planted", fuzz.Engine(run_planted, True))
+    compared, divergences = fuzz.check([CLEAN, PLANTED], 64, ["planted"])
+    assert compared == {"planted": 2}
+    divergence, = divergences
+    assert (divergence.engine, divergence.image, divergence.budget) == ("planted", PLANTED, 64)
+    assert divergence.expected.finished and divergence.actual.finished
+    assert fuzz.differences(divergence.expected, divergence.actual) == ["A: expected 6, got 7"]
+
+
+def test_minimize_shrinks_the_divergence(monkeypatch):
+    monkeypatch.setitem(fuzz.ENGINES, "planted", fuzz.Engine(run_planted, True))
+    divergence = fuzz.check([PLANTED], 64, ["planted"])[1][0]
+    minimized = fuzz.minimize(divergence)
+    assert minimized.engine == "planted"
+    assert minimized.image == bytes([0x09]) and minimized.budget == 1
+    assert fuzz.listing(minimized.image) == "00: 09      INR A"
+    assert fuzz.diverges(minimized.image, minimized.budget, "planted")
+
+
+def test_engines_agree_on_generated_programs():
+    images = [fuzz.generate(0, index) for index in range(100)]
+    assert images == [fuzz.generate(0, index) for index in range(100)]
+    compared, divergences = fuzz.check(images, 128, fuzz.available_engines())
+    assert divergences == []
+    assert compared["limited"] == 100 and 0 < compared["fast"] <= 100
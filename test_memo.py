@@ -0,0 +1,140 @@
+# Tests of the CALL memo (memo.py): memoized runs must equal plain runs
+
+import random
+
+import pytest
+
+from memo import CallMemo
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+# Multiplies by repeated addition in a routine called with alternating inputs
+MUL_CALLS = """
+start:
+    LDA n
+    DCR A
+    STA n
+    JZ done
+    ANI 0x01
+    JZ even
+    MVI B 0x07
+    MVI C 0x0C
+    JMP multiply
+even:
+    MVI B 0x09
+    MVI C 0x05
+multiply:
+    CALL mul
+    STA res
+    JMP start
+done:
+    HLT
+mul:
+    MVI A 0x00
+mulloop:
+    ADD B
+    DCR C
+    JZ mulend
+    JMP mulloop
+mulend:
+    RET
+n:
+    0x20
+res:
+    0x00
+"""
+
+
+def run(source, memo=None, max_steps=None):
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(SimpleAssembler().assemble(source))
+    if memo is not None:
+        memo.attach(emulator)
+    outcome = emulator.run_full(max_steps=max_steps)
+    return emulator, outcome
+
+
+def test_memoized_run_equals_plain_run():
+    plain, plain_outcome = run(MUL_CALLS)
+    memo = CallMemo()
+    memoized, outcome = run(MUL_CALLS, memo)
+    assert memoized.to_bytes() == plain.to_bytes()
+    assert (memoized.steps, memoized.cycles) == (plain.steps, plain.cycles)
+    assert outcome == plain_outcome
+    stats = memo.stats()
+    assert stats["hits"] == 29 and stats["misses"] == 2
+    assert stats["replayed_steps"] > 0
+
+
+@pytest.mark.parametrize("max_steps", [1, 50, 100, 333, 1000])
+def test_step_budgets_end_inside_replayed_routines(max_steps):
+    plain, plain_outcome = run(MUL_CALLS, max_steps=max_steps)
+    memo = CallMemo()
+    run(MUL_CALLS, memo)        # record every routine first
+    memoized, outcome = run(MUL_CALLS, memo, max_steps=max_steps)
+    assert memoized.to_bytes() == plain.to_bytes()
+    assert (outcome.status, outcome.steps) == (plain_outcome.status, plain_outcome.steps)
+    assert (memoized.steps, memoized.cycles) == (plain.steps, plain.cycles)
+
+
+def test_changed_inputs_invalidate_recordings():
+    memo = CallMemo()
+    run(MUL_CALLS, memo)
+    # Same routine address, different code: the recording must not be replayed
+    changed = MUL_CALLS.replace("ADD B", "ADD C")
+    plain, _ = run(changed)
+    memoized, _ = run(changed, memo)
+    assert memoized.to_bytes() == plain.to_bytes()
+    assert memo.invalidations > 0
+
+
+def test_capacity_bounds_the_entries():
+    memo = CallMemo(capacity=1)
+    run(MUL_CALLS, memo)
+    assert len(memo.entries) == 1
+    assert memo.evictions > 0
+
+
+def test_shared_memo_between_forks():
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(SimpleAssembler().assemble(MUL_CALLS))
+    memo = CallMemo().attach(emulator)
+    clone = emulator.fork()
+    emulator.run_full()
+    hits = memo.hits
+    clone.run_full()
+    assert clone.memo is memo and memo.hits > hits
+    assert clone.to_bytes() == emulator.to_bytes()
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_routines(seed):
+    # Routines made of random register, memory and flag instructions, called in a loop
+    rng = random.Random(seed)
+    lines = ["MOV A,B", "MOV B,C", "ADD B", "SUB C", "INR B", "DCR C", "LDA x", "STA x", "LDB x",
+             "ORI 0x01", "CMA", "XRA B", "ADC B"]
+    body = "\n".join(rng.choice(lines) for _ in range(rng.randrange(1, 10)))
+    source = f"""
+    again:
+        LDA n
+        DCR A
+        STA n
+        JZ done
+        ANI 0x03
+        MOV B,A
+        CALL routine
+        JMP again
+    done:
+        HLT
+    routine:
+        {body}
+        RET
+    n:
+        0x18
+    x:
+        0x00
+    """
+    plain, _ = run(source, max_steps=5000)
+    memoized, _ = run(source, CallMemo(), max_steps=5000)
+    assert memoized.to_bytes() == plain.to_bytes()
+    assert (memoized.steps, memoized.cycles) == (plain.steps, plain.cycles)
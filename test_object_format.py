@@ -0,0 +1,81 @@
+# Tests of object files and Intel HEX files (object_format.py)
+
+import pytest
+
+from object_format import read_intel_hex, read_object, segments_of
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+SOURCE = """
+    LDA x
+    ADD B
+    STA x
+    HLT
+x:
+    0x05
+ORG 0x20
+    DB 0x01, 0x02, 0x03
+"""
+
+
+def assembled():
+    assembler = SimpleAssembler()
+    assembler.assemble(SOURCE)
+    return assembler
+
+
+def test_object_file_round_trip(tmp_path):
+    assembler = assembled()
+    path = tmp_path / "program.obj"
+    assembler.write_object(path)
+    obj = read_object(path)
+    assert obj.image == assembler._image
+    assert obj.symbols == assembler.labels == {"X": 6}
+    assert obj.source_map == assembler.source_map
+    assert obj.segments == [(0, 7), (0x20, 3)] == segments_of(assembler.source_map)
+
+
+def test_intel_hex_round_trip(tmp_path):
+    assembler = assembled()
+    path = tmp_path / "program.hex"
+    assembler.write_intel_hex(path)
+    image, segments = read_intel_hex(path)
+    assert bytes(image) == assembler._image
+    assert segments == [(0, 7), (0x20, 3)]
+
+
+@pytest.mark.parametrize("name, write", [("program.obj", "write_object"), ("program.hex", "write_intel_hex")])
+def test_read_into_memory_from_files(tmp_path, name, write):
+    assembler = assembled()
+    path = tmp_path / name
+    getattr(assembler, write)(path)
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(str(path))
+    reference = SimpleCPUEmulator(silent=True)
+    reference.read_into_memory(SimpleAssembler().assemble(SOURCE))
+    assert emulator.memory == reference.memory
+    emulator.run_full()
+    reference.run_full()
+    assert emulator.to_bytes() == reference.to_bytes()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "program.obj"
+    path.write_bytes(b"not an object file")
+    with pytest.raises(ValueError, match="Not an object file"):
+        read_object(path)
+
+
+def test_rejects_truncated_object_files(tmp_path):
+    path = tmp_path / "program.obj"
+    assembled().write_object(path)
+    path.write_bytes(path.read_bytes()[:-3])
+    with pytest.raises(ValueError, match="Truncated"):
+        read_object(path)
+
+
+def test_rejects_bad_hex_checksums(tmp_path):
+    path = tmp_path / "program.hex"
+    path.write_text(":0100000023DD\n:00000001FF\n")
+    with pytest.raises(ValueError, match="Invalid Intel HEX record"):
+        read_intel_hex(path)
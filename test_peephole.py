@@ -0,0 +1,80 @@
+# Tests of the peephole optimizer (peephole.py, SimpleAssembler(optimize=True))
+
+import random
+
+import pytest
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+REDUNDANT = """
+    MVI C 0x05
+loop:
+    MVI A 0x00      ; overwritten by LDA
+    LDA x
+    MOV B,A
+    MOV A,B         ; A already equals B
+    NOP
+    ADD B
+    STA x
+    DCR C
+    JZ done
+    JMP loop
+done:
+    HLT
+x:
+    0x01
+"""
+
+
+def final_state(source, optimize):
+    assembler = SimpleAssembler(optimize)
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(assembler.assemble(source))
+    emulator.run_full(max_steps=100_000)
+    # Compare registers, flags and the data the program labels (code moved)
+    data = {label: emulator.memory[address] for label, address in assembler.labels.items()}
+    return emulator.register_A, emulator.register_B, emulator.register_C, emulator.flags, emulator.halted, data
+
+
+def test_removes_redundant_instructions():
+    assembler = SimpleAssembler(optimize=True)
+    optimized = assembler.assemble(REDUNDANT)
+    report = assembler.peephole_report
+    assert report.declined is None
+    assert report.instructions == 3
+    assert len(optimized) == len(SimpleAssembler().assemble(REDUNDANT)) - report.bytes
+
+
+def test_optimized_program_computes_the_same_result():
+    plain = final_state(REDUNDANT, False)
+    assert final_state(REDUNDANT, True)[:5] == plain[:5]
+    assert final_state(REDUNDANT, True)[5]["X"] == plain[5]["X"]
+
+
+LINES = ["MVI A 0x03", "MVI B 0x05", "MVI C 0x07", "MOV A,B", "MOV B,A", "MOV A,C", "MOV C,A",
+         "MOV B,C", "MOV C,B", "ADD B", "SUB C", "INR A", "DCR B", "NOP", "LDA x", "LDB y", "STA x",
+         "ANI 0x0F", "ORA B", "CMA"]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_straight_line_programs_are_equivalent(seed):
+    rng = random.Random(seed)
+    body = "\n".join(rng.choice(LINES) for _ in range(rng.randrange(1, 25)))
+    source = f"{body}\nHLT\nx:\n0x11\ny:\n0x22\n"
+    plain = final_state(source, False)
+    optimized = final_state(source, True)
+    assert optimized[:5] == plain[:5]
+    assert optimized[5]["X"] == plain[5]["X"] and optimized[5]["Y"] == plain[5]["Y"]
+
+
+@pytest.mark.parametrize("source, reason", [
+    ("NOP\nHLT\nORG 0x10\nDB 0x01", "ORG/DB"),
+    ("MVI C 0x10\nLDA C\nHLT", "LDA C"),
+    ("NOP\nJMP 0x00", "numeric address"),
+    ("start:\nNOP\nLDA start\nHLT", "memory access into code"),
+])
+def test_declines_programs_depending_on_code_addresses(source, reason):
+    assembler = SimpleAssembler(optimize=True)
+    assert assembler.assemble(source) == SimpleAssembler().assemble(source)
+    assert reason in assembler.peephole_report.declined
@@ -0,0 +1,147 @@
+# Tests of the predecoded instruction entries and their invalidation on writes
+
+import pytest
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+MVI_A, MVI_B, LDA, STA, JMP, HLT = 0x20, 0x21, 0x23, 0x26, 0x2B, 0x3F
+
+
+def loaded(program):
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(program)
+    return emulator
+
+
+def test_write_memory_invalidates_the_operand_of_a_decoded_instruction():
+    emulator = loaded([MVI_A, 0x11, HLT])
+    emulator.step()
+    assert emulator.register_A == 0x11
+    emulator.write_memory(0x01, 0x22)
+    emulator.ip = 0
+    emulator.step()
+    assert emulator.register_A == 0x22
+
+
+def test_write_memory_invalidates_the_opcode():
+    emulator = loaded([MVI_A, 0x11, HLT])
+    emulator.step()
+    emulator.write_memory(0x00, MVI_B)
+    emulator.ip = 0
+    emulator.step()
+    assert (emulator.register_A, emulator.register_B) == (0x11, 0x11)
+
+
+def test_self_modifying_code_through_sta():
+    # The loop overwrites the operand of its own MVI A with the value it loaded plus one
+    program = SimpleAssembler().assemble("""
+        MVI B 0x03
+    again:
+        MVI A 0x00
+        INR A
+        STA 0x03        ; the operand of MVI A
+        DCR B
+        JZ done
+        JMP again
+    done:
+        HLT
+    """)
+    emulator = loaded(program)
+    emulator.run_full()
+    assert emulator.register_A == 3
+
+
+def test_invalidate_decoded_after_direct_memory_changes():
+    emulator = loaded([MVI_A, 0x11, HLT])
+    emulator.step()
+    emulator.memory[1] = 0x33          # bypasses write_memory
+    emulator.invalidate_decoded()
+    emulator.ip = 0
+    emulator.step()
+    assert emulator.register_A == 0x33
+
+
+def test_fresh_emulators_allocate_the_table_on_first_use():
+    emulator = SimpleCPUEmulator(silent=True)
+    assert emulator._decoded is None
+    emulator.write_memory(0, MVI_A)
+    emulator.write_memory(1, 0x22)
+    emulator.invalidate_decoded()
+    snapshot, clone = emulator.snapshot(), emulator.fork()
+    assert emulator._decoded is None and clone._decoded is None
+    emulator.run_full(max_steps=1)
+    assert emulator.register_A == 0x22 and emulator._decoded is not None
+    emulator.restore(snapshot)
+    clone.step()
+    assert (emulator.ip, clone.ip, clone.register_A) == (0, 2, 0x22)
+
+
+def test_loading_decodes_nothing_up_front():
+    emulator = loaded([MVI_A, 0x11, JMP, 0x06, MVI_B, 0x22, HLT])
+    assert emulator._decoded is None
+    emulator.run_full()
+    assert [address for address, entry in enumerate(emulator._decoded) if entry] == [0, 2, 6]
+
+
+def test_reloading_the_same_bytes_keeps_the_entries():
+    emulator = loaded([MVI_A, 0x11, HLT])
+    emulator.run_full()
+    entries = list(emulator._decoded)
+    emulator.read_into_memory([MVI_A, 0x11, HLT])
+    assert emulator._decoded == entries
+    emulator.read_into_memory([MVI_A, 0x12], 0)
+    assert emulator._decoded[0] is None and emulator._decoded[2] is not None
+
+
+def test_reloading_a_program_drops_stale_entries():
+    emulator = loaded([MVI_A, 0x11, HLT])
+    emulator.run_full()
+    emulator.read_into_memory([MVI_A, 0x44, HLT])
+    emulator.ip = 0
+    emulator.halted = False
+    emulator.run_full()
+    assert emulator.register_A == 0x44
+
+
+def test_loading_after_a_two_byte_instruction_invalidates_its_operand():
+    emulator = loaded([MVI_A, 0x11, HLT])
+    emulator.step()
+    emulator.read_into_memory([0x55], start_address=1)
+    emulator.ip = 0
+    emulator.step()
+    assert emulator.register_A == 0x55
+
+
+def test_invalid_opcode_raises():
+    emulator = loaded([0xEE])
+    with pytest.raises(Exception, match="Invalid opcode @ 00: EE"):
+        emulator.run_full()
+
+
+@pytest.mark.parametrize("opcode", [MVI_A, LDA, STA, JMP])
+def test_missing_operand_in_the_last_memory_cell_raises(opcode):
+    emulator = loaded([])
+    emulator.write_memory(0xFF, opcode)
+    emulator.ip = 0xFF
+    with pytest.raises(IndexError, match="outside memory"):
+        emulator.run_full()
+
+
+@pytest.mark.parametrize("opcode, flags, taken", [
+    (0x2C, 0x00, False), (0x2D, 0x00, False), (0x2E, 0x00, False), (0x2F, 0x00, False),
+    (0x2C, 0xFF, True), (0x2D, 0xFF, True), (0x2E, 0xFF, True), (0x2F, 0xFF, True),
+])
+def test_conditional_branch_in_the_last_memory_cell(opcode, flags, taken):
+    # An untaken branch does not need its operand: the IP moves past the end of memory
+    for run in ("run_full", "step"):
+        emulator = loaded([])
+        emulator.write_memory(0xFF, opcode)
+        emulator.ip = 0xFF
+        emulator.flags = flags
+        if taken:
+            with pytest.raises(IndexError, match="@ FF lies outside memory"):
+                getattr(emulator, run)()
+        else:
+            getattr(emulator, run)()
+            assert (emulator.ip, emulator.steps) == (0x101, 1)
@@ -0,0 +1,124 @@
+# Tests of the execution profiler (profiler.py)
+
+import json
+from collections import Counter
+
+from profiler import Profiler
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+SOURCE = """
+    MVI B 0x03
+loop:
+    MVI C 0x02
+inner:
+    DCR C
+    JZ next
+    JMP inner
+next:
+    DCR B
+    JZ done
+    JMP loop
+done:
+    CALL sub
+    HLT
+sub:
+    RET
+"""
+ASSEMBLER = SimpleAssembler()
+PROGRAM, LISTING = ASSEMBLER.assemble_with_listing(SOURCE)
+LABELS = dict(ASSEMBLER.labels)
+
+
+def traced_counts():
+    """Executions per address from the trace of an unprofiled run."""
+    events = []
+    emulator = SimpleCPUEmulator(trace=events.append)
+    emulator.read_into_memory(PROGRAM)
+    emulator.run_full()
+    return Counter(event.address for event in events), Counter(event.opcode for event in events)
+
+
+ADDRESS_COUNTS, OPCODE_COUNTS = traced_counts()
+
+
+def profiled(symbols=LABELS):
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(PROGRAM)
+    profiler = Profiler(symbols).attach(emulator)
+    emulator.run_full()
+    return emulator, profiler
+
+
+def test_counts_per_address_and_opcode():
+    emulator, profiler = profiled()
+    assert emulator.halted and emulator.profiler is profiler
+    assert profiler.address_counts == [ADDRESS_COUNTS[address] for address in range(256)]
+    assert profiler.opcode_counts == [OPCODE_COUNTS[opcode] for opcode in range(256)]
+    assert profiler.total == emulator.steps == sum(ADDRESS_COUNTS.values())
+    # The counter loop is not fast-forwarded while profiling
+    assert profiler.address_counts[LABELS["INNER"]] == 3 * 2
+
+
+def test_counts_accumulate_until_reset():
+    emulator, profiler = profiled()
+    emulator.read_into_memory(PROGRAM)
+    emulator.ip, emulator.halted = 0, False
+    emulator.run_full()
+    assert profiler.address_counts[LABELS["LOOP"]] == 2 * 3
+    profiler.reset()
+    assert profiler.total == 0 and not any(profiler.address_counts)
+
+
+def test_by_address_and_by_opcode():
+    _, profiler = profiled()
+    hottest = profiler.by_address()
+    assert hottest[0] == (LABELS["INNER"], 6)
+    assert [count for _, count in hottest] == sorted(ADDRESS_COUNTS.values(), reverse=True)
+    assert profiler.by_opcode()[:2] == [("JZ Address", 6 + 3), ("DCR C", 6)]
+    assert dict(profiler.by_opcode())["HLT"] == 1
+
+
+def test_by_label():
+    _, profiler = profiled()
+    # MVI C at LOOP; DCR C / JZ / JMP at INNER; DCR B / JZ / JMP at NEXT (with the last JZ taken)
+    assert profiler.by_label() == [("INNER", 6 + 6 + 3), ("NEXT", 3 + 3 + 2), ("LOOP", 3),
+                                   ("DONE", 2), (None, 1), ("SUB", 1)]
+    assert profiler.label_of(LABELS["INNER"] + 3) == "INNER"
+    assert profiler.location(LABELS["INNER"] + 3) == "INNER+3"
+    assert profiler.location(LABELS["DONE"]) == "DONE"
+    assert profiler.location(0x00) == "00"
+
+
+def test_without_symbols():
+    _, profiler = profiled(symbols=None)
+    assert profiler.by_label() == [(None, profiler.total)]
+    assert profiler.location(LABELS["INNER"]) == f"{LABELS['INNER']:02X}"
+    assert "Labels:" not in profiler.report()
+
+
+def test_annotate_listing():
+    _, profiler = profiled()
+    annotated = profiler.annotate_listing(LISTING).splitlines()
+    listing = LISTING.splitlines()
+    assert len(annotated) == len(listing)
+    for line, annotated_line in zip(listing, annotated):
+        count = ADDRESS_COUNTS[int(line[:2], 16)]
+        assert annotated_line == (f"{count:>10}  {line}" if count else f"{'':>10}  {line}")
+    # Operand bytes are never executed
+    assert annotated[1] == f"{'':>10}  {listing[1]}"
+    assert annotated[0].split()[0] == "1"
+
+
+def test_report_and_dump(tmp_path):
+    _, profiler = profiled()
+    report = profiler.report(top=2).splitlines()
+    assert report[0] == f"Profiled instructions: {profiler.total}"
+    assert report[3].split() == [f"{LABELS['INNER']:02X}", "6", f"{100 * 6 / profiler.total:.2f}%", "INNER"]
+    path = tmp_path / "profile.json"
+    profiler.dump(path)
+    profile = json.loads(path.read_text())
+    assert profile == profiler.to_dict()
+    assert profile["instructions"] == profiler.total
+    assert profile["addresses"][f"{LABELS['INNER']:02X}"] == 6
+    assert profile["labels"][""] == 1 and profile["opcodes"]["RET"] == 1
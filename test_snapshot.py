@@ -0,0 +1,79 @@
+# Tests of snapshot/restore and fork
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+PROGRAM = SimpleAssembler().assemble("""
+    MVI B 0x05
+loop:
+    LDA n
+    ADD B
+    STA n
+    DCR B
+    JZ done
+    JMP loop
+done:
+    HLT
+n:
+    0x00
+""")
+
+
+def loaded():
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(PROGRAM)
+    return emulator
+
+
+def test_restore_returns_to_the_snapshot():
+    emulator = loaded()
+    emulator.run_full(max_steps=7)
+    snapshot = emulator.snapshot()
+    state = emulator.to_bytes()
+    emulator.run_full()
+    assert emulator.halted
+    emulator.restore(snapshot)
+    assert emulator.to_bytes() == state
+
+
+def test_runs_after_restore_match_an_uninterrupted_run():
+    reference = loaded()
+    reference.run_full()
+    emulator = loaded()
+    emulator.run_full(max_steps=7)
+    snapshot = emulator.snapshot()
+    for _ in range(3):
+        emulator.restore(snapshot)
+        emulator.run_full()
+        assert emulator.to_bytes() == reference.to_bytes()
+
+
+def test_restore_after_self_modification_drops_stale_decoded_entries():
+    emulator = loaded()
+    snapshot = emulator.snapshot()
+    emulator.step()
+    emulator.write_memory(0x01, 0x02)       # operand of MVI B
+    emulator.restore(snapshot)
+    emulator.step()
+    assert emulator.register_B == 0x05
+
+
+def test_fork_is_independent():
+    emulator = loaded()
+    emulator.run_full(max_steps=7)
+    clone = emulator.fork()
+    clone.run_full()
+    assert clone.halted and not emulator.halted
+    assert clone.memory != emulator.memory
+    emulator.run_full()
+    assert emulator.to_bytes() == clone.to_bytes()
+    assert (emulator.steps, emulator.cycles) == (clone.steps, clone.cycles)
+
+
+def test_fork_copies_breakpoints():
+    emulator = loaded()
+    emulator.add_breakpoint(0x02)
+    clone = emulator.fork()
+    clone.remove_breakpoint(0x02)
+    assert emulator.breakpoints == {0x02}
+
@@ -0,0 +1,62 @@
+# Tests of the compact emulator state: __slots__, bytearray memory and bytes serialization
+
+import pytest
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import STATE_FORMAT, SimpleCPUEmulator
+
+PROGRAM = SimpleAssembler().assemble("""
+    MVI B 0x05
+loop:
+    LDA n
+    ADD B
+    STA n
+    DCR B
+    JZ done
+    JMP loop
+done:
+    HLT
+n:
+    0x00
+""")
+
+
+def loaded():
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(PROGRAM)
+    return emulator
+
+
+def test_emulator_has_no_instance_dict():
+    emulator = SimpleCPUEmulator(silent=True)
+    assert not hasattr(emulator, "__dict__")
+    with pytest.raises(AttributeError):
+        emulator.register_D = 0
+
+
+def test_memory_is_a_bytearray():
+    emulator = loaded()
+    assert isinstance(emulator.memory, bytearray) and len(emulator.memory) == 256
+    emulator.run_full()
+    assert emulator.memory[len(PROGRAM) - 1] == 5 + 4 + 3 + 2 + 1
+
+
+def test_to_bytes_round_trip():
+    emulator = loaded()
+    emulator.run_full(max_steps=9)
+    state = emulator.to_bytes()
+    assert len(state) == STATE_FORMAT.size == 263
+    copy = SimpleCPUEmulator.from_bytes(state, silent=True)
+    assert copy.to_bytes() == state
+    copy.run_full()
+    emulator.run_full()
+    assert copy.to_bytes() == emulator.to_bytes()
+
+
+def test_to_bytes_layout():
+    emulator = loaded()
+    emulator.run_full()
+    memory, ip, a, b, c, flags, halted = STATE_FORMAT.unpack(emulator.to_bytes())
+    assert memory == bytes(emulator.memory)
+    assert (ip, a, b, c, flags, halted) == (emulator.ip, emulator.register_A, emulator.register_B,
+                                            emulator.register_C, emulator.flags, True)
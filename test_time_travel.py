@@ -0,0 +1,138 @@
+# Tests of stepping backwards (time_travel.py)
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+from time_travel import History
+
+ASSEMBLER = SimpleAssembler()
+PROGRAM = ASSEMBLER.assemble("""
+    MVI B 0x03
+loop:
+    CALL sub
+slot:
+    NOP             ; becomes INR A after the first call
+    DCR B
+    JZ done
+    JMP loop
+done:
+    HLT
+sub:
+    MVI A 0x09
+    STA slot
+    LDA total
+    ADD B
+    STA total
+    RET
+total:
+    0x00
+""")
+LABELS = dict(ASSEMBLER.labels)
+
+
+def loaded():
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(PROGRAM)
+    return emulator
+
+
+def state(emulator):
+    return emulator.to_bytes(), emulator.steps, emulator.cycles
+
+
+def reference_states():
+    """The state before every step of an uninterrupted run, and after the last one."""
+    emulator = loaded()
+    states = [state(emulator)]
+    while not emulator.halted:
+        emulator.step()
+        states.append(state(emulator))
+    return states
+
+
+STATES = reference_states()
+
+
+def test_back_undoes_every_step_across_keyframes():
+    emulator = loaded()
+    history = History(emulator, keyframe_interval=4)
+    while not emulator.halted:
+        history.step()
+    assert history.position == history.recorded == len(STATES) - 1
+    assert len(history.keyframes) == (len(STATES) - 2) // 4 + 1
+    while history.position:
+        assert state(emulator) == STATES[history.position]
+        history.back()
+    assert state(emulator) == STATES[0]
+    history.back()                          # nothing left to undo
+    assert history.position == 0 and state(emulator) == STATES[0]
+
+
+def test_back_undoes_the_return_address_and_a_self_modifying_store():
+    emulator = loaded()
+    history = History(emulator)
+    history.step()                          # MVI B
+    history.step()                          # CALL sub
+    assert emulator.memory[0xFF] == LABELS["SLOT"]
+    history.step()                          # MVI A
+    history.step()                          # STA slot
+    assert emulator.memory[LABELS["SLOT"]] == 0x09
+    history.back(2)
+    assert emulator.memory[LABELS["SLOT"]] == 0x3E
+    assert emulator.memory[0xFF] == LABELS["SLOT"]
+    history.back()
+    assert emulator.memory[0xFF] == 0x00
+    assert state(emulator) == STATES[1]
+
+
+def test_undone_code_is_decoded_again():
+    emulator = loaded()
+    history = History(emulator)
+    history.goto(len(STATES))
+    history.back(len(STATES))
+    # The NOP that STA slot had turned into INR A must execute as a NOP again
+    emulator.run_full()
+    assert state(emulator) == STATES[-1]
+
+
+def test_goto_matches_an_uninterrupted_run():
+    emulator = loaded()
+    history = History(emulator, keyframe_interval=4)
+    for target in [5, 17, 3, 0, 9, 8, 12, len(STATES) - 1, 1, 14, 4]:
+        history.goto(target)
+        assert history.position == target
+        assert state(emulator) == STATES[target], target
+
+
+def test_goto_stops_when_the_program_halts():
+    emulator = loaded()
+    history = History(emulator, keyframe_interval=4)
+    history.goto(1000)
+    assert emulator.halted and history.position == len(STATES) - 1
+    history.goto(2)
+    assert not emulator.halted and state(emulator) == STATES[2]
+    history.goto(1000)
+    assert state(emulator) == STATES[-1]
+
+
+def test_goto_produces_no_trace_events():
+    events = []
+    emulator = SimpleCPUEmulator(trace=events.append)
+    emulator.read_into_memory(PROGRAM)
+    history = History(emulator, keyframe_interval=4)
+    history.goto(10)
+    history.goto(3)
+    history.goto(7)
+    assert events == []
+    history.step()
+    assert len(events) == 1
+
+
+def test_reset_starts_a_new_recording():
+    emulator = loaded()
+    history = History(emulator, keyframe_interval=4)
+    history.goto(6)
+    history.reset()
+    assert (history.position, history.recorded, history.keyframes) == (0, 0, [])
+    history.goto(3)
+    history.back(10)
+    assert state(emulator) == STATES[6]
@@ -0,0 +1,73 @@
+# Tests of the binary trace recorder (trace_recorder.py)
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+from trace_recorder import TraceReader, TraceRecorder
+
+# 1 + 3 * 10 - 1 = 30 instructions, then HLT
+PROGRAM = SimpleAssembler().assemble("""
+    MVI B 0x0A
+loop:
+    DCR B
+    JZ done
+    JMP loop
+done:
+    HLT
+""")
+STEPS = 31
+
+
+def recorded(capacity, path=None):
+    emulator = SimpleCPUEmulator(silent=True)
+    emulator.read_into_memory(PROGRAM)
+    recorder = TraceRecorder(capacity, path).attach(emulator)
+    emulator.run_full()
+    return recorder
+
+
+def test_records_hold_state_before_each_instruction():
+    records = recorded(64).records()
+    assert len(records) == STEPS
+    first, second = records[0], records[1]
+    assert (first.address, first.opcode, first.operand, first.register_B) == (0x00, 0x21, 0x0A, 0)
+    assert (second.address, second.opcode, second.operand, second.register_B) == (0x02, 0x0D, None, 0x0A)
+    assert records[-1].opcode == 0x3F
+
+
+def test_partly_filled_ring():
+    recorder = recorded(STEPS + 1)
+    assert [record.address for record in recorder.records()] == [record.address for record in recorded(64).records()]
+
+
+def test_exactly_full_ring_returns_all_records():
+    recorder = recorded(STEPS)
+    assert recorder.position == 0
+    assert recorder.records() == recorded(64).records()
+
+
+def test_ring_one_record_past_full():
+    everything = recorded(64).records()
+    assert recorded(STEPS - 1).records() == everything[1:]
+
+
+def test_wrapped_ring_keeps_the_latest_records_in_order():
+    everything = recorded(64).records()
+    recorder = recorded(8)
+    assert recorder.count == STEPS
+    assert recorder.records() == everything[-8:]
+
+
+def test_streaming_to_a_file(tmp_path):
+    path = tmp_path / "run.trace"
+    with recorded(4, path):
+        pass
+    reader = TraceReader(path, chunk_records=3)
+    assert len(reader) == STEPS
+    assert list(reader) == recorded(64).records()
+
+
+def test_close_detaches():
+    recorder = recorded(8)
+    emulator = recorder.emulator
+    recorder.close()
+    assert emulator.trace is None
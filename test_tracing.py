@@ -0,0 +1,68 @@
+# Tests of silent execution and the trace sinks (tracing.py)
+
+import io
+import logging
+
+import pytest
+
+from simple_cpu_emulator import SimpleCPUEmulator
+from tracing import TraceEvent, format_event, make_trace_sink
+
+# MVI A 0x05 / DCR A / JZ 0x07 / JMP 0x02 / HLT
+PROGRAM = [0x20, 0x05, 0x0C, 0x2D, 0x07, 0x2B, 0x02, 0x3F]
+
+
+def run(**options):
+    emulator = SimpleCPUEmulator(**options)
+    emulator.read_into_memory(PROGRAM)
+    emulator.run_full()
+    return emulator
+
+
+def test_silent_run_prints_nothing(capsys):
+    emulator = run(silent=True)
+    assert emulator.halted
+    assert capsys.readouterr().out == ""
+
+
+def test_default_run_prints_every_opcode(capsys):
+    run()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Executing opcode: MVI A Byte"
+    assert lines[-1] == "Executing opcode: HLT"
+    assert len(lines) == 16
+
+
+def test_callable_sink_receives_trace_events(capsys):
+    events = []
+    run(trace=events.append)
+    assert capsys.readouterr().out == ""
+    assert all(isinstance(event, TraceEvent) for event in events)
+    assert events[0] == TraceEvent(0x00, 0x20, "MVI A Byte", 0x05)
+    assert events[1] == TraceEvent(0x02, 0x0C, "DCR A", None)
+    assert events[-1] == TraceEvent(0x07, 0x3F, "HLT", None)
+    assert len(events) == 16
+
+
+def test_logger_sink_logs_formatted_events(caplog):
+    events = []
+    run(trace=events.append)
+    logger = logging.getLogger("test_tracing")
+    with caplog.at_level(logging.DEBUG, logger="test_tracing"):
+        run(trace=logger)
+    assert [record.getMessage() for record in caplog.records] == [format_event(event) for event in events]
+    assert all(record.levelno == logging.DEBUG for record in caplog.records)
+
+
+def test_writer_sink_writes_one_line_per_event():
+    events = []
+    run(trace=events.append)
+    output = io.StringIO()
+    run(trace=output)
+    assert output.getvalue().splitlines() == [format_event(event) for event in events]
+    assert output.getvalue().splitlines()[0] == "00: 20 05  MVI A Byte"
+
+
+def test_make_trace_sink_rejects_other_objects():
+    with pytest.raises(TypeError, match="Unsupported trace sink"):
+        make_trace_sink(42)
@@ -0,0 +1,150 @@
+# Tests of watch mode (watch.py): incremental assembly and hot-patching a live emulator
+
+import pytest
+
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+from watch import IncrementalAssembler, Watcher
+
+BASE = """\
+; counts down and accumulates
+    MVI B 0x05      ; counter
+loop:
+    LDA total
+    ADD B
+    STA total
+    DCR B
+    JZ done
+    JMP loop
+done:
+    CALL tail
+    HLT
+tail:
+    ORI 0x01
+    RET
+total:              ; running sum
+    0x00
+ORG 0x30
+DB 0x01, 0x02, 0x03
+"""
+
+
+def edited(source, old, new):
+    """source with the first occurrence of old replaced by new."""
+    assert old in source
+    return source.replace(old, new, 1)
+
+
+# Edits applied one after another to the same IncrementalAssembler, as (old text, new text)
+EDITS = [
+    ("MVI B 0x05", "MVI B 0x07"),                           # changed operand
+    ("    ADD B\n", "    ADD B\n    ADD B\n"),              # inserted line moves the labels
+    ("    ADD B\n    ADD B\n", "    ADD B\n"),              # and deleted again
+    ("    ORI 0x01", "    XRI 0x80"),                       # changed instruction
+    ("    HLT\n", ""),                                      # deleted line
+    ("loop:\n", "start:\nloop:\n"),                         # a new label
+    ("    0x00\n", "    0x2A\n"),                            # changed data
+    ("DB 0x01, 0x02, 0x03", "DB 0x04"),                     # shorter DB
+    ("ORG 0x30", "ORG 0x40"),                               # moved ORG
+    ("MVI B 0x07", "MVI B 0x05"),                           # back to a cached line
+]
+
+# Edits of BASE that SimpleAssembler rejects, as (old text, new text, exception type)
+ERRORS = [
+    ("    LDA total", "    FOO total", ValueError),
+    ("    LDA total", "    LDA", ValueError),
+    ("    LDA total", "    LDA nowhere", ValueError),
+    ("MVI B 0x05", "MVI B 0x100", ValueError),
+    ("    0x00\n", "    0x1FF\n", ValueError),
+    ("DB 0x01, 0x02, 0x03", "DB 0x01, 0x300", ValueError),
+    ("ORG 0x30", "ORG zero", ValueError),
+    ("ORG 0x30\nDB 0x01, 0x02, 0x03", "ORG 0xFF\n    MVI A 0x01", IndexError),
+]
+
+
+def results(assembler, source):
+    image = assembler.assemble_bytes(source)
+    return bytes(image), assembler.labels, list(assembler.source_map), assembler.listing()
+
+
+def test_matches_simple_assembler_across_edits():
+    incremental = IncrementalAssembler()
+    source = BASE
+    assert results(incremental, source) == results(SimpleAssembler(), source)
+    for old, new in EDITS:
+        source = edited(source, old, new)
+        assert results(incremental, source) == results(SimpleAssembler(), source), source
+
+
+@pytest.mark.parametrize("old, new, error", ERRORS)
+def test_reports_the_errors_of_simple_assembler(old, new, error):
+    incremental = IncrementalAssembler()
+    results(incremental, BASE)
+    source = edited(BASE, old, new)
+    with pytest.raises(error) as expected:
+        SimpleAssembler().assemble_bytes(source)
+    with pytest.raises(error, match=str(expected.value).replace("(", r"\(").replace(")", r"\)")):
+        incremental.assemble_bytes(source)
+    # The cache is still usable after the error
+    assert results(incremental, BASE) == results(SimpleAssembler(), BASE)
+
+
+def live_emulator(source):
+    watcher = Watcher("unused.asm")
+    writes = []
+    watcher.emulator._write_listeners.append(lambda start, end: writes.extend(range(start, end)))
+    watcher.patch(bytes(SimpleAssembler().assemble_bytes(source)))
+    writes.clear()
+    return watcher, writes
+
+
+def test_patch_writes_only_the_changed_bytes():
+    watcher, writes = live_emulator(BASE)
+    emulator = watcher.emulator
+    emulator.run_full(max_steps=10)
+    writes.clear()                          # the program's own STA
+    state = (emulator.ip, emulator.register_A, emulator.register_B, emulator.flags, emulator.steps)
+    before = bytes(emulator.memory)
+
+    image = bytes(SimpleAssembler().assemble_bytes(edited(BASE, "MVI B 0x05", "MVI B 0x07")))
+    changed = watcher.patch(image)
+    assert changed == [0x01] and writes == [0x01]
+    assert emulator.memory[0x01] == 0x07
+    assert bytes(emulator.memory[0x02:]) == before[0x02:]     # including the sum the program stored
+    assert (emulator.ip, emulator.register_A, emulator.register_B, emulator.flags, emulator.steps) == state
+
+
+def test_patch_updates_decoded_instructions_of_a_running_program():
+    watcher, writes = live_emulator(BASE)
+    emulator = watcher.emulator
+    emulator.run_full(max_steps=3)          # MVI B and the first round decoded
+    source = edited(BASE, "    ADD B", "    SUB B")
+    watcher.patch(bytes(SimpleAssembler().assemble_bytes(source)))
+    emulator.run_full()
+
+    reference = SimpleCPUEmulator(silent=True)
+    reference.read_into_memory(SimpleAssembler().assemble(BASE))
+    reference.run_full(max_steps=3)
+    reference.write_memory(0x04, 0x05)      # SUB B
+    reference.run_full()
+    assert emulator.to_bytes() == reference.to_bytes()
+
+
+def test_patch_clears_bytes_of_a_shrunk_program():
+    watcher, writes = live_emulator(BASE)
+    shorter = bytes(SimpleAssembler().assemble_bytes(edited(BASE, "DB 0x01, 0x02, 0x03\n", "")))
+    changed = watcher.patch(shorter)
+    assert changed == [0x30, 0x31, 0x32] and writes == changed
+    assert bytes(watcher.emulator.memory[0x30:0x33]) == bytes(3)
+
+
+def test_reload_and_poll(tmp_path):
+    path = tmp_path / "program.asm"
+    path.write_text(BASE)
+    watcher = Watcher(str(path))
+    assert len(watcher.reload()) == len(watcher.image)
+    assert watcher.emulator.symbols["LOOP"] == 0x02
+    assert watcher.poll() is None
+    path.write_text(edited(BASE, "MVI B 0x05", "MVI B 0x07"))
+    watcher._mtime = None       # the file system may not see a new modification time yet
+    assert watcher.poll() == [0x01]
@@ -0,0 +1,107 @@
+# time_travel.py
+#
+# Stepping backwards through a program run (used by the step-by-step mode).
+# History executes instructions on an emulator and keeps an undo log with one 8-byte
+# record per step: the IP, registers A, B, C and the status byte before the step, and the
+# old value of the one memory cell the instruction writes (if any). Memory use therefore
+# grows with the number of steps, not with steps x 256 bytes. Every KEYFRAME_INTERVAL steps
+# a full snapshot is kept as well, so going to an arbitrary step restores the nearest
+# keyframe and replays at most KEYFRAME_INTERVAL - 1 instructions.
+
+import struct
+
+# IP, A, B, C, status byte, 1 if a memory cell was written, its address, its old value
+UNDO_RECORD = struct.Struct("<8B")
+
+KEYFRAME_INTERVAL = 4096
+
+
+class History:
+    """
+    Records the steps executed on an emulator so they can be undone.
+    position is the current step; step 0 is the state when recording started. Steps that
+    were undone stay recorded (the machine is deterministic), so moving forward again only
+    replays them.
+    """
+
+    def __init__(self, emulator, keyframe_interval=KEYFRAME_INTERVAL):
+        self.emulator = emulator
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+
+    def reset(self):
+        """Forget all recorded steps; the current state becomes step 0."""
+        self.log = bytearray()
+        self.keyframes = []         # keyframes[i] is the snapshot of step i * keyframe_interval
+        self.keyframe_cycles = []   # and keyframe_cycles[i] the emulator's cycle count then
+        self.position = 0
+
+    @property
+    def recorded(self):
+        """Number of recorded steps."""
+        return len(self.log) // UNDO_RECORD.size
+
+    def step(self):
+        """Execute one instruction on the emulator, recording how to undo it if it is new."""
+        emulator = self.emulator
+        if self.position < self.recorded:
+            emulator.step()
+            self.position += 1
+            return
+        if self.position == len(self.keyframes) * self.keyframe_interval:
+            self.keyframes.append(emulator.snapshot())
+            self.keyframe_cycles.append(emulator.cycles)
+        write = emulator.memory_accesses()[1]
+        record = UNDO_RECORD.pack(
+            emulator.ip, emulator.register_A, emulator.register_B, emulator.register_C,
+            emulator.flags,
+            write is not None, write or 0, emulator.memory[write] if write is not None else 0,
+        )
+        emulator.step()
+        self.log += record
+        self.position += 1
+
+    def back(self, count=1):
+        """Undo the last count steps (at most back to step 0)."""
+        emulator = self.emulator
+        for _ in range(min(count, self.position)):
+            self.position -= 1
+            ip, a, b, c, flags, written, address, old_value = UNDO_RECORD.unpack_from(
+                self.log, self.position * UNDO_RECORD.size)
+            if written:
+                emulator.write_memory(address, old_value)
+            emulator.ip = ip
+            emulator.register_A, emulator.register_B, emulator.register_C = a, b, c
+            emulator.flags = flags
+            emulator.halted = False     # a recorded step was executed, so the machine ran
+            emulator.steps -= 1
+            emulator.cycles -= emulator._cycle_costs.get(emulator.memory[ip], 0)
+
+    def goto(self, target):
+        """
+        Move to step target. Recorded steps are reached from the nearest keyframe (or by
+        undoing a few steps); beyond them steps are executed and recorded until target or
+        until the program stops. No trace events are produced while moving.
+        """
+        emulator = self.emulator
+        interval = self.keyframe_interval
+        target = max(0, target)
+        if self.position - interval < target < self.position:
+            self.back(self.position - target)
+            return
+        if self.keyframes:
+            # The keyframe to replay from; a keyframe is only taken when its step is recorded
+            index = min(min(target, self.recorded) // interval, len(self.keyframes) - 1)
+            replay_from = index * interval
+            if not replay_from <= self.position <= target:
+                emulator.restore(self.keyframes[index])
+                emulator.steps += replay_from - self.position
+                emulator.cycles = self.keyframe_cycles[index]
+                self.position = replay_from
+
+        trace, emulator.trace = emulator.trace, None
+        try:
+            while self.position < target and not emulator.halted and 0 <= emulator.ip < len(emulator.memory):
+                self.step()
+        finally:
+            emulator.trace = trace
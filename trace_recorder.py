@@ -0,0 +1,130 @@
+# trace_recorder.py
+#
+# Compact binary execution traces for the SimpleCPUEmulator.
+# A TraceRecorder is a trace sink that stores every executed instruction as 7 packed bytes:
+# address, opcode, operand, registers A, B, C and the status byte, all taken *before* the
+# instruction executes. Records go into a preallocated buffer. Without a file the buffer
+# is a ring holding the most recent records; with a file, every full buffer is written out
+# as one chunk, so long runs can be captured with constant memory. TraceReader iterates a
+# trace file lazily, chunk by chunk.
+
+import struct
+from collections import namedtuple
+
+from simple_cpu_emulator import SimpleCPUEmulator
+
+# File header: magic and format version
+TRACE_MAGIC = b"SCPUTRC1"
+
+# address, opcode, operand (0 for one-byte instructions), A, B, C, status byte
+RECORD = struct.Struct("<7B")
+
+# One step of a trace. operand is None for one-byte instructions.
+TraceRecord = namedtuple("TraceRecord", [
+    "address", "opcode", "operand", "register_A", "register_B", "register_C", "flags",
+])
+
+
+def _unpack_records(buffer, lengths=SimpleCPUEmulator.opcode_lengths):
+    """Yield the TraceRecords packed in buffer."""
+    for address, opcode, operand, a, b, c, flags in RECORD.iter_unpack(buffer):
+        if lengths.get(opcode, 1) == 1:
+            operand = None
+        yield TraceRecord(address, opcode, operand, a, b, c, flags)
+
+
+class TraceRecorder:
+    """
+    Records the instructions an emulator executes (attach it, then run).
+    capacity: number of records held in memory
+    path:     optional trace file; full buffers are streamed to it in chunks
+    """
+
+    def __init__(self, capacity=65536, path=None):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.position = 0           # next record slot in the buffer
+        self.count = 0              # records taken in total
+        self.emulator = None
+        self._file = None
+        if path is not None:
+            self._file = open(path, "wb")
+            self._file.write(TRACE_MAGIC)
+
+    def attach(self, emulator):
+        """Record the instructions emulator executes from now on. Returns self."""
+        self.emulator = emulator
+        emulator.trace = self
+        return self
+
+    def __call__(self, event):
+        emulator = self.emulator
+        RECORD.pack_into(self.buffer, self.position * RECORD.size,
+                         event.address, event.opcode, event.operand or 0,
+                         emulator.register_A, emulator.register_B, emulator.register_C,
+                         emulator.flags)
+        self.count += 1
+        self.position += 1
+        if self.position == self.capacity:
+            if self._file is not None:
+                self._file.write(self.buffer)
+            self.position = 0       # without a file the oldest records are overwritten
+
+    def flush(self):
+        """Write the buffered records to the trace file (if any)."""
+        if self._file is not None and self.position:
+            self._file.write(memoryview(self.buffer)[:self.position * RECORD.size])
+            self.position = 0
+            self._file.flush()
+
+    def close(self):
+        """Flush and close the trace file and detach from the emulator."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.emulator is not None and self.emulator.trace is self:
+            self.emulator.trace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def records(self):
+        """The records still held in memory, oldest first."""
+        size = RECORD.size
+        if self._file is None and self.count >= self.capacity:
+            # A full (possibly wrapped) ring: the oldest record is at the current position
+            start = self.position * size
+            data = self.buffer[start:] + self.buffer[:start]
+        else:
+            data = self.buffer[:self.position * size]
+        return list(_unpack_records(data))
+
+
+class TraceReader:
+    """Iterates the records of a trace file without loading it into memory."""
+
+    def __init__(self, path, chunk_records=4096):
+        self.path = path
+        self.chunk_records = chunk_records
+        with open(path, "rb") as f:
+            if f.read(len(TRACE_MAGIC)) != TRACE_MAGIC:
+                raise ValueError(f"Not a trace file: {path!r}")
+            f.seek(0, 2)
+            self._length = (f.tell() - len(TRACE_MAGIC)) // RECORD.size
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        chunk_size = self.chunk_records * RECORD.size
+        with open(self.path, "rb") as f:
+            f.seek(len(TRACE_MAGIC))
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield from _unpack_records(chunk[:len(chunk) - len(chunk) % RECORD.size])
@@ -0,0 +1,48 @@
+# tracing.py
+#
+# Trace sinks for the SimpleCPUEmulator.
+# A trace sink receives one TraceEvent per executed instruction. The emulator only
+# builds these events while a sink is attached, so a silent run pays nothing for tracing.
+
+import logging
+from collections import namedtuple
+
+# address:  where the instruction was fetched from
+# opcode:   the opcode byte
+# mnemonic: the opcode name as registered in opcodes.py (e.g. "MVI A Byte")
+# operand:  the operand byte for two-byte instructions, None otherwise
+TraceEvent = namedtuple("TraceEvent", ["address", "opcode", "mnemonic", "operand"])
+
+
+def format_event(event):
+    """Return a one-line textual representation of a trace event."""
+    if event.operand is None:
+        return f"{event.address:02X}: {event.opcode:02X}     {event.mnemonic}"
+    return f"{event.address:02X}: {event.opcode:02X} {event.operand:02X}  {event.mnemonic}"
+
+
+def print_sink(event):
+    """The classic console output: one line per executed opcode."""
+    print(f"Executing opcode: {event.mnemonic}")
+
+
+def make_trace_sink(target):
+    """
+    Turn target into a callable taking a TraceEvent.
+    Accepts a callable, a logging.Logger (events are logged at DEBUG level)
+    or any writer with a write() method (e.g. an open file or io.StringIO).
+    """
+    if target is None:
+        return None
+    if isinstance(target, logging.Logger):
+        def logger_sink(event):
+            target.debug(format_event(event))
+        return logger_sink
+    if hasattr(target, "write"):
+        write = target.write
+        def writer_sink(event):
+            write(format_event(event) + "\n")
+        return writer_sink
+    if callable(target):
+        return target
+    raise TypeError(f"Unsupported trace sink: {target!r}")
@@ -0,0 +1,246 @@
+# watch.py
+#
+# Watch mode: reassemble an .asm file whenever it changes and hot-patch the result into a
+# live emulator.
+# IncrementalAssembler keeps the parsed and classified form of every source line it has
+# seen, keyed by the line's text, so after an edit only new or changed lines are parsed
+# again. Label addresses are recomputed on every assembly (a cheap pass over the cached
+# lines), so operands follow labels that moved. Watcher diffs the new memory image against
+# the previous one and writes only the changed bytes into the emulator through
+# write_memory, which keeps its predecoded instructions consistent.
+#
+# "Usage: python watch.py <asm_file.asm> [--interval SECONDS] [--max-steps N]"
+
+import argparse
+import os
+import time
+from array import array
+
+from main import read_asm_file
+from simple_assembler import SimpleAssembler
+from simple_cpu_emulator import SimpleCPUEmulator
+
+# Cache entry of a line that only the full assembler can handle (it raises the right error)
+_FALLBACK = object()
+
+
+class IncrementalAssembler(SimpleAssembler):
+    """
+    A SimpleAssembler that caches the parsed form of every source line between assemblies.
+    The results (image, labels, source map, listing) are identical to SimpleAssembler's;
+    sources with errors are handed to SimpleAssembler so it reports them.
+    """
+
+    def __init__(self, optimize=False):
+        super().__init__(optimize)
+        self._line_cache = {}       # raw line -> parsed entry (see _parse_line)
+
+    def _parse_line(self, raw):
+        """
+        The cached form of one line: None for empty lines, _FALLBACK for lines with errors,
+        else (code, comment, type, details, length) where details hold the values to emit:
+        "org" the address, "db"/"data" the list of bytes, "label" the name and "instr"
+        (opcode, has an operand, label the operand may name or None, its value or None).
+        """
+        code, sep, comment = raw.partition(';')
+        code = code.strip()
+        comment = comment.strip() if sep else ""
+        if not code:
+            return None
+        try:
+            t, details = self._classify(code, raw)
+            if t == "db":
+                details = [int(val_str, 0) for val_str in details]
+            elif t == "data":
+                details = [int(code, 0)]
+            elif t == "instr":
+                inst, operand_text = details
+                opcode, length, mode = self.OPCODES[inst]
+                value = None
+                if length == 2:
+                    if not operand_text:
+                        return _FALLBACK
+                    try:
+                        value = int(operand_text, 0)
+                    except ValueError:
+                        if mode == "imm":
+                            return _FALLBACK
+                details = (opcode, length == 2, operand_text if mode == "addr" else None, value)
+                return code, comment, t, details, length
+        except ValueError:
+            return _FALLBACK
+        if t in ("db", "data") and not all(0 <= val <= 0xFF for val in details):
+            return _FALLBACK
+        return code, comment, t, details, len(details) if t == "data" else 0
+
+    def assemble_bytes(self, source):
+        if self.optimize:       # the peephole optimizer works on the whole program
+            return super().assemble_bytes(source)
+        lines = source.splitlines() if isinstance(source, str) else source
+        cache = self._line_cache
+        parse_line = self._parse_line
+
+        # First pass over the cached lines: label addresses and the image size
+        entries = []
+        labels = {}
+        addr = 0
+        max_addr = 0
+        current_org_addr = 0
+        for number, raw in enumerate(lines, 1):
+            entry = cache.get(raw)
+            if entry is None:
+                if raw in cache:
+                    continue
+                entry = cache[raw] = parse_line(raw)
+                if entry is None:
+                    continue
+            if entry is _FALLBACK:
+                return super().assemble_bytes(source)
+            entries.append((number, entry))
+            t, details, length = entry[2], entry[3], entry[4]
+            if t == "org":
+                current_org_addr = details
+                max_addr = max(max_addr, details)
+            elif t == "db":
+                max_addr = max(max_addr, current_org_addr + len(details) - 1)
+            elif t == "label":
+                labels[details] = addr
+            else:
+                addr += length
+                max_addr = max(max_addr, addr - 1)
+
+        # Second pass: emit the cached values, resolving label operands
+        image = bytearray(max_addr + 1)
+        source_map = array("I", [0]) * (max_addr + 1)
+        emitted = []
+        emit = emitted.append
+        addr = 0
+        pending_label_comment = None
+        try:
+            for number, (code, comment, t, details, length) in entries:
+                if t == "org":
+                    addr = details
+                    continue
+                if t == "label":
+                    pending_label_comment = comment or None
+                    continue
+                if t == "instr":
+                    opcode, has_operand, label, value = details
+                    image[addr] = opcode
+                    source_map[addr] = number
+                    emit((addr, opcode, comment))
+                    addr += 1
+                    if has_operand:
+                        if label is not None:
+                            value = labels.get(label, value)
+                        if value is None or not 0 <= value <= 0xFF:
+                            return super().assemble_bytes(source)
+                        image[addr] = value
+                        source_map[addr] = number
+                        emit((addr, value, None))
+                        addr += 1
+                else:
+                    if t == "data":
+                        comment = comment or pending_label_comment
+                    for val in details:
+                        image[addr] = val
+                        source_map[addr] = number
+                        emit((addr, val, comment))
+                        addr += 1
+                    if t == "db":
+                        continue
+                pending_label_comment = None
+        except IndexError:
+            return super().assemble_bytes(source)
+
+        # Forget lines that were edited away once they outnumber the current ones
+        if len(cache) > 2 * len(lines) + 64:
+            self._line_cache = {raw: cache[raw] for raw in lines if raw in cache}
+
+        self.labels = labels
+        self.source_map = source_map
+        self._emitted = emitted
+        self._image = bytes(image)
+        return image
+
+
+class Watcher:
+    """
+    Keeps an emulator loaded with the current version of an .asm file.
+    emulator: the live emulator to patch (default: a new silent one)
+    """
+
+    def __init__(self, path, emulator=None):
+        self.path = path
+        self.emulator = emulator or SimpleCPUEmulator(silent=True)
+        self.assembler = IncrementalAssembler()
+        self.image = b""
+        self._mtime = None
+
+    def reload(self):
+        """
+        Reassemble the file and patch the emulator's memory. Returns the list of patched
+        addresses. On an assembly error the emulator keeps the previous program.
+        """
+        self._mtime = os.stat(self.path).st_mtime_ns
+        image = bytes(self.assembler.assemble_bytes(read_asm_file(self.path)))
+        if len(image) > len(self.emulator.memory):
+            raise ValueError(f"Program (size {len(image)}) exceeds memory bounds at 00.")
+        changed = self.patch(image)
+        self.emulator.symbols = self.assembler.labels
+        return changed
+
+    def patch(self, image):
+        """Write the bytes of image that differ from the previous image into the emulator."""
+        old = self.image
+        # Bytes the previous program occupied beyond the new one go back to zero
+        new = image + bytes(max(len(old) - len(image), 0))
+        changed = [address for address, (before, after) in enumerate(zip(old, new)) if before != after]
+        changed += range(len(old), len(new))
+        write_memory = self.emulator.write_memory
+        for address in changed:
+            write_memory(address, new[address])
+        self.image = image
+        return changed
+
+    def poll(self):
+        """Reload if the file was modified since the last reload; returns the patched addresses or None."""
+        if os.stat(self.path).st_mtime_ns == self._mtime:
+            return None
+        return self.reload()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reassemble and rerun an .asm program whenever it changes.")
+    parser.add_argument("asm_file")
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between checks for changes")
+    parser.add_argument("--max-steps", type=int, default=1_000_000, help="step budget of every run")
+    args = parser.parse_args()
+
+    watcher = Watcher(args.asm_file)
+    print(f"Watching {args.asm_file} (Ctrl+C to stop)")
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                changed = watcher.poll()
+            except (ValueError, IndexError) as error:
+                print(f"Assembly error: {error}")
+                changed = None
+            except FileNotFoundError:
+                changed = None
+            if changed is not None:
+                patched = time.perf_counter()
+                # Run a copy, so the live emulator keeps the freshly loaded state
+                emulator = watcher.emulator.fork()
+                outcome = emulator.run_full(max_steps=args.max_steps)
+                done = time.perf_counter()
+                print(f"Patched {len(changed)} bytes in {(patched - start) * 1000:.1f} ms, "
+                      f"run: {outcome.status} after {outcome.steps} steps ({(done - patched) * 1000:.1f} ms)")
+                emulator.display_current_state()
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()